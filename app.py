@@ -6,7 +6,10 @@ import asyncio
 import logging
 from pathlib import Path
 from chat_service import ChatService
-from tools.wrapper import run_script
+from tools.wrapper import warm_up
+from tools.scheduler import start_scheduler
+from utils.config_loader import get_config
+from utils.job_queue import FINISHED, open_job_queue
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,6 +20,11 @@ chat_service = ChatService()
 
 @cl.on_chat_start
 async def start():
+    # Warm script workers, so the first "generate" does not pay for the imports
+    await cl.make_async(warm_up)()
+    # Run queued generation jobs in this process too (jobs.embedded)
+    await cl.make_async(start_scheduler)()
+
     # --- הזרקת CSS לעברית (RTL) ---
     await cl.html("""
     <style>
@@ -84,61 +92,89 @@ async def main(message: cl.Message):
 
 async def run_generation_flow(shot_id: str, msg_element: cl.Message):
     """
-    Manages the generation flow: Run Script -> Wait -> Display Image
+    Manages the generation flow: Queue the job -> Follow its progress -> Display each image as soon as it exists
     """
-    msg_element.content = f"🎨 Starting generation for **{shot_id}**... (Sending to Flux)"
+    queue = open_job_queue()
+    priority = int(get_config("jobs.priority.interactive", 10))
+    job_id, new = await cl.make_async(queue.enqueue)("03_img_gen.py", [shot_id], priority=priority)
+    msg_element.content = f"🎨 Starting generation for **{shot_id}**... (job #{job_id}{'' if new else ', already queued'})"
     await msg_element.update()
 
     async with cl.Step(name="Flux Generator") as step:
-        step.input = f"Target: {shot_id}"
-        
-        # Run script via wrapper (wrapper uses subprocess, which is blocking, so run_script is synchronous)
-        # We wrap it in make_async to not block the event loop
-        result = await cl.make_async(run_script)("03_img_gen.py", args=[shot_id])
-        
-        if result["success"]:
-            output_log = result["output"]
-            
-            # Parse log for image path
-            # Looking for "production/images/SHOT_001.jpg"
-            match = re.search(r'(production[\\/].+\.jpg)', output_log)
-            
-            if match:
-                # Normalize path using pathlib
-                raw_path = match.group(1).replace("\\", "/") # Initial cleanup
-                # We need to ensure it matches the actual OS file system
-                # wrapper ensures CWD is root.
-                
-                # Convert to Path object for verification using make_async to avoid blocking
-                # though os.path.exists is fast, best practice in async heavy apps
-                img_rel_path = raw_path
-                img_abs_path = Path(os.getcwd()) / img_rel_path
-                
-                # Check existence asynchronously
-                loop = asyncio.get_running_loop()
-                file_exists = await loop.run_in_executor(None, img_abs_path.exists)
-                
-                if file_exists:
-                    # --- Display Image ---
-                    # Chainlit expects a path string
-                    image = cl.Image(path=str(img_abs_path), name=shot_id, display="inline")
-                    
-                    await cl.Message(
-                        content=f"✅ **{shot_id}** is ready!",
-                        elements=[image]
-                    ).send()
-                    
-                    step.output = "Success. Image displayed."
-                else:
-                    step.output = f"File created but not found at: {img_abs_path}"
-                    logger.error(f"Image not found at {img_abs_path}")
-            else:
-                step.output = "Script ran successfully but no image path found in output."
-                await cl.Message(content=f"```\n{output_log}\n```").send()
-        else:
-            step.output = f"Execution Error: {result.get('error', 'Unknown error')}"
-            await cl.Message(content=f"❌ Error:\n```\n{result['output']}\n```").send()
+        step.input = f"Target: {shot_id} (job #{job_id})"
+        shown = set()
+
+        # The scheduler (tools/scheduler.py) keeps each shot's latest progress event on the job
+        while True:
+            job = await cl.make_async(queue.get)(job_id)
+            shots = job["progress"] or {}
+            for sid, event in shots.items():
+                # --- Display Image (the shot's result record, utils/progress.result) ---
+                if event["event"] == "shot_result" and event["status"] == "IMAGE_READY" and sid not in shown:
+                    await show_image(sid, event["path"])
+                    shown.add(sid)
+            output = "\n".join(f"{s}: {describe_event(e)}" for s, e in shots.items()) or describe_job(job)
+            if output != step.output:
+                step.output = output
+                await step.update()
+            if job["status"] in FINISHED:
+                break
+            await asyncio.sleep(1)
+
+        result = job["result"] or {}
+        records = result.get("shots", [])
+        failed = [r for r in records if r["status"] != "IMAGE_READY"]
+        if job["status"] == "cancelled":
+            step.output = f"Job #{job_id} was cancelled."
+        elif job["status"] == "dead":
+            step.output = f"Job #{job_id} failed after {job['attempts']} attempts: {job['error']}"
+            details = f"\n```\n{result['log_tail']}\n```" if result.get("log_tail") else ""
+            await cl.Message(content=f"❌ Error: {job['error']}{details}").send()
+        elif failed:
+            step.output = f"{len(records) - len(failed)}/{len(records)} images ready."
+            lines = "\n".join(f"- **{r['shot_id']}**: {r['status']} - {r.get('error')}" for r in failed)
+            await cl.Message(content=f"❌ Not generated:\n{lines}").send()
+        elif not records:
+            step.output = "Script ran successfully but no image was produced."
+            await cl.Message(content=f"```\n{result.get('log_tail', '')}\n```").send()
 
     # Reset/Finalize "Thinking" message
     msg_element.content = "Process finished."
     await msg_element.update()
+
+async def show_image(sid: str, path: str):
+    img_abs_path = Path(os.getcwd()) / path.replace("\\", "/")
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(None, img_abs_path.exists):
+        # Chainlit expects a path string
+        image = cl.Image(path=str(img_abs_path), name=sid, display="inline")
+        await cl.Message(content=f"✅ **{sid}** is ready!", elements=[image]).send()
+    else:
+        logger.error(f"Image not found at {img_abs_path}")
+
+def describe_event(event: dict) -> str:
+    """
+    One progress line per shot for the step view.
+    """
+    name = event["event"]
+    if name == "queued":
+        return f"⏳ In queue (position {event.get('position')})"
+    if name == "failed":
+        return f"❌ Failed - {event.get('error')}"
+    if name in ("downloaded", "cached"):
+        return f"✅ {'From cache' if name == 'cached' else 'Ready'} -> {event.get('path')}"
+    if name == "shot_result":
+        if event.get("error"):
+            return f"❌ {event['status']} - {event['error']}"
+        return f"✅ {event['status']} -> {event.get('path')}"
+    return {"shot_started": "🚀 Started", "submitted": "🎨 Sent to Flux", "in_progress": "🖌️ Rendering"}.get(name, name)
+
+def describe_job(job: dict) -> str:
+    """
+    The step line before the job's script reports any shot.
+    """
+    if job["status"] == "pending" and job["attempts"]:
+        return f"🔁 Retrying after attempt {job['attempts']}/{job['max_attempts']} failed: {job['error']}"
+    if job["status"] == "pending":
+        return "⏳ Waiting for the scheduler"
+    return {"running": "🚀 Started"}.get(job["status"], job["status"])
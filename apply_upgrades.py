@@ -4,11 +4,15 @@ import os
 
 # 1. המחולל (עם תמיכה בזהות)
 IMG_GEN_CONTENT = """import os
+import sys
 import json
 import yaml
 import fal_client
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.upload_cache import cached_upload
+
 load_dotenv()
 
 # טעינת הגדרות
@@ -42,7 +46,7 @@ def generate_image(shot_id):
     ref_path = assets.get("face_reference_path")
     if ref_path and os.path.exists(ref_path):
         print(f"🔒 Locking Identity using: {ref_path}")
-        ref_url = fal_client.upload_file(ref_path)
+        ref_url = cached_upload(ref_path, config)  # אותה תמונה מועלית פעם אחת, לא בכל שוט
         args["image_prompts"] = [
             {"image_url": ref_url, "type": "image_prompt", "weight": 0.85}
         ]
@@ -156,12 +160,16 @@ if __name__ == "__main__":
 
 # 3. המתקן (היברידי - טקסט או מסיכה)
 REPAIR_CONTENT = """import os
+import sys
 import json
 import yaml
 import fal_client
 import requests
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.upload_cache import cached_upload
+
 load_dotenv()
 
 with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
@@ -183,7 +191,7 @@ def repair_shot(shot_id):
     choice = input("Choice (1/2): ").strip()
     
     mask_url = None
-    img_url = fal_client.upload_file(current_img)
+    img_url = cached_upload(current_img, config)
     
     prompt = input("Enter Inpaint Prompt (What should be there?): ")
 
@@ -208,7 +216,7 @@ def repair_shot(shot_id):
         # --- אופציה 2: מסיכה ידנית ---
         mask_path = input("Enter path to mask file (PNG): ").strip()
         if os.path.exists(mask_path):
-            mask_url = fal_client.upload_file(mask_path)
+            mask_url = cached_upload(mask_path, config)
         else:
             print("❌ Mask file not found.")
             return
@@ -4,11 +4,15 @@ import time
 import logging
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from google import genai
 from google.genai import types
-from tools.wrapper import run_script
 from tools.system_prompts import SYSTEM_INSTRUCTION
 from utils.config_loader import get_config
+from utils.shot_store import open_shot_store
+from utils.dep_index import open_dep_index
+from utils.job_queue import open_job_queue
+from utils.gemini_client import get_gemini_client, usage_tokens
+from utils.rate_limiter import estimate_tokens, open_rate_limiter
+from utils.gemini_cache import GeminiContextCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,7 +25,7 @@ class ChatService:
             logger.error("GEMINI_API_KEY not found in environment variables.")
             raise ValueError("GEMINI_API_KEY not found")
             
-        self.client = genai.Client(api_key=self.api_key)
+        self.client = get_gemini_client(self.api_key)
         self.chat_id = None
         self.cached_content_name = None
         
@@ -73,25 +77,21 @@ class ChatService:
         
         project_context = self._get_project_context()
         
-        try:
-            cache = self.client.caches.create(
-                model=self.model_name,
-                config=types.CreateCachedContentConfig(
-                    display_name="movie_production_context",
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    contents=[project_context],
-                    ttl=f"{self.cache_ttl}m",
-                )
-            )
-            self.cached_content_name = cache.name
-            logger.info(f"✅ Cache created: {cache.name}")
-        except Exception as e:
-            logger.warning(f"⚠️ Cache creation failed (falling back to normal context): {e}")
-            self.cached_content_name = None
+        # Reuses a live cache with the same content (e.g. after an app restart) instead of creating a duplicate
+        self.context_cache = GeminiContextCache(
+            self.model_name, "movie_production_context", SYSTEM_INSTRUCTION,
+            contents=[project_context], ttl_minutes=self.cache_ttl, keep=True, client=self.client,
+        )
+        self.cached_content_name = self.context_cache.acquire()
+        if self.cached_content_name:
+            verb = "reused" if self.context_cache.reused else "created"
+            logger.info(f"✅ Cache {verb}: {self.cached_content_name}")
+        else:
+            logger.warning("⚠️ Cache creation failed (falling back to normal context)")
 
     def _init_model(self):
         # Tools Definition
-        self.tools = [self.tool_run_img_gen, self.tool_check_status]
+        self.tools = [self.tool_run_img_gen, self.tool_job_status, self.tool_check_status, self.tool_find_shots]
         
         if not self.cached_content_name:
             self._create_cache()
@@ -101,43 +101,90 @@ class ChatService:
     # --- TOOLS IMPLEMENTATION ---
     def tool_run_img_gen(self, shot_range: str = ""):
         """
-        Runs the Flux Image Generation script.
+        Queues the Flux Image Generation script and returns its job ID right away.
         Args:
             shot_range: The range of shots to generate (e.g., "1-5" or "SHOT_003"). Leave empty for ALL.
         """
         logger.info(f"🛠️ Tool Triggered: run_image_generation({shot_range})")
-        args = [shot_range] if shot_range and shot_range.lower() != "all" else []
+        # an explicit "all": a queued job has no one to answer 03's range prompt
+        args = [(shot_range or "").strip() or "all"]
         
-        # run_script should be robust enough, but let's wrap it just in case
+        # the scheduler (tools/scheduler.py) runs it; the same request already in the queue is not run twice
         try:
-            result = run_script("03_img_gen.py", args=args, timeout=600)
-            return result["output"]
+            job_id, new = open_job_queue().enqueue("03_img_gen.py", args, priority=int(get_config("jobs.priority.chat", 5)))
+            return str({"job_id": job_id, "status": "queued" if new else "already queued", "check": "job_status(job_id)"})
         except Exception as e:
-            logger.error(f"Error running image generation tool: {e}")
+            logger.error(f"Error queueing image generation: {e}")
             return f"Error: {str(e)}"
 
+    def tool_job_status(self, job_id: int = 0):
+        """
+        Checks a queued generation job.
+        Args:
+            job_id: The ID returned by run_image_generation. 0 lists the latest jobs.
+        """
+        logger.info(f"🛠️ Tool Triggered: job_status({job_id})")
+        try:
+            queue = open_job_queue()
+            if not job_id:
+                latest = [{"job_id": j["id"], "args": j["args"], "status": j["status"]} for j in queue.jobs(limit=5)]
+                return str({"counts": queue.counts(), "latest": latest})
+            job = queue.get(int(job_id))
+            if job is None:
+                return f"No job {job_id}"
+            status = {"job_id": job["id"], "script": job["script"], "args": job["args"], "status": job["status"],
+                      "attempts": f"{job['attempts']}/{job['max_attempts']}"}
+            if job["error"]:
+                status["error"] = job["error"]
+            if job["result"]:
+                status["result"] = job["result"]  # per-shot outcomes (tools/wrapper.compact_result)
+            elif job["progress"]:
+                status["progress"] = {sid: e["event"] for sid, e in job["progress"].items()}
+            return str(status)
+        except Exception as e:
+            logger.error(f"Error reading job status: {e}")
+            return f"Error reading job status: {e}"
+
     def tool_check_status(self):
         """
         Checks the status of the production.
         """
         logger.info(f"🛠️ Tool Triggered: check_status")
         try:
-            import json
-            shots_board_path = Path("shots_board.json")
-            if not shots_board_path.exists():
-                return "shots_board.json not found."
-                
-            with open(shots_board_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                stats = {"TOTAL": len(data), "APPROVED": 0, "PENDING": 0, "IMAGE_READY": 0}
-                for k, v in data.items():
-                    s = v.get("stills", {}).get("status", "UNKNOWN")
-                    stats[s] = stats.get(s, 0) + 1
-                return str(stats)
+            counts = open_shot_store().status_counts("stills")
+            stats = {"TOTAL": sum(counts.values()), "APPROVED": 0, "PENDING": 0, "IMAGE_READY": 0}
+            stats.update(counts)
+            return str(stats)
         except Exception as e:
             logger.error(f"Error reading status: {e}")
             return f"Error reading status: {e}"
 
+    def tool_find_shots(self, ref: str = "", status: str = "", stage: str = "stills"):
+        """
+        Finds shots through the dependency index.
+        Args:
+            ref: An asset ID (e.g. "MIRI_DIRTY_MUD") or a scene ID - returns the shots that depend on it.
+            status: A status (e.g. "IMAGE_READY") - returns the shots in that status (combined with ref if both are given).
+            stage: "stills" or "video", the stage the status refers to.
+        """
+        logger.info(f"🛠️ Tool Triggered: find_shots(ref={ref}, status={status}, stage={stage})")
+        try:
+            index = open_dep_index()
+            result = {}
+            shots = None
+            if ref:
+                affected = index.affected_shots(ref)
+                result["scenes"] = affected["scenes"]
+                shots = affected["shots"]
+            if status:
+                with_status = index.shots_with_status(status, stage)
+                shots = with_status if shots is None else [s for s in shots if s in set(with_status)]
+            result["shots"] = shots or []
+            return str(result)
+        except Exception as e:
+            logger.error(f"Error querying the dependency index: {e}")
+            return f"Error finding shots: {e}"
+
     def _lazy_init_chat(self):
         if hasattr(self, "chat_session") and self.chat_session:
             return
@@ -170,7 +217,10 @@ class ChatService:
         """
         try:
             self._lazy_init_chat()
+            # same RPM / TPM quota as the pipeline scripts running next to the app
+            reservation = open_rate_limiter().acquire("gemini", self.model_name, estimate_tokens(user_input))
             response = self.chat_session.send_message(user_input)
+            reservation.settle(usage_tokens(response))
             return response.text
         except Exception as e:
             logger.error(f"Error sending message to Gemini: {e}")
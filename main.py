@@ -2,10 +2,17 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 import os
+import json
+import asyncio
 from chat_service import ChatService
+from tools.wrapper import warm_up
+from tools.scheduler import start_scheduler
+from utils.concurrency import concurrency_metrics
+from utils.config_loader import get_config
+from utils.job_queue import FINISHED, open_job_queue
 
 app = FastAPI()
 
@@ -22,6 +29,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_script_pool():
+    warm_up()
+    start_scheduler()
+
 class ChatRequest(BaseModel):
     message: str
 
@@ -67,6 +79,56 @@ async def refresh_context():
     chat_service.chat_session = None # Force recreation
     return {"status": "Cache refreshing..."}
 
+def sse(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/api/generate/{shot_range}/stream")
+async def generate_stream(shot_range: str):
+    """
+    Queues 03_img_gen for the shots (joining the identical job if one is already pending or
+    running) and streams the job's progress as Server-Sent Events, as the scheduler records it:
+    `event: job` with the job's status (again on each retry),
+    `event: <shot_started|submitted|queued|in_progress|downloaded|cached|failed|shot_result>`
+    with each shot's latest event, and a final `event: result` with the job's outcome
+    (a count per status and each shot's result). Images are served by /api/files/{path}.
+    If the client disconnects, a job this request created is cancelled (the scheduler stops its run);
+    a job it only joined keeps running for whoever queued it.
+    """
+    queue = open_job_queue()
+    priority = int(get_config("jobs.priority.interactive", 10))
+    job_id, new = await asyncio.to_thread(queue.enqueue, "03_img_gen.py", [shot_range], priority)
+
+    async def events():
+        sent, state, finished = {}, None, False
+        try:
+            while True:
+                job = await asyncio.to_thread(queue.get, job_id)
+                for shot_id, event in (job["progress"] or {}).items():
+                    if sent.get(shot_id) != event:
+                        sent[shot_id] = event
+                        yield sse(event["event"], {"type": "event", **event})
+                if (job["status"], job["attempts"]) != state:
+                    state = (job["status"], job["attempts"])
+                    yield sse("job", {"type": "job", "job_id": job_id, "new": new, "status": job["status"],
+                                      "attempts": job["attempts"], "error": job["error"]})
+                if job["status"] in FINISHED:
+                    finished = True
+                    yield sse("result", {"type": "result", "job_id": job_id, "status": job["status"],
+                                         "error": job["error"], **(job["result"] or {})})
+                    return
+                await asyncio.sleep(1)
+        finally:
+            if new and not finished:
+                # the client left: stop the run this request started instead of keeping a worker busy
+                queue.cancel(job_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/metrics")
+async def metrics():
+    """Current adaptive concurrency limits of every running pipeline process."""
+    return {"concurrency": concurrency_metrics()}
+
 if __name__ == "__main__":
     import uvicorn
     # 0.0.0.0 for Cloud Run / Docker
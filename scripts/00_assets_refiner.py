@@ -1,27 +1,32 @@
 import yaml
 import os
-from claude_client import client, MODEL_NAME
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from claude_client import MODEL_NAME, get_claude_response, usage_summary
 
-ASSETS_FILE = "assets/assets.yaml"
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.file_lock import FileLock
+from utils.concurrency import adaptive_limiter, concurrency_summary
 
-def refine_assets():
-    if not os.path.exists(ASSETS_FILE):
-        print("❌ assets.yaml not found! Please create it first.")
-        return
+# --- ליטוש הנכסים (מקור האמת של התיאורים) ---
+# כל פריט נשלח לקלוד במקביל (הגבול האדפטיבי של המודל, concurrency.anthropic), דרך get_claude_response - retry + response cache.
+# כל פריט שמלוטש נשמר מיד ל-assets.yaml (נעילה + כתיבה אטומית) עם is_optimized: קריסה באמצע לא מאבדת את מה שכבר נעשה,
+# וריצה חוזרת ממשיכה רק עם מה שנשאר.
+#
+#   python scripts/00_assets_refiner.py                          # כל הקטגוריות ב-assets.yaml
+#   python scripts/00_assets_refiner.py --categories wardrobe     # רק קטגוריה אחת
 
-    with open(ASSETS_FILE, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
-
-    print("🎨 Starting Asset Refinement (Polishing the source of truth)...")
+with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
+ASSETS_FILE = config["paths"].get("assets", "assets/assets.yaml")
 
-    # פונקציית עזר לשליחה לקלוד
-    def get_optimized_description(category, item_id, current_desc):
-        prompt = f"""
+def build_system_prompt(category, current_desc):
+    return f"""
         You are an expert Visual Costume & Set Designer for 1850s period films.
         Your task: Rewrite the description below to be a PERFECT image generation prompt for Flux.1.
-        
+
         INPUT ({category}): "{current_desc}"
-        
+
         RULES:
         1. Keep it visual and factual (materials, textures, colors, lighting interaction).
         2. Period accurate (19th century shtetl/village aesthetic).
@@ -29,45 +34,91 @@ def refine_assets():
         4. Max 40 words.
         5. Output ONLY the new description.
         """
-        
-        try:
-            print(f"   ✨ Polishing {item_id}...")
-            response = client.messages.create(
-                model=MODEL_NAME,
-                max_tokens=100,
-                system=prompt,
-                messages=[{"role": "user", "content": "Refine this description."}]
-            )
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"   ❌ Error on {item_id}: {e}")
-            return current_desc
-
-    # מעבר על כל התלבושות
-    if "wardrobe" in data:
-        print("\n👗 Refining Wardrobe...")
-        for w_id, w_data in data["wardrobe"].items():
-            # בודק אם כבר יש דגל 'optimized', אם לא - משפר
-            if not w_data.get("is_optimized"):
-                new_desc = get_optimized_description("Wardrobe", w_id, w_data["description"])
-                data["wardrobe"][w_id]["description"] = new_desc
-                data["wardrobe"][w_id]["is_optimized"] = True # מסמן שזה טופל
-
-    # מעבר על כל הלוקיישנים
-    if "locations" in data:
-        print("\n🏰 Refining Locations...")
-        for l_id, l_data in data["locations"].items():
-            if not l_data.get("is_optimized"):
-                new_desc = get_optimized_description("Location", l_id, l_data["description"])
-                data["locations"][l_id]["description"] = new_desc
-                data["locations"][l_id]["is_optimized"] = True
-
-    # שמירה חזרה לקובץ
-    with open(ASSETS_FILE, 'w', encoding='utf-8') as f:
-        yaml.dump(data, f, allow_unicode=True, sort_keys=False)
-    
-    print("\n✅ Assets optimized and saved to assets.yaml!")
+
+def load_assets():
+    with open(ASSETS_FILE, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+def pending_items(data, categories=None):
+    """
+    (קטגוריה, מזהה, תיאור) לכל פריט שעוד לא לוטש - בכל קטגוריה של נכסים בקובץ (פריטים עם description).
+    """
+    items = []
+    for category, entries in data.items():
+        if categories and category not in categories: continue
+        if not isinstance(entries, dict): continue
+        for item_id, item in entries.items():
+            if isinstance(item, dict) and item.get("description") and not item.get("is_optimized"):
+                items.append((category, item_id, item["description"]))
+    return items
+
+def get_optimized_description(category, item_id, current_desc):
+    print(f"   ✨ Polishing {category}/{item_id}...")
+    return get_claude_response(
+        build_system_prompt(category.replace("_", " ").title(), current_desc),
+        "Refine this description.",
+        cache=True, max_tokens=100, label=item_id,
+    ).strip()
+
+def commit_item(category, item_id, old_desc, new_desc):
+    """
+    שומר פריט אחד: קורא מחדש את הקובץ תחת נעילה (ייתכן שפריטים אחרים נשמרו בינתיים) וכותב אטומית.
+    לא דורס תיאור שנערך ידנית בזמן הליטוש.
+    """
+    with FileLock(f"{ASSETS_FILE}.lock"):
+        data = load_assets()
+        item = (data.get(category) or {}).get(item_id)
+        if not item or item.get("description") != old_desc:
+            print(f"   ⚠️ {category}/{item_id} was edited meanwhile - not overwritten.")
+            return False
+        item["description"] = new_desc
+        item["is_optimized"] = True  # מסמן שזה טופל
+        tmp_path = f"{ASSETS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            yaml.dump(data, f, allow_unicode=True, sort_keys=False)
+        os.replace(tmp_path, ASSETS_FILE)
+    return True
+
+def refine_item(category, item_id, current_desc):
+    try:
+        new_desc = get_optimized_description(category, item_id, current_desc)
+    except Exception as e:
+        # נשאר בלי is_optimized - ריצה חוזרת תנסה שוב
+        print(f"   ❌ Error on {category}/{item_id}: {e}")
+        return False
+    return commit_item(category, item_id, current_desc, new_desc)
+
+def refine_assets(categories=None):
+    if not os.path.exists(ASSETS_FILE):
+        print("❌ assets.yaml not found! Please create it first.")
+        return
+
+    items = pending_items(load_assets(), categories)
+    if not items:
+        print("✅ All assets are already optimized.")
+        return
+
+    workers = adaptive_limiter("anthropic", MODEL_NAME).max_limit
+    print(f"🎨 Starting Asset Refinement of {len(items)} items, up to {workers} in parallel (Polishing the source of truth)...")
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(refine_item, *item) for item in items]
+        for future in as_completed(futures):
+            done += future.result()
+
+    print(f"\n✅ {done}/{len(items)} assets optimized and saved to {ASSETS_FILE}!")
+    if done < len(items):
+        print("   ⚠️ Run again to retry the rest (finished items are skipped).")
     print("   Now Claude will use EXACTLY these descriptions for every shot.")
+    print(f"🧮 Claude tokens: {usage_summary()}")
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Polish the asset descriptions in assets.yaml")
+    parser.add_argument("--categories", nargs="+", help="asset categories (default: all of them)")
+    args = parser.parse_args()
+    refine_assets(args.categories)
 
 if __name__ == "__main__":
-    refine_assets()
\ No newline at end of file
+    main()
@@ -1,9 +1,18 @@
 import json
 import os
+import sys
 import yaml
 import time
-from concurrent.futures import ThreadPoolExecutor
-from claude_client import get_claude_response
+from typing import List
+from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from claude_client import MODEL_NAME, get_claude_response, get_claude_responses_batch, response_cache_summary, usage_summary
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+from utils.concurrency import adaptive_limiter, concurrency_summary
+from utils.fingerprints import brief_inputs, fingerprint, resolve_assets, text_version
+from utils import progress
 
 # --- הגדרות נתיבים ---
 CONFIG_PATH = "config.yaml"
@@ -12,20 +21,19 @@ def load_config():
     with open(CONFIG_PATH, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def generate_prompt_for_shot(shot_id, shot_data, scene_data, assets):
+def build_shot_request(shot_data, scene_data, assets):
     """
     בונה את הבקשה לקלוד עבור שוט ספציפי - עם לוגיקת 'Start Frame'
+    (משותף למצב הרגיל ולמצב ה-batch)
     """
     # 1. איסוף המידע
     visual_brief = shot_data['brief']['visual']
     motion_brief = shot_data['brief']['motion']
     
-    # שליפת תיאורי נכסים
-    loc_id = scene_data.get('location_id')
-    ward_id = scene_data.get('wardrobe_id')
-    
-    loc_desc = assets['locations'].get(loc_id, {}).get('description', loc_id)
-    ward_desc = assets['wardrobe'].get(ward_id, {}).get('description', ward_id)
+    # שליפת תיאורי נכסים (אותה פונקציה כמו ב-utils/dep_index ו-build plan)
+    resolved = resolve_assets(scene_data, assets)
+    loc_desc = resolved['location']
+    ward_desc = resolved['wardrobe']
     
     moods = ", ".join(scene_data.get('mood_keywords', []))
     constraints = shot_data.get('constraints', {})
@@ -52,77 +60,229 @@ def generate_prompt_for_shot(shot_id, shot_data, scene_data, assets):
     5. CAMERA: Respect the constraints (Close Up, Wide Shot, Low Angle).
     """
 
-    user_message = f"""
-    --- DIRECTOR'S BRIEF ---
-    VISUAL ACTION (The Subject): {visual_brief}
-    REQUIRED MOTION (What will happen next): {motion_brief}
-    
+    # 3. הקשר הסצנה (נכסים) - זהה לכל השוטים של הסצנה, ולכן נשמר ב-prompt cache של Anthropic
+    scene_context = f"""
     --- ASSETS ---
     LOCATION: {loc_desc}
     WARDROBE: {ward_desc}
     MOOD: {moods}
+    """
+
+    user_message = f"""
+    --- DIRECTOR'S BRIEF ---
+    VISUAL ACTION (The Subject): {visual_brief}
+    REQUIRED MOTION (What will happen next): {motion_brief}
     TECHNICAL CONSTRAINTS: {constraints}
     
     --- TASK ---
     Write the Flux Prompt for the START FRAME (T=0). 
     Remember: If the action changes the state of an object, describe the INITIAL state.
     """
+    return {"system_prompt": system_prompt, "user_prompt": user_message, "shared_context": scene_context}
+
+# --- מצב סצנה (--scene): בקשה אחת לכל סצנה עם כל ה-briefs שלה ---
+SCENE_INSTRUCTIONS = """
+    SCENE MODE:
+    You will receive the briefs of several consecutive shots of the same scene, in story order.
+    Write the START FRAME (T=0) prompt of EACH shot, following all the rules above.
+    CONTINUITY: The state of objects and characters carries over between consecutive shots
+    (a lantern lit at the end of one shot's motion is still lit at the start of the next; wet clothes stay wet).
+    OUTPUT ONLY JSON: {"prompts": [{"shot_id": "...", "prompt": "..."}]} - exactly one entry per shot, the prompt as raw text.
+    """
+
+class ShotPrompt(BaseModel):
+    shot_id: str
+    prompt: str
 
+class ScenePrompts(BaseModel):
+    prompts: List[ShotPrompt]
+
+def build_scene_request(scene_shots, scene_data, assets):
+    """
+    בקשה אחת לכמה שוטים של אותה סצנה: אותו סיסטם פרומפט והקשר סצנה כמו בשוט בודד, פעם אחת בלבד,
+    ואחריהם ה-briefs לפי הסדר. scene_shots: [(shot_id, shot_data)]
+    """
+    first = build_shot_request(scene_shots[0][1], scene_data, assets)
+    briefs = []
+    for sid, shot_data in scene_shots:
+        briefs.append(f"""
+    --- SHOT {sid} ---
+    VISUAL ACTION (The Subject): {shot_data['brief']['visual']}
+    REQUIRED MOTION (What will happen next): {shot_data['brief']['motion']}
+    TECHNICAL CONSTRAINTS: {shot_data.get('constraints', {})}
+    """)
+    user_message = "".join(briefs) + """
+    --- TASK ---
+    Write the Flux Prompt for the START FRAME (T=0) of every shot above.
+    Remember: If the action changes the state of an object, describe the INITIAL state.
+    """
+    return {
+        "system_prompt": first["system_prompt"] + SCENE_INSTRUCTIONS,
+        "user_prompt": user_message,
+        "shared_context": first["shared_context"],
+        "max_tokens": 400 * len(scene_shots),
+    }
+
+def parse_scene_prompts(text, shot_ids):
+    """
+    {shot_id: prompt} מתוך תשובת הסצנה. זורק חריגה אם ה-JSON לא תקין (ואז התשובה לא נשמרת ב-cache);
+    שוטים חסרים / ריקים / כפולים פשוט לא מוחזרים - והם עוברים לבקשה של שוט בודד.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1].rsplit("```", 1)[0]
+    prompts = {}
+    duplicates = set()
+    for item in ScenePrompts.model_validate_json(text).prompts:
+        if item.shot_id in prompts:
+            duplicates.add(item.shot_id)
+        prompts[item.shot_id] = item.prompt.strip()
+    return {sid: p for sid, p in prompts.items() if sid in shot_ids and p and sid not in duplicates}
+
+def generate_prompts_for_scene(scene_ref, scene_shots, scene_data, assets):
+    """
+    מחזיר רשימה של (shot_id, prompt) - שוטים שתשובת הסצנה לא כיסתה כראוי נוצרים אחד-אחד (fallback).
+    """
+    shot_ids = [sid for sid, _ in scene_shots]
+    request = build_scene_request(scene_shots, scene_data, assets)
+    print(f"🎬 Claude is writing {len(shot_ids)} T=0 prompts for {scene_ref}...")
+    try:
+        text = get_claude_response(request["system_prompt"], request["user_prompt"], cache=True,
+                                   max_tokens=request["max_tokens"], shared_context=request["shared_context"],
+                                   label=scene_ref, validate=lambda t: parse_scene_prompts(t, shot_ids))
+        prompts = parse_scene_prompts(text, shot_ids)
+    except Exception as e:
+        print(f"⚠️ Scene request for {scene_ref} failed ({e}) - falling back to per-shot requests.")
+        prompts = {}
+
+    results = [(sid, prompts[sid]) for sid in shot_ids if sid in prompts]
+    missing = [(sid, data) for sid, data in scene_shots if sid not in prompts]
+    if missing and prompts:
+        print(f"⚠️ {scene_ref}: No valid prompt for {', '.join(sid for sid, _ in missing)} - per-shot fallback.")
+    for sid, data in missing:
+        results.append(generate_prompt_for_shot(sid, data, scene_data, assets))
+    return results
+
+def stage_fingerprint(shot_data, scene_data, assets):
+    """
+    טביעת האצבע של הקלטים (build plan): brief, constraints, הסצנה, תיאורי הנכסים, גרסת הסיסטם פרומפט והמודל
+    """
+    request = build_shot_request(shot_data, scene_data, assets)
+    return fingerprint(**brief_inputs(shot_data, scene_data, assets),
+                       system_prompt=text_version(request["system_prompt"]), model=MODEL_NAME)
+
+def generate_prompt_for_shot(shot_id, shot_data, scene_data, assets):
+    request = build_shot_request(shot_data, scene_data, assets)
     print(f"🧠 Claude is calculating T=0 state for {shot_id}...")
     
     # שליחה לקלוד
     try:
-        prompt_text = get_claude_response(system_prompt, user_message)
+        prompt_text = get_claude_response(request["system_prompt"], request["user_prompt"], cache=True,
+                                          shared_context=request["shared_context"], label=shot_id)
         return shot_id, prompt_text.strip()
     except Exception as e:
         print(f"❌ Failed to generate {shot_id}: {e}")
+        progress.result("01", shot_id, "ERROR", error=str(e))
         return shot_id, None
 
+def save_prompt(store, shots, sid, prompt_result, stamp=None):
+    # שמירה - לקובץ זמני; הוא מחליף את הפרומפט רק אחרי שעדכון הלוח הצליח
+    prompt_path = shots[sid]["stills"]["prompt_file"]
+    os.makedirs(os.path.dirname(prompt_path), exist_ok=True)
+    tmp_path = f"{prompt_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prompt_result)
+    
+    # עדכון DB - רק אם השוט עדיין PENDING (לא שונה ע"י תהליך אחר בינתיים)
+    # stamp: טביעת האצבע של הקלטים שמהם נכתב הפרומפט (scripts/build.py plan)
+    committed = store.update_if(sid, {"stills.status": "PENDING"}, {"stills.status": "PROMPT_READY", "fingerprints.01": stamp})
+    if committed is None:
+        # תהליך אחר קידם את השוט בינתיים - לא דורסים את הפרומפט שלו
+        os.remove(tmp_path)
+        print(f"⚠️ {sid}: Changed on the board during generation - prompt not saved.")
+        progress.result("01", sid, "CONFLICT", error="Shot changed on the board during generation")
+        return False
+    os.replace(tmp_path, prompt_path)
+    print(f"✅ {sid} Prompt Saved!")
+    progress.result("01", sid, "PROMPT_READY", path=prompt_path)
+    return True
+
 def main():
+    # --batch: כל השוטים נשלחים כ-Message Batch אחד (מחיר batch, בלי כיוונון מקביליות) - מתאים לריצת לילה
+    # --scene: בקשה אחת לכל סצנה (עד pipeline.scene_batch_size שוטים), עם רציפות בין שוטים עוקבים
+    batch_mode = "--batch" in sys.argv
+    scene_mode = "--scene" in sys.argv
     config = load_config()
     
     # טעינת דאטה
-    with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+    store = open_shot_store(config)
     with open(config["paths"]["scenes_db"], "r", encoding="utf-8") as f: scenes = json.load(f)
     with open(config["paths"]["assets"], "r", encoding="utf-8") as f: assets = yaml.safe_load(f)
 
     # יצירת משימות
+    shots = store.by_status("PENDING") # או סטטוס אחר אם תרצה לשכתב קיימים
     tasks = []
     for sid, data in shots.items():
-        if data["stills"]["status"] == "PENDING": # או סטטוס אחר אם תרצה לשכתב קיימים
-            scene_ref = data["scene_ref"]
-            if scene_ref in scenes:
-                tasks.append((sid, data, scenes[scene_ref]))
+        scene_ref = data["scene_ref"]
+        if scene_ref in scenes:
+            tasks.append((sid, data, scenes[scene_ref]))
+
+    # שוטים של אותה סצנה ברצף - כדי שה-prompt cache של הסצנה יהיה חם כשהם נשלחים
+    tasks.sort(key=lambda t: (t[1]["scene_ref"], t[0]))
 
     if not tasks:
         print("🎉 No pending shots found.")
         return
 
-    print(f"🚀 Starting T=0 Prompt Generation for {len(tasks)} shots...")
+    if batch_mode:
+        print(f"📦 Starting T=0 Prompt Generation for {len(tasks)} shots (BATCH MODE)...")
+        items = {t[0]: build_shot_request(t[1], t[2], assets) for t in tasks}
+        state_path = os.path.join(config["paths"].get("batches", "production/batches"), "01_stills_prompt_creator.json")
+        for sid, prompt_result, error in get_claude_responses_batch(items, state_path=state_path):
+            if prompt_result:
+                scene = scenes[shots[sid]["scene_ref"]]
+                save_prompt(store, shots, sid, prompt_result.strip(), stage_fingerprint(shots[sid], scene, assets))
+            else:
+                print(f"❌ Failed to generate {sid}: {error}")
+                progress.result("01", sid, "ERROR", error=str(error))
+    elif scene_mode:
+        # קבוצות לפי סצנה, בסדר השוטים (לרציפות), מפוצלות לפי scene_batch_size
+        groups = {}
+        for sid, data, scene in tasks:
+            groups.setdefault(data["scene_ref"], []).append((sid, data))
+        size = config["pipeline"].get("scene_batch_size", 10)
+        chunks = [(ref, shots_in[i:i + size]) for ref, shots_in in groups.items() for i in range(0, len(shots_in), size)]
+        print(f"🎬 Starting T=0 Prompt Generation for {len(tasks)} shots in {len(chunks)} scene requests...")
 
-    # הרצה במקביל
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = [
-            executor.submit(generate_prompt_for_shot, t[0], t[1], t[2], assets)
-            for t in tasks
-        ]
+        with ThreadPoolExecutor(max_workers=adaptive_limiter("anthropic", MODEL_NAME).max_limit) as executor:
+            futures = [
+                executor.submit(generate_prompts_for_scene, ref, chunk, scenes[ref], assets)
+                for ref, chunk in chunks
+            ]
+            for future in as_completed(futures):
+                for sid, prompt_result in future.result():
+                    if prompt_result:
+                        scene = scenes[shots[sid]["scene_ref"]]
+                        save_prompt(store, shots, sid, prompt_result, stage_fingerprint(shots[sid], scene, assets))
+    else:
+        print(f"🚀 Starting T=0 Prompt Generation for {len(tasks)} shots...")
 
-        for future in futures:
-            sid, prompt_result = future.result()
-            if prompt_result:
-                # שמירה
-                prompt_path = shots[sid]["stills"]["prompt_file"]
-                os.makedirs(os.path.dirname(prompt_path), exist_ok=True)
-                with open(prompt_path, "w", encoding="utf-8") as f:
-                    f.write(prompt_result)
-                
-                shots[sid]["stills"]["status"] = "PROMPT_READY"
-                print(f"✅ {sid} Prompt Saved!")
-
-    # עדכון DB
-    with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
+        # הרצה במקביל - כל שוט נשמר ברגע שהוא מוכן (checkpoint), קריסה לא מוחקת עבודה שכבר שולמה
+        with ThreadPoolExecutor(max_workers=adaptive_limiter("anthropic", MODEL_NAME).max_limit) as executor:
+            futures = [
+                executor.submit(generate_prompt_for_shot, t[0], t[1], t[2], assets)
+                for t in tasks
+            ]
+
+            for future in as_completed(futures):
+                sid, prompt_result = future.result()
+                if prompt_result:
+                    scene = scenes[shots[sid]["scene_ref"]]
+                    save_prompt(store, shots, sid, prompt_result, stage_fingerprint(shots[sid], scene, assets))
     
+    print(f"💾 Response cache: {response_cache_summary()}")
+    print(f"🧮 Claude tokens: {usage_summary()}")
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
     print("\n🏁 Process Complete.")
 
 if __name__ == "__main__":
@@ -1,27 +1,43 @@
 import os
+import sys
 import json
 import yaml
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from google import genai
-from google.genai import types
+from itertools import chain
+from pydantic import ValidationError
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+from utils.response_cache import cached_response, open_response_cache
+from utils.gemini_client import get_gemini_client, generate_text
+from utils.gemini_cache import GeminiContextCache
+from utils.concurrency import adaptive_limiter, concurrency_summary
+from utils.fingerprints import fingerprint
+from utils import progress
+from utils.inspection import (
+    VERDICT_INSTRUCTIONS, InspectionVerdict, ShotVerdict, apply_edits, open_inspection_ledger,
+)
+
 # טעינת משתני סביבה
 load_dotenv()
 
-# הגדרת הלקוח החדש
-client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+# הלקוח המשותף (אותו אחד כמו ב-05 וב-ChatService)
+client = get_gemini_client()
 
 # טעינת קונפיגורציה
 with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
 
 # טעינת הלוח
-with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+store = open_shot_store(config)
 
 # הגדרת המודל
 GEMINI_MODEL_NAME = config.get("models", {}).get("gemini", "gemini-1.5-flash")
 
+# בדיקה מרובת שוטים: עד K פרומפטים בבקשה אחת (החוקים נשלחים פעם אחת לכל batch)
+INSPECT_BATCH_SIZE = config["pipeline"].get("inspect_batch_size", 8)
+
 # --- חוקי הברזל ---
 TZNIUT_RULES = """
 1. MODESTY (TZNIUT):
@@ -39,15 +55,36 @@ VIDEO_LOGIC_RULES = """
    - **CRITICAL:** If the prompt describes the *result*, REWRITE it to be the *start*.
 """
 
-def process_single_shot(shot_id):
+# ספר החוקים הקבוע - נשמר פעם אחת ב-context cache של Gemini (לכל גרסת חוקים), ולא נשלח מחדש בכל בקשה
+RULEBOOK = f"""
+SYSTEM ALERT: CURRENT DATE IS JANUARY 31, 2026.
+ROLE: Production Supervisor & Prompt Fixer.
+
+--- RULES ---
+{TZNIUT_RULES}
+{VIDEO_LOGIC_RULES}
+
+3. TECHNICAL CONSTRAINTS: given with each shot.
+"""
+
+RULEBOOK_CACHE = GeminiContextCache(
+    GEMINI_MODEL_NAME, "stills-rulebook", RULEBOOK,
+    ttl_minutes=config["pipeline"].get("rulebook_cache_ttl_minutes", 30), client=client,
+)
+
+# ledger: פרומפט שכבר עבר בדיקה (ללא שינוי) תחת אותה גרסת חוקים ואותו מודל - לא נבדק שוב
+LEDGER = open_inspection_ledger(config)
+RULES_VERSION = RULEBOOK_CACHE.version
+
+def load_shot_input(shot_id, pending_only=True):
     """
-    פונקציה המטפלת בשוט בודד - מיועדת לרוץ בתוך Thread
+    הקלט של שוט לבדיקה, או None אם הוא לא מחכה לבדיקה (pending_only=False: בכל סטטוס, ל-build plan)
     """
-    shot = shots.get(shot_id)
+    shot = store.get(shot_id)
     if not shot: return None
 
     # רק שוטים שמחכים לבדיקה
-    if shot["stills"]["status"] != "PROMPT_READY":
+    if pending_only and shot["stills"]["status"] != "PROMPT_READY":
         return None
 
     prompt_path = shot["stills"]["prompt_file"]
@@ -55,20 +92,63 @@ def process_single_shot(shot_id):
 
     with open(prompt_path, "r", encoding="utf-8") as f: current_prompt = f.read()
 
-    visual_brief = shot['brief']['visual']
-    motion_brief = shot['brief']['motion']
-    constraints = json.dumps(shot.get('constraints', {}))
+    return {
+        "id": shot_id,
+        "prompt_path": prompt_path,
+        "prompt": current_prompt,
+        "visual": shot['brief']['visual'],
+        "motion": shot['brief']['motion'],
+        "constraints": json.dumps(shot.get('constraints', {})),
+    }
+
+def stage_fingerprint(shot_input):
+    """
+    טביעת האצבע של הקלטים (build plan): הפרומפט כפי שהוא אחרי הבדיקה, ה-brief, גרסת החוקים והמודל
+    """
+    return fingerprint(prompt=shot_input["prompt"], visual=shot_input["visual"], motion=shot_input["motion"],
+                       constraints=shot_input["constraints"], rules=RULES_VERSION, model=GEMINI_MODEL_NAME)
+
+def already_passed(shot_input):
+    return LEDGER.passed(shot_input["prompt"], RULES_VERSION, GEMINI_MODEL_NAME, "stills")
+
+def finish_shot(shot_input, verdict, how):
+    """
+    מחשב את הפרומפט אחרי ה-verdict: unchanged -> כמו שהוא; edits -> מחילים רק את השינויים.
+    לא נוגע בקובץ ולא ב-ledger - commit_result שומר רק אם השוט עדיין מחכה לבדיקה בלוח.
+    """
+    if verdict.verdict == "edits" and verdict.edits:
+        prompt = apply_edits(shot_input["prompt"], verdict.edits).strip()
+        msg = f"Fixed by GenAI ({how}): {', '.join(verdict.violated_rules) or 'rules'} ({len(verdict.edits)} edits)"
+    else:
+        prompt = shot_input["prompt"]
+        msg = f"Checked by GenAI ({how}): unchanged"
+    return {"id": shot_input["id"], "status": "APPROVED", "msg": msg,
+            "shot_input": shot_input, "prompt": prompt, "verdict": verdict}
+
+def skipped_result(shot_input):
+    # עבר כבר ללא שינוי תחת אותם חוקים ומודל - מאושר בלי קריאה למודל
+    return {"id": shot_input["id"], "status": "APPROVED", "msg": f"Skipped: passed rules {RULES_VERSION} before",
+            "shot_input": shot_input, "prompt": shot_input["prompt"], "verdict": None}
+
+def process_single_shot(shot_id):
+    """
+    פונקציה המטפלת בשוט בודד - מיועדת לרוץ בתוך Thread (וגם fallback כשבדיקת batch נכשלת)
+    """
+    shot_input = load_shot_input(shot_id)
+    if not shot_input: return None
+
+    if already_passed(shot_input):
+        return skipped_result(shot_input)
+
+    prompt_path = shot_input["prompt_path"]
+    current_prompt = shot_input["prompt"]
+    visual_brief = shot_input["visual"]
+    motion_brief = shot_input["motion"]
+    constraints = shot_input["constraints"]
 
     try:
-        # בניית הפרומפט למודל
-        full_sys_prompt = f"""
-        SYSTEM ALERT: CURRENT DATE IS JANUARY 31, 2026.
-        ROLE: Production Supervisor & Prompt Fixer.
-        
-        --- RULES ---
-        {TZNIUT_RULES}
-        {VIDEO_LOGIC_RULES}
-        
+        # בניית הפרומפט למודל (החוקים עצמם ב-RULEBOOK)
+        shot_prompt = f"""
         3. TECHNICAL CONSTRAINTS: {constraints}
            
         --- CONTEXT ---
@@ -77,30 +157,25 @@ def process_single_shot(shot_id):
         
         INPUT PROMPT:
         {current_prompt}
-        
-        OUTPUT ONLY THE FINAL RAW PROMPT TEXT.
+        {VERDICT_INSTRUCTIONS}
         """
 
-        # שליחה למודל (New SDK)
-        response = client.models.generate_content(
-            model=GEMINI_MODEL_NAME,
-            contents=full_sys_prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.1
+        def call():
+            text = generate_text(
+                GEMINI_MODEL_NAME, shot_prompt,
+                temperature=0.1,
+                response_mime_type="application/json",
+                response_schema=InspectionVerdict,
+                context_cache=RULEBOOK_CACHE,
             )
-        )
-        
-        corrected_prompt = response.text.strip()
+            apply_edits(current_prompt, InspectionVerdict.model_validate_json(text).edits)  # לא שומרים ב-cache תשובה פגומה
+            return text
+
+        # שליחה למודל (New SDK) - דרך ה-cache, ריצה חוזרת על פרומפט שלא השתנה לא משלמת שוב
+        response_text = cached_response("gemini", GEMINI_MODEL_NAME, RULEBOOK, shot_prompt, call, temperature=0.1, config=config)
         
         # שמירת הקובץ (Thread Safe כי כל תהליך כותב לקובץ אחר)
-        with open(prompt_path, "w", encoding="utf-8") as f:
-            f.write(corrected_prompt)
-        
-        return {
-            "id": shot_id,
-            "status": "APPROVED",
-            "msg": "Checked by GenAI (Parallel)"
-        }
+        return finish_shot(shot_input, InspectionVerdict.model_validate_json(response_text), "Parallel")
 
     except Exception as e:
         return {
@@ -109,40 +184,177 @@ def process_single_shot(shot_id):
             "msg": str(e)
         }
 
+# --- בדיקה מרובת שוטים ---
+
+BATCH_INSTRUCTIONS = """
+You will receive several shots. Return a JSON array with one verdict for EVERY shot,
+with "shot_id" exactly as given and the fields below (edits refer to that shot's INPUT PROMPT).
+""" + VERDICT_INSTRUCTIONS
+
+def get_model_limits():
+    """
+    מגבלות ההקשר של המודל (input / output tokens), לחישוב גודל ה-batch
+    """
+    try:
+        model = client.models.get(model=GEMINI_MODEL_NAME)
+        return model.input_token_limit or 1_000_000, model.output_token_limit or 8192
+    except Exception as e:
+        print(f"⚠️ Could not read limits of {GEMINI_MODEL_NAME} ({e}), using defaults.")
+        return 1_000_000, 8192
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def format_shot_block(shot_input):
+    return f"""
+=== SHOT {shot_input['id']} ===
+TECHNICAL CONSTRAINTS: {shot_input['constraints']}
+ORIGINAL BRIEF: {shot_input['visual']}
+MOTION: {shot_input['motion']}
+INPUT PROMPT:
+{shot_input['prompt']}
+"""
+
+def plan_batches(shot_inputs, input_limit, output_limit, max_batch=INSPECT_BATCH_SIZE):
+    """
+    גודל batch אדפטיבי: ממלאים כל בקשה עד K שוטים, או עד שהקלט/הפלט המשוער
+    (במקרה הגרוע ה-edits בגודל הפרומפט) מגיע לחצי ממגבלת המודל.
+    """
+    input_budget = input_limit // 2 - estimate_tokens(RULEBOOK + BATCH_INSTRUCTIONS)
+    output_budget = output_limit // 2
+    batches, current, used_in, used_out = [], [], 0, 0
+    for shot_input in shot_inputs:
+        cost_in = estimate_tokens(format_shot_block(shot_input))
+        cost_out = estimate_tokens(shot_input["prompt"]) + 50
+        if current and (len(current) >= max_batch or used_in + cost_in > input_budget or used_out + cost_out > output_budget):
+            batches.append(current)
+            current, used_in, used_out = [], 0, 0
+        current.append(shot_input)
+        used_in += cost_in
+        used_out += cost_out
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_verdicts(text, shot_inputs):
+    """
+    מפענח ומוודא את מערך ה-verdicts: בדיוק verdict אחד לכל שוט, וכל edit נמצא בפרומפט שלו. אחרת ValueError.
+    """
+    try:
+        verdicts = [ShotVerdict.model_validate(v) for v in json.loads(text)]
+    except (ValueError, TypeError, ValidationError) as e:
+        raise ValueError(f"malformed verdicts: {e}")
+    by_id = {v.shot_id: v for v in verdicts}
+    expected = {s["id"] for s in shot_inputs}
+    if len(verdicts) != len(expected) or set(by_id) != expected:
+        raise ValueError(f"verdicts for {sorted(by_id)}, expected {sorted(expected)}")
+    for shot_input in shot_inputs:
+        apply_edits(shot_input["prompt"], by_id[shot_input["id"]].edits)
+    return by_id
+
+def process_batch(shot_inputs):
+    """
+    בדיקה של כמה שוטים בבקשה אחת. batch פגום -> fallback לבדיקה שוט-שוט.
+    """
+    if len(shot_inputs) == 1:
+        return [process_single_shot(shot_inputs[0]["id"])]
+
+    contents = BATCH_INSTRUCTIONS + "".join(format_shot_block(s) for s in shot_inputs)
+
+    def call():
+        text = generate_text(
+            GEMINI_MODEL_NAME, contents,
+            temperature=0.1,
+            response_mime_type="application/json",
+            response_schema=list[ShotVerdict],
+            context_cache=RULEBOOK_CACHE,
+        )
+        parse_verdicts(text, shot_inputs)  # לא שומרים ב-cache תשובה פגומה
+        return text
+
+    try:
+        text = cached_response("gemini", GEMINI_MODEL_NAME, RULEBOOK, contents, call, temperature=0.1, config=config)
+        verdicts = parse_verdicts(text, shot_inputs)
+    except Exception as e:
+        print(f"⚠️ Batch of {len(shot_inputs)} failed ({e}) - falling back to per-shot inspection.")
+        return [process_single_shot(s["id"]) for s in shot_inputs]
+
+    return [finish_shot(s, verdicts[s["id"]], f"batch of {len(shot_inputs)}") for s in shot_inputs]
+
+def commit_result(res):
+    """
+    שמירה מיידית של כל שוט שסיים (checkpoint) - רק אם הוא עדיין מחכה לבדיקה.
+    הפרומפט המתוקן נכתב לקובץ זמני ומחליף את הקובץ רק אחרי שעדכון הלוח (CAS) הצליח; ה-ledger נרשם רק אז.
+    """
+    if res["status"] != "APPROVED":
+        print(f"❌ {res['id']}: Failed - {res['msg']}")
+        progress.result("02", res["id"], "ERROR", error=res["msg"])
+        return False
+
+    shot_input, prompt = res["shot_input"], res["prompt"]
+    prompt_path = shot_input["prompt_path"]
+    changed = prompt != shot_input["prompt"]
+    if changed:
+        tmp_path = f"{prompt_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f: f.write(prompt)
+
+    committed = store.update_if(res['id'], {"stills.status": "PROMPT_READY"}, {
+        "stills.status": "APPROVED",
+        "stills.inspector_feedback": res["msg"],
+        "fingerprints.02": stage_fingerprint({**shot_input, "prompt": prompt}),
+    })
+    if committed is None:
+        # השוט זז בלוח בזמן הבדיקה (01 / review_board / ריצה אחרת) - לא מאשרים ולא נוגעים בפרומפט
+        if changed:
+            os.remove(tmp_path)
+        print(f"⚠️ {res['id']}: Changed on the board during inspection - not approved.")
+        progress.result("02", res["id"], "CONFLICT", error="Shot changed on the board during inspection")
+        return False
+
+    if changed:
+        os.replace(tmp_path, prompt_path)
+    if res["verdict"] is not None:
+        LEDGER.record(shot_input["prompt"], RULES_VERSION, GEMINI_MODEL_NAME, "stills", res["verdict"], res["id"])
+    print(f"✅ {res['id']}: Approved. ({res['msg']})")
+    progress.result("02", res["id"], "APPROVED", path=prompt_path, msg=res["msg"])
+    return True
+
 def main():
     # איסוף כל השוטים שצריכים בדיקה
-    pending_shots = [sid for sid, data in shots.items() if data["stills"]["status"] == "PROMPT_READY"]
+    pending_shots = store.ids_by_status("PROMPT_READY")
     
     if not pending_shots:
         print("🎉 No prompts waiting for inspection.")
         return
 
-    print(f"🚀 Starting PARALLEL inspection for {len(pending_shots)} shots...")
+    shot_inputs = [i for i in (load_shot_input(sid) for sid in pending_shots) if i]
+
+    # מסלול מהיר: פרומפטים שכבר עברו תחת אותם חוקים ומודל מאושרים בלי קריאה למודל
+    skipped = [skipped_result(i) for i in shot_inputs if already_passed(i)]
+    skipped_ids = {r["id"] for r in skipped}
+    to_inspect = [i for i in shot_inputs if i["id"] not in skipped_ids]
+    batches = plan_batches(to_inspect, *get_model_limits()) if to_inspect else []
+
+    print(f"🚀 Starting PARALLEL inspection for {len(to_inspect)} shots in {len(batches)} requests "
+          f"({len(skipped)} already passed rules {RULES_VERSION})...")
     print(f"💳 Paid Account Detected: Unlocking limits.")
 
-    # הרצה במקביל - 10 תהליכים בו זמנית
+    # הרצה במקביל - כמה בקשות בו זמנית מחליט הגבול האדפטיבי של המודל; ספר החוקים ב-context cache לכל אורך הריצה ונמחק בסוף
     results = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    max_workers = adaptive_limiter("gemini", GEMINI_MODEL_NAME).max_limit
+    with RULEBOOK_CACHE, ThreadPoolExecutor(max_workers=max_workers) as executor:
         # שליחת כל המשימות
-        future_to_shot = {executor.submit(process_single_shot, sid): sid for sid in pending_shots}
+        futures = [executor.submit(process_batch, batch) for batch in batches]
         
-        for future in as_completed(future_to_shot):
-            res = future.result()
-            if res:
+        for batch_results in chain([skipped], (f.result() for f in as_completed(futures))):
+            for res in batch_results:
+                if not res:
+                    continue
                 results.append(res)
-                if res["status"] == "APPROVED":
-                    print(f"✅ {res['id']}: Approved.")
-                    # עדכון הזיכרון הראשי (JSON object)
-                    shots[res['id']]["stills"]["status"] = "APPROVED"
-                    shots[res['id']]["stills"]["inspector_feedback"] = res["msg"]
-                else:
-                    print(f"❌ {res['id']}: Failed - {res['msg']}")
-
-    # שמירה אחת מרוכזת בסוף התהליך (מונע התנגשויות כתיבה)
-    print("💾 Saving all changes to DB...")
-    with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
-    
+                commit_result(res)
+
+    print(f"💾 Response cache: {open_response_cache(config).summary()}")
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
     print("🏁 Batch inspection finished.")
 
 if __name__ == "__main__":
@@ -1,20 +1,26 @@
 import os
+import sys
 import json
 import yaml
 import time
-import requests
-import re
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import fal_client
+import threading
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store, parse_shot_range
+from utils.generation_cache import cache_key, open_image_cache
+from utils.fal_engine import FalJob, FalJobEngine
+from utils.downloader import download_file, link_file
+from utils.upload_cache import cached_upload
+from utils.concurrency import adaptive_limiter, concurrency_summary
+from utils import progress
+
 load_dotenv()
 
 # טעינת הגדרות
 with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+store = open_shot_store(config)
 with open(config["paths"]["assets"], "r", encoding="utf-8") as f: assets = yaml.safe_load(f)
 
 # יצירת תיקיית פלט מסודרת + תיקייה שטוחה לנוחות
@@ -24,115 +30,254 @@ os.makedirs(FLAT_DIR, exist_ok=True)
 
 FLUX_MODEL = config["models"]["flux"]
 
+# מגבלות מקביליות נפרדות: שליחות לתור של fal (תקרה; בתוכה הגבול האדפטיבי של concurrency.fal) / הורדות תמונה
+MAX_SUBMISSIONS = adaptive_limiter("fal", FLUX_MODEL).max_limit
+MAX_DOWNLOADS = config["pipeline"].get("fal_max_downloads", 4)
+
+# cache לפי תוכן: שוט שלא השתנה (פרומפט + הגדרות) לא מרונדר שוב
+IMAGE_CACHE = open_image_cache(config)
+
 # --- פונקציית LoRA ---
 def get_lora_config():
     lora_source = assets.get("lora_url")
     if not lora_source: return None
     if os.path.exists(lora_source):
-        print(f"📤 Uploading local LoRA: {lora_source}...")
+        # cache לפי תוכן: ה-LoRA (מאות MB) מועלה פעם אחת עד שה-URL פג
+        print(f"📤 Local LoRA: {lora_source} (uploaded only if changed/expired)...")
         try:
-            uploaded_url = fal_client.upload_file(lora_source)
+            uploaded_url = cached_upload(lora_source, config)
             return {"path": uploaded_url, "scale": 1.0}
         except Exception as e:
             print(f"⚠️ Failed to upload LoRA: {e}")
             return None
     return {"path": lora_source, "scale": 1.0}
 
-GLOBAL_LORA_CONFIG = get_lora_config()
+_lora_lock = threading.Lock()
+_lora = {}
 
-def parse_shot_range(user_input):
-    target_ids = []
-    user_input = user_input.strip().upper()
-    if "-" in user_input:
-        try:
-            start_str, end_str = user_input.split("-")
-            start_num = int(re.search(r'\d+', start_str).group())
-            end_num = int(re.search(r'\d+', end_str).group())
-            for i in range(start_num, end_num + 1):
-                target_ids.append(f"SHOT_{i:03d}")
-        except: return []
-    else:
-        try:
-            num = int(re.search(r'\d+', user_input).group())
-            target_ids.append(f"SHOT_{num:03d}")
-        except: target_ids.append(user_input)
-    return target_ids
+def lora_config():
+    # מועלה בשימוש הראשון ולא ב-import - כך build plan (ו-pipeline_runner) טוענים את הסקריפט בלי להעלות כלום
+    with _lora_lock:
+        if "config" not in _lora:
+            _lora["config"] = get_lora_config()
+        return _lora["config"]
 
-@retry(wait=wait_exponential(multiplier=1, min=4, max=60), stop=stop_after_attempt(5), reraise=True)
-def generate_image_task(shot_id, prompt):
-    print(f"🎨 {shot_id}: Sending to Flux...")
-    
+def build_args(prompt):
     args = {
         "prompt": prompt,
-        "image_size": "landscape_16_9",
+        "image_size": config["pipeline"].get("image_size", "landscape_16_9"),
         "num_inference_steps": config["pipeline"].get("flux_steps", 28),
-        "guidance_scale": 3.5,
+        "guidance_scale": config["pipeline"].get("guidance_scale", 3.5),
         "enable_safety_checker": False,
         "output_format": "jpeg"
     }
+
+    seed = config["pipeline"].get("flux_seed")
+    if seed is not None:
+        args["seed"] = seed
     
-    if GLOBAL_LORA_CONFIG:
-        args["loras"] = [GLOBAL_LORA_CONFIG]
+    lora = lora_config()
+    if lora:
+        args["loras"] = [lora]
+    return args
+
+def generation_key(args):
+    """
+    מפתח ה-cache, וגם טביעת האצבע של בקשה פתוחה ב-fal.
+    ה-LoRA נכנס לפי המקור שלו ב-assets (ולא לפי ה-URL אחרי העלאה, שמשתנה בכל ריצה).
+    """
+    lora = lora_config()
+    return cache_key({
+        "prompt": args["prompt"],
+        "model": FLUX_MODEL,
+        "lora_path": assets.get("lora_url") if lora else None,
+        "lora_scale": lora["scale"] if lora else None,
+        "image_size": args["image_size"],
+        "flux_steps": args["num_inference_steps"],
+        "guidance_scale": args["guidance_scale"],
+        "seed": args.get("seed"),
+    })
 
-    result = fal_client.submit(FLUX_MODEL, arguments=args).get()
+def stage_fingerprint(prompt):
+    """
+    טביעת האצבע של הקלטים (build plan): הפרומפט, המודל, מקור ה-LoRA והגדרות Flux - בלי להעלות את ה-LoRA
+    """
+    lora_source = assets.get("lora_url")
+    return cache_key({
+        "prompt": prompt,
+        "model": FLUX_MODEL,
+        "lora_path": lora_source,
+        "image_size": config["pipeline"].get("image_size", "landscape_16_9"),
+        "flux_steps": config["pipeline"].get("flux_steps", 28),
+        "guidance_scale": config["pipeline"].get("guidance_scale", 3.5),
+        "seed": config["pipeline"].get("flux_seed"),
+    })
+
+@retry(wait=wait_exponential(multiplier=1, min=4, max=60), stop=stop_after_attempt(5), reraise=True)
+def save_image(shot_id, result, key):
+    """
+    רץ ב-thread של ה-engine ברגע שהבקשה ב-fal הסתיימה: הורדה, שמירה, ו-cache.
+    """
     image_url = result["images"][0]["url"]
-    
-    response = requests.get(image_url)
-    if response.status_code == 200:
-        filename = f"{shot_id}.jpg"
-        
-        # 1. שמירה בתיקייה המקורית
-        save_path = os.path.join(config["paths"]["images_output"], filename)
-        with open(save_path, "wb") as f:
-            f.write(response.content)
-            
-        # 2. שמירה בתיקייה השטוחה (לנוחות)
-        flat_path = os.path.join(FLAT_DIR, filename)
-        shutil.copy(save_path, flat_path)
-        
-        return {"id": shot_id, "status": "SUCCESS", "path": save_path, "flat_path": flat_path}
-    else:
-        raise Exception(f"Failed to download image from {image_url}")
+    filename = f"{shot_id}.jpg"
+
+    # 1. הורדה בזרימה (session משותף) לתיקייה המקורית, עם rename אטומי
+    save_path = os.path.join(config["paths"]["images_output"], filename)
+    download = download_file(image_url, save_path)
+
+    # 2. התיקייה השטוחה (לנוחות) - hardlink, בלי עותק נוסף על הדיסק
+    flat_path = os.path.join(FLAT_DIR, filename)
+    link_file(save_path, flat_path)
+
+    # 3. שמירה ב-cache, כדי שריצה הבאה עם אותו פרומפט לא תשלם שוב
+    IMAGE_CACHE.put(key, save_path, meta={"shot_id": shot_id, "sha256": download["sha256"]})
 
-def process_shot(shot_id):
-    shot = shots.get(shot_id)
+    return {"id": shot_id, "status": "SUCCESS", "path": save_path, "flat_path": flat_path, "sha256": download["sha256"]}
+
+def restore_from_cache(shot_id, key):
+    filename = f"{shot_id}.jpg"
+    save_path = os.path.join(config["paths"]["images_output"], filename)
+    if not IMAGE_CACHE.restore(key, save_path):
+        return None
+    flat_path = os.path.join(FLAT_DIR, filename)
+    link_file(save_path, flat_path)
+    return {"id": shot_id, "status": "SUCCESS", "path": save_path, "flat_path": flat_path, "cached": True}
+
+def prepare_shot(shot_id, force=False):
+    """
+    מחזיר תוצאה מוכנה (cache hit / שגיאה) או FalJob שצריך לשלוח ל-fal.
+    """
+    shot = store.get(shot_id)
     if not shot: return {"id": shot_id, "status": "SKIPPED", "msg": "Not found"}
-    
-    # --- התיקון: ביטול בדיקת ה-SKIPPED ---
-    # הבלוק הזה אחראי לדילוג. שמתי אותו בהערה כדי שידרוס תמיד.
-    # if os.path.exists(os.path.join(config["paths"]["images_output"], f"{shot_id}.jpg")):
-    #    return {"id": shot_id, "status": "SKIPPED", "msg": "Image exists"}
-    # -------------------------------------
+    progress.emit("shot_started", shot_id=shot_id)
 
     prompt_path = shot["stills"]["prompt_file"]
-    if not os.path.exists(prompt_path): return None
+    if not os.path.exists(prompt_path): return {"id": shot_id, "status": "SKIPPED", "msg": "Prompt file missing"}
     
     with open(prompt_path, "r", encoding="utf-8") as f: prompt = f.read()
 
-    try:
-        return generate_image_task(shot_id, prompt)
-    except Exception as e:
-        return {"id": shot_id, "status": "ERROR", "msg": str(e)}
+    args = build_args(prompt)
+    key = generation_key(args)
+    stamp = stage_fingerprint(prompt)
+    # מה שראינו בלוח לפני היצירה - השמירה תתבצע רק אם זה לא השתנה בינתיים
+    expected = {
+        "stills.status": shot["stills"]["status"],
+        "stills.image_path": shot["stills"].get("image_path"),
+    }
+
+    # אותו פרומפט ואותן הגדרות כבר רונדרו - לוקחים מה-cache בלי לקרוא ל-fal (אלא אם --force)
+    if not force:
+        try:
+            res = restore_from_cache(shot_id, key)
+        except Exception as e:
+            return {"id": shot_id, "status": "ERROR", "msg": str(e)}
+        if res:
+            res["expected"] = expected
+            res["stamp"] = stamp
+            return res
+
+    # אם יש לשוט בקשה פתוחה ב-fal מריצה קודמת (קריסה / timeout) עם אותו מפתח - ממשיכים לחכות לה במקום לשלם שוב
+    fal_job = shot["stills"].get("fal_job")
+    request_id = fal_job["request_id"] if fal_job and fal_job.get("args_hash") == key else None
+
+    return FalJob(
+        shot_id, FLUX_MODEL, args,
+        request_id=request_id,
+        download=lambda result: save_image(shot_id, result, key),
+        context={"key": key, "expected": expected, "stamp": stamp},
+    )
+
+def on_submitted(job):
+    # checkpoint: שומרים את ה-request_id בלוח מיד, כדי שריצה חוזרת אחרי קריסה לא תשלח שוב
+    store.update(job.key, {"stills.fal_job": {
+        "request_id": job.request_id,
+        "args_hash": job.context["key"],
+        "submitted_at": time.time(),
+    }})
+
+def on_event(job, event, **info):
+    # אירועים מובנים ל-wrapper (Chainlit / SSE) - בנוסף להדפסות
+    if event in ("submitted", "queued", "in_progress"):
+        progress.emit(event, shot_id=job.key, **{k: v for k, v in info.items() if k in ("request_id", "resumed", "position")})
+    if event == "submitted":
+        if info.get("resumed"):
+            print(f"♻️ {job.key}: Resuming fal request {job.request_id} (no new submit)...")
+        else:
+            print(f"🎨 {job.key}: Sent to Flux ({job.request_id})")
+    elif event == "queued":
+        print(f"⏳ {job.key}: In fal queue (position {info['position']})")
+    elif event == "resume_failed":
+        print(f"⚠️ {job.key}: Could not resume {info['request_id']} ({info['error']}) - submitting again.")
+
+def report_result(res):
+    if res["status"] == "SUCCESS":
+        if res.get("cached"):
+            print(f"♻️ {res['id']}: CACHE HIT (not re-rendered) -> {res['flat_path']}")
+        else:
+            print(f"✅ {res['id']}: OVERWRITTEN -> {res['flat_path']}")
+        committed = commit_result(res)
+        progress.emit("cached" if res.get("cached") else "downloaded", shot_id=res["id"], path=res["path"])
+        progress.result("03", res["id"], "IMAGE_READY", path=res["path"], timings=res.get("timings"),
+                        cached=bool(res.get("cached")), board_updated=committed)
+    elif res["status"] == "ERROR":
+        print(f"❌ {res['id']}: Failed - {res['msg']}")
+        progress.emit("failed", shot_id=res["id"], error=res["msg"])
+        progress.result("03", res["id"], "ERROR", error=res["msg"], timings=res.get("timings"))
+    elif res["status"] == "SKIPPED":
+        progress.result("03", res["id"], "SKIPPED", error=res["msg"])
+
+def on_done(job):
+    if job.ok:
+        res = job.output
+        res["expected"] = job.context["expected"]
+        res["stamp"] = job.context["stamp"]
+    else:
+        res = {"id": job.key, "status": "ERROR", "msg": job.error}
+    res["timings"] = job.timings
+    report_result(res)
+
+def commit_result(res):
+    """
+    שמירה מיידית של שוט שסיים (checkpoint) - קריסה באמצע הבאץ' לא מאבדת תוצאות ששולמו.
+    compare-and-swap: אם review_board או repair_shot שינו את השוט בזמן היצירה, לא דורסים אותם.
+    """
+    committed = store.update_if(res["id"], res["expected"], {
+        "stills.image_path": res["path"],
+        "stills.status": "IMAGE_READY",
+        "stills.fal_job": None,
+        "fingerprints.03": res.get("stamp"),
+    })
+    if committed is None:
+        store.update(res["id"], {"stills.fal_job": None})
+        print(f"⚠️ {res['id']}: Changed on the board during generation - image kept at {res['path']}, board not updated.")
+    return committed is not None
 
 def main():
-    print("--- Flux Image Generator (FORCE REGENERATE MODE) ---")
-    if GLOBAL_LORA_CONFIG: print(f"🦄 LoRA Active")
+    # --force: עוקף את ה-cache ומרנדר מחדש גם שוטים שלא השתנו
+    force = "--force" in sys.argv
+    cli_args = [a for a in sys.argv[1:] if a != "--force"]
+
+    if force:
+        print("--- Flux Image Generator (FORCE REGENERATE MODE) ---")
+    else:
+        print("--- Flux Image Generator (unchanged shots are reused from cache) ---")
+    if lora_config(): print(f"🦄 LoRA Active")
     
-    import sys
-    if len(sys.argv) > 1:
-        user_input = sys.argv[1]
+    if cli_args:
+        user_input = cli_args[0]
         print(f"🤖 Auto-Input from CLI: {user_input}")
     else:
         user_input = input("Enter Range (e.g., 1-5), or ENTER for ALL: ").strip()
     
     target_shots = []
-    if not user_input:
+    if not user_input or user_input.lower() == "all":
         # לוקח רק את מה שמאושר
-        target_shots = [sid for sid, data in shots.items() if data["stills"]["status"] == "APPROVED"]
+        target_shots = store.ids_by_status("APPROVED")
     else:
         requested_ids = parse_shot_range(user_input)
         # לוקח את הטווח המבוקש, בתנאי שהוא מאושר
-        target_shots = [sid for sid in requested_ids if sid in shots and shots[sid]["stills"]["status"] == "APPROVED"]
+        approved = set(store.ids_by_status("APPROVED"))
+        target_shots = [sid for sid in requested_ids if sid in approved]
 
     if not target_shots:
         print("🤷 No approved shots found to generate.")
@@ -140,24 +285,31 @@ def main():
 
     print(f"🚀 Starting Flux Generation for {len(target_shots)} shots (Overwriting old images)...")
     
-    MAX_CONCURRENCY = 5 
+    jobs = []
+    for sid in target_shots:
+        prepared = prepare_shot(sid, force)
+        if isinstance(prepared, FalJob):
+            jobs.append(prepared)
+        elif prepared:
+            report_result(prepared)
+
+    # כל השוטים נשלחים לתור של fal מראש; כל אחד יורד ונשמר ברגע שהוא מוכן
+    if jobs:
+        engine = FalJobEngine(
+            max_submissions=MAX_SUBMISSIONS,
+            max_downloads=MAX_DOWNLOADS,
+            on_submitted=on_submitted,
+            on_event=on_event,
+            on_done=on_done,
+        )
+        engine.run_sync(jobs)
     
-    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
-        future_to_shot = {executor.submit(process_shot, sid): sid for sid in target_shots}
-        
-        for future in as_completed(future_to_shot):
-            res = future.result()
-            if res:
-                if res["status"] == "SUCCESS":
-                    print(f"✅ {res['id']}: OVERWRITTEN -> {res['flat_path']}")
-                    shots[res['id']]["stills"]["image_path"] = res["path"]
-                    shots[res['id']]["stills"]["status"] = "IMAGE_READY"
-                elif res["status"] == "ERROR":
-                    print(f"❌ {res['id']}: Failed - {res['msg']}")
-
-    with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
+    # ניקוי ה-cache לפי גודל וגיל (cache.images ב-config.yaml)
+    evicted = IMAGE_CACHE.evict()
+    if evicted:
+        print(f"🧹 Evicted {evicted} old renders from the image cache.")
     
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
     print(f"\n📁 New images are waiting in: {FLAT_DIR}")
 
 if __name__ == "__main__":
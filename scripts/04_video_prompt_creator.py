@@ -1,19 +1,30 @@
 import json
 import os
+import sys
 import yaml
-from concurrent.futures import ThreadPoolExecutor
-from claude_client import get_claude_response
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from claude_client import MODEL_NAME, get_claude_response, get_claude_responses_batch, response_cache_summary, usage_summary
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+from utils.concurrency import adaptive_limiter, concurrency_summary
+from utils.fingerprints import brief_inputs, fingerprint, text_version
+from utils import progress
 
 CONFIG_PATH = "config.yaml"
 
 def load_config():
     with open(CONFIG_PATH, "r", encoding="utf-8") as f: return yaml.safe_load(f)
 
-def generate_video_prompt(shot_id, shot_data, scene_data):
+def build_video_request(shot_data, scene_data):
     # שים לב: אנחנו בונים פרומפט שמתבסס על זה שיש כבר תמונה (Image-to-Video)
     visual_brief = shot_data['brief']['visual']
     motion_brief = shot_data['brief']['motion']
     moods = ", ".join(scene_data.get('mood_keywords', []))
+    scene_context = f"""
+    SCENE CONTEXT:
+    Mood: {moods}
+    """
     
     system_prompt = """
     You are an AI Video Prompt Expert for Kling AI (Image-to-Video).
@@ -31,49 +42,90 @@ def generate_video_prompt(shot_id, shot_data, scene_data):
     CONTEXT:
     Static Image Subject: {visual_brief}
     Required Motion: {motion_brief}
-    Mood: {moods}
     
     Write the Kling Motion Prompt:
     """
+    return {"system_prompt": system_prompt, "user_prompt": user_message, "shared_context": scene_context}
 
+def stage_fingerprint(shot_data, scene_data):
+    # טביעת האצבע של הקלטים (build plan): brief, הסצנה, גרסת הסיסטם פרומפט והמודל
+    request = build_video_request(shot_data, scene_data)
+    return fingerprint(**brief_inputs(shot_data, scene_data),
+                       system_prompt=text_version(request["system_prompt"]), model=MODEL_NAME)
+
+def generate_video_prompt(shot_id, shot_data, scene_data):
+    request = build_video_request(shot_data, scene_data)
     try:
         print(f"🎥 Writing video prompt for {shot_id}...")
-        prompt_text = get_claude_response(system_prompt, user_message)
+        prompt_text = get_claude_response(request["system_prompt"], request["user_prompt"], cache=True,
+                                          shared_context=request["shared_context"], label=shot_id)
         return shot_id, prompt_text.strip()
     except Exception as e:
         print(f"❌ Error {shot_id}: {e}")
+        progress.result("04", shot_id, "ERROR", error=str(e))
         return shot_id, None
 
+def save_video_prompt(store, shots, sid, prompt, stamp=None):
+    path = shots[sid]["video"]["prompt_file"]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # קובץ זמני - מחליף את הפרומפט רק אחרי שעדכון הלוח (CAS) הצליח
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: f.write(prompt)
+    
+    committed = store.update_if(sid, {"video.status": "READY_FOR_PROMPT"}, {"video.status": "PROMPT_READY", "fingerprints.04": stamp})
+    if committed is None:
+        os.remove(tmp_path)
+        print(f"⚠️ {sid}: Changed on the board during generation - video prompt not saved.")
+        progress.result("04", sid, "CONFLICT", error="Shot changed on the board during generation")
+        return False
+    os.replace(tmp_path, path)
+    print(f"✅ {sid} Video Prompt Saved!")
+    progress.result("04", sid, "PROMPT_READY", path=path)
+    return True
+
 def main():
+    # --batch: כל השוטים כ-Message Batch אחד (מחיר batch) - לריצות לילה על כל הלוח
+    batch_mode = "--batch" in sys.argv
     config = load_config()
-    with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+    store = open_shot_store(config)
     with open(config["paths"]["scenes_db"], "r", encoding="utf-8") as f: scenes = json.load(f)
 
     tasks = []
     # רצים רק על שוטים שהתמונה שלהם אושרה, אבל הוידאו טרם נכתב
+    shots = store.by_status("READY_FOR_PROMPT", stage="video")
     for sid, data in shots.items():
-        if data["stills"]["status"] == "APPROVED" and data["video"]["status"] == "READY_FOR_PROMPT":
+        if data["stills"]["status"] == "APPROVED":
             tasks.append((sid, data, scenes[data["scene_ref"]]))
+    # שוטים של אותה סצנה ברצף (prompt cache חם)
+    tasks.sort(key=lambda t: t[1]["scene_ref"])
 
     if not tasks:
         print("📭 No shots ready for video prompting. (Did you approve stills in Review Board?)")
         return
 
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = [executor.submit(generate_video_prompt, t[0], t[1], t[2]) for t in tasks]
-        
-        for future in futures:
-            sid, prompt = future.result()
+    if batch_mode:
+        items = {t[0]: build_video_request(t[1], t[2]) for t in tasks}
+        state_path = os.path.join(config["paths"].get("batches", "production/batches"), "04_video_prompt_creator.json")
+        # כל תשובה נשמרת ברגע שהיא נקראת מתוצאות ה-batch
+        for sid, prompt, error in get_claude_responses_batch(items, state_path=state_path):
             if prompt:
-                path = shots[sid]["video"]["prompt_file"]
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                with open(path, "w", encoding="utf-8") as f: f.write(prompt)
-                
-                shots[sid]["video"]["status"] = "PROMPT_READY"
-                print(f"✅ {sid} Video Prompt Saved!")
+                save_video_prompt(store, shots, sid, prompt.strip(), stage_fingerprint(shots[sid], scenes[shots[sid]["scene_ref"]]))
+            else:
+                print(f"❌ Error {sid}: {error}")
+                progress.result("04", sid, "ERROR", error=str(error))
+    else:
+        # כל שוט נשמר ברגע שהוא מוכן (checkpoint)
+        with ThreadPoolExecutor(max_workers=adaptive_limiter("anthropic", MODEL_NAME).max_limit) as executor:
+            futures = [executor.submit(generate_video_prompt, t[0], t[1], t[2]) for t in tasks]
+            
+            for future in as_completed(futures):
+                sid, prompt = future.result()
+                if prompt:
+                    save_video_prompt(store, shots, sid, prompt, stage_fingerprint(shots[sid], scenes[shots[sid]["scene_ref"]]))
 
-    with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
+    print(f"💾 Response cache: {response_cache_summary()}")
+    print(f"🧮 Claude tokens: {usage_summary()}")
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,20 +1,33 @@
 import os
+import sys
 import json
 import yaml
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+from utils.response_cache import cached_response, open_response_cache
+from utils.gemini_client import generate_text
+from utils.concurrency import adaptive_limiter, concurrency_summary
+from utils.gemini_cache import GeminiContextCache
+from utils.fingerprints import fingerprint
+from utils import progress
+from utils.inspection import VERDICT_INSTRUCTIONS, InspectionVerdict, apply_edits, open_inspection_ledger
+
 # טעינת משתני סביבה
 load_dotenv()
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
 # טעינת קונפיגורציה
 with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+store = open_shot_store(config)
 
 # שליפת שם המודל מהקונפיג (סנכרון מלא עם הסטנדרט החדש)
 GEMINI_MODEL_NAME = config.get("models", {}).get("gemini", "gemini-3-flash")
 
+# כמה שוטים נבדקים במקביל: התקרה של הגבול האדפטיבי של המודל (אותו client משותף כמו ב-02 וב-ChatService)
+MAX_WORKERS = adaptive_limiter("gemini", GEMINI_MODEL_NAME).max_limit
+
 # --- חוקי הברזל לוידאו (Physics & AI Artifacts Prevention) ---
 VIDEO_SAFETY_RULES = """
 1. NO MORPHING: Objects cannot change into other objects (e.g., a stick cannot become a snake).
@@ -24,18 +37,61 @@ VIDEO_SAFETY_RULES = """
 5. NO VIOLENCE/GORE: Strict safety policy.
 """
 
+# החלק הקבוע של ההנחיה - נשמר ב-context cache של Gemini לכל גרסת חוקים
+VIDEO_RULEBOOK = f"""
+ROLE: AI Video Production Supervisor for Kling Model.
+
+YOUR TASK: Review and Optimize the Video Generation Prompt.
+
+--- SAFETY & PHYSICS RULES ---
+{VIDEO_SAFETY_RULES}
+
+--- INSTRUCTIONS ---
+1. Check if the prompt asks for "Fast running" or complex fighting -> TONE IT DOWN to "Jogging" or "Tense stance" (Fast motion fails in AI).
+2. Ensure Camera movements are cinematic and simple.
+3. If the prompt contradicts the Start Frame logic -> Fix it.
+4. If the prompt is good -> Leave it unchanged.
+"""
+
+RULEBOOK_CACHE = GeminiContextCache(
+    GEMINI_MODEL_NAME, "video-rulebook", VIDEO_RULEBOOK,
+    ttl_minutes=config["pipeline"].get("rulebook_cache_ttl_minutes", 30),
+)
+
+# ledger: פרומפט וידאו שכבר עבר ללא שינוי תחת אותם חוקים ומודל לא נשלח שוב
+LEDGER = open_inspection_ledger(config)
+RULES_VERSION = RULEBOOK_CACHE.version
+
+def stage_fingerprint(shot, prompt):
+    # טביעת האצבע של הקלטים (build plan): הפרומפט אחרי הבדיקה, ה-brief, גרסת החוקים והמודל
+    return fingerprint(prompt=prompt, brief=shot["brief"], rules=RULES_VERSION, model=GEMINI_MODEL_NAME)
+
+def current_fingerprint(shot_id):
+    shot = store.get(shot_id)
+    path = shot["video"]["prompt_file"] if shot else None
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f: return stage_fingerprint(shot, f.read())
+
 def inspect_video_prompt(shot_id):
-    shot = shots.get(shot_id)
-    if not shot: return
+    """
+    בודק שוט בודד - רץ בתוך Thread. מחזיר תוצאה; השמירה ללוח נעשית ב-main.
+    """
+    shot = store.get(shot_id)
+    if not shot: return None
 
     # בדיקת קיום קובץ פרומפט לוידאו
     prompt_path = shot["video"]["prompt_file"]
     if not os.path.exists(prompt_path):
-        print(f"⚠️ Video prompt file missing for {shot_id}")
-        return
+        return {"id": shot_id, "status": "ERROR", "msg": "Video prompt file missing"}
 
     with open(prompt_path, "r", encoding="utf-8") as f: current_prompt = f.read()
 
+    # מסלול מהיר - אין קריאה למודל
+    if LEDGER.passed(current_prompt, RULES_VERSION, GEMINI_MODEL_NAME, "video"):
+        return {"id": shot_id, "status": "VIDEO_READY", "msg": f"Skipped: passed rules {RULES_VERSION} before",
+                "shot": shot, "original": current_prompt, "prompt": current_prompt, "verdict": None}
+
     # שליפת הקשר (Context) מהשוט המקורי
     visual_brief = shot['brief']['visual']
     motion_brief = shot['brief']['motion']
@@ -43,65 +99,101 @@ def inspect_video_prompt(shot_id):
     print(f"🛡️ Inspecting VIDEO prompt for {shot_id} using {GEMINI_MODEL_NAME}...")
     
     try:
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-        
-        sys_prompt = f"""
-        ROLE: AI Video Production Supervisor for Kling Model.
-        
-        YOUR TASK: Review and Optimize the Video Generation Prompt.
-        
-        --- SAFETY & PHYSICS RULES ---
-        {VIDEO_SAFETY_RULES}
-        
+        user_prompt = f"""
         --- CONTEXT ---
         ORIGINAL VISUAL: {visual_brief}
         REQUIRED MOTION: {motion_brief}
         
-        --- INSTRUCTIONS ---
-        1. Check if the prompt asks for "Fast running" or complex fighting -> TONE IT DOWN to "Jogging" or "Tense stance" (Fast motion fails in AI).
-        2. Ensure Camera movements are cinematic and simple.
-        3. If the prompt contradicts the Start Frame logic -> Fix it.
-        4. If the prompt is good -> Output it as is.
-        
-        OUTPUT ONLY THE FINAL OPTIMIZED PROMPT TEXT.
+        INPUT PROMPT:
+        {current_prompt}
+        {VERDICT_INSTRUCTIONS}
         """
-        
-        response = model.generate_content(f"{sys_prompt}\n\nINPUT PROMPT:\n{current_prompt}")
-        corrected_prompt = response.text.strip()
-        
-        # שמירה
-        with open(prompt_path, "w", encoding="utf-8") as f: f.write(corrected_prompt)
-        
-        # אישור
-        shot["video"]["status"] = "VIDEO_READY" # זה הסטטוס שמאותת למחולל הוידאו (06) להתחיל לעבוד
-        shot["video"]["inspector_feedback"] = f"Optimized by {GEMINI_MODEL_NAME}"
-        
-        # עדכון ה-DB
-        with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-            json.dump(shots, f, indent=4, ensure_ascii=False)
-            
-        print(f"✅ {shot_id} Video Prompt Optimized & Approved.")
+
+        def call():
+            text = generate_text(
+                GEMINI_MODEL_NAME, user_prompt,
+                response_mime_type="application/json",
+                response_schema=InspectionVerdict,
+                context_cache=RULEBOOK_CACHE,
+            )
+            apply_edits(current_prompt, InspectionVerdict.model_validate_json(text).edits)  # לא שומרים ב-cache תשובה פגומה
+            return text
+
+        # generate_text עושה retry עם backoff על שגיאות API; החוקים מגיעים מה-context cache
+        response_text = cached_response("gemini", GEMINI_MODEL_NAME, VIDEO_RULEBOOK, user_prompt, call, config=config)
+        verdict = InspectionVerdict.model_validate_json(response_text)
+
+        # unchanged -> הפרומפט כמו שהוא; edits -> רק השינויים. הקובץ וה-ledger נשמרים ב-commit_result
+        if verdict.verdict == "edits" and verdict.edits:
+            prompt = apply_edits(current_prompt, verdict.edits).strip()
+            msg = f"Optimized by {GEMINI_MODEL_NAME}: {', '.join(verdict.violated_rules) or 'rules'} ({len(verdict.edits)} edits)"
+        else:
+            prompt = current_prompt
+            msg = f"Checked by {GEMINI_MODEL_NAME}: unchanged"
+
+        return {"id": shot_id, "status": "VIDEO_READY", "msg": msg,
+                "shot": shot, "original": current_prompt, "prompt": prompt, "verdict": verdict}
         
     except Exception as e:
-        print(f"❌ Error inspecting {shot_id}: {e}")
+        return {"id": shot_id, "status": "ERROR", "msg": str(e)}
+
+def commit_result(res):
+    if res["status"] == "VIDEO_READY":
+        # הפרומפט המתוקן נכתב לקובץ זמני ומחליף את הקובץ רק אחרי שעדכון הלוח (CAS) הצליח
+        prompt_path = res["shot"]["video"]["prompt_file"]
+        changed = res["prompt"] != res["original"]
+        if changed:
+            tmp_path = f"{prompt_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f: f.write(res["prompt"])
+
+        # אישור + עדכון ה-DB מיד (checkpoint), רק אם השוט עדיין מחכה לבדיקה
+        committed = store.update_if(res["id"], {"video.status": "PROMPT_READY"}, {
+            "video.status": "VIDEO_READY", # זה הסטטוס שמאותת למחולל הוידאו (06) להתחיל לעבוד
+            "video.inspector_feedback": res["msg"],
+            "fingerprints.05": stage_fingerprint(res["shot"], res["prompt"]),
+        })
+        if committed is None:
+            # השוט זז בלוח בזמן הבדיקה (04 / review_board / ריצה אחרת) - לא מאשרים ולא נוגעים בפרומפט
+            if changed:
+                os.remove(tmp_path)
+            print(f"⚠️ {res['id']}: Changed on the board during inspection - not approved.")
+            progress.result("05", res["id"], "CONFLICT", error="Shot changed on the board during inspection")
+            return False
+        if changed:
+            os.replace(tmp_path, prompt_path)
+        if res["verdict"] is not None:
+            LEDGER.record(res["original"], RULES_VERSION, GEMINI_MODEL_NAME, "video", res["verdict"], res["id"])
+        print(f"✅ {res['id']} Video Prompt Optimized & Approved.")
+        progress.result("05", res["id"], "VIDEO_READY", path=prompt_path, msg=res["msg"])
+        return True
+    print(f"❌ Error inspecting {res['id']}: {res['msg']}")
+    progress.result("05", res["id"], "ERROR", error=res["msg"])
+    return False
 
 def main():
-    # בדיקת כמות עדכונים
-    updates = 0
-    
     # אופציה להרצה ידנית או אוטומטית
     print("running auto-scan for 'PROMPT_READY' video shots...")
     
-    for sid, data in shots.items():
-        # הוא בודק רק שוטים שסיימו את שלב הכתיבה (04) ומחכים לבדיקה
-        if data["video"]["status"] == "PROMPT_READY":
-            inspect_video_prompt(sid)
-            updates += 1
-            
-    if updates == 0:
+    # הוא בודק רק שוטים שסיימו את שלב הכתיבה (04) ומחכים לבדיקה
+    pending = store.ids_by_status("PROMPT_READY", stage="video")
+    if not pending:
         print("🤷 No video prompts waiting for inspection.")
-    else:
-        print(f"🏁 Finished inspecting {updates} video prompts.")
+        return
+
+    # בדיקת כמות עדכונים
+    updates = 0
+    # ספר החוקים מוחזק ב-context cache לכל אורך הריצה (TTL מתחדש) ונמחק בסוף
+    with RULEBOOK_CACHE, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(inspect_video_prompt, sid) for sid in pending]
+
+        for future in as_completed(futures):
+            res = future.result()
+            if res and commit_result(res):
+                updates += 1
+
+    print(f"💾 Response cache: {open_response_cache(config).summary()}")
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
+    print(f"🏁 Finished inspecting {updates} video prompts.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,7 +1,11 @@
 import os
+import sys
 import json
 import yaml
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+
 # --- הטקסטים המתוקנים (Hard Coded) ---
 FIXES = {
     # שוט 001: נשאר תקריב על הגחלים (בלי מירי) - לאווירה
@@ -25,41 +29,41 @@ def apply_fixes():
     
     # טעינת הגדרות
     with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-    shots_path = config["paths"]["shots_board"]
-    
-    with open(shots_path, "r", encoding="utf-8") as f: shots = json.load(f)
+    store = open_shot_store(config)
 
     for shot_id, new_prompt_text in FIXES.items():
-        if shot_id not in shots:
+        shot = store.get(shot_id)
+        if not shot:
             print(f"⚠️ Shot {shot_id} not found in board. Skipping.")
             continue
             
         print(f"🔧 Fixing {shot_id}...")
         
         # 1. עדכון קובץ הפרומפט
-        prompt_path = shots[shot_id]["stills"]["prompt_file"]
+        prompt_path = shot["stills"]["prompt_file"]
         os.makedirs(os.path.dirname(prompt_path), exist_ok=True)
         
         with open(prompt_path, "w", encoding="utf-8") as f:
             f.write(new_prompt_text)
             
         # 2. איפוס הסטטוס ל-APPROVED (כדי לדלג על בדיקה וללכת ישר ליצירה)
-        shots[shot_id]["stills"]["status"] = "APPROVED"
-        shots[shot_id]["stills"]["inspector_feedback"] = "Manually Fixed via Script (Mix Strategy)"
+        changes = {
+            "stills.status": "APPROVED",
+            "stills.inspector_feedback": "Manually Fixed via Script (Mix Strategy)",
+        }
         
         # 3. מחיקת רפרנס לתמונה ישנה (כדי להכריח יצירה מחדש)
-        if "image_path" in shots[shot_id]["stills"]:
-            old_path = shots[shot_id]["stills"]["image_path"]
+        if "image_path" in shot["stills"]:
+            old_path = shot["stills"]["image_path"]
             if old_path and os.path.exists(old_path):
                 try:
                     os.remove(old_path)
                     print(f"   🗑️ Deleted old image: {old_path}")
                 except: pass
-            shots[shot_id]["stills"]["image_path"] = None
+            changes["stills.image_path"] = None
 
-    # שמירה
-    with open(shots_path, "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
+        # שמירה
+        store.update(shot_id, changes)
         
     print("✅ All fixes applied successfully!")
     print("👉 Now run: 'python scripts/03_img_gen.py' and select these shots.")
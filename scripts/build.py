@@ -0,0 +1,146 @@
+import os
+import sys
+import argparse
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline_runner import ASSETS, SCENES, STAGE_SCRIPTS, config, has_image, run_pipeline, stage_module, store
+from utils.dep_index import open_dep_index
+from utils.fingerprints import INPUT_STATUS, plan_shot, stamp_changes
+
+# --- בנייה אינקרמנטלית (כמו make) ---
+# כל שלב שומר על השוט טביעת אצבע של הקלטים שלו (fingerprints.01 ... fingerprints.05).
+# plan: אילו שוטים/שלבים לא מעודכנים (למשל mood_keywords של סצנה או תיאור תלבושת ב-assets.yaml השתנו) ולמה.
+# build: מחזיר רק אותם לסטטוס הקלט של השלב ומריץ אותם (pipeline_runner) - בלי apply_critical_fixes ידני.
+# stamp: רושם את טביעות האצבע הנוכחיות לשלבים שרצו לפני שהיו טביעות אצבע (untracked), בלי להריץ.
+#
+#   python scripts/build.py plan
+#   python scripts/build.py build [--untracked] [--shots SHOT_001 ...]
+#   python scripts/build.py plan --affected MIRI_DIRTY_MUD   # רק השוטים שתלויים בנכס / סצנה
+#   python scripts/build.py stamp
+
+def read_text(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f: return f.read()
+
+def current_fingerprints(shot_id, shot):
+    """
+    פונקציה (stage) -> טביעת האצבע של הקלטים כרגע, או None אם הפלט של השלב חסר.
+    """
+    def current(stage):
+        scene = SCENES.get(shot["scene_ref"])
+        if stage == "01":
+            if scene is None or read_text(shot["stills"]["prompt_file"]) is None: return None
+            return stage_module("01").stage_fingerprint(shot, scene, ASSETS)
+        if stage == "02":
+            shot_input = stage_module("02").load_shot_input(shot_id, pending_only=False)
+            return stage_module("02").stage_fingerprint(shot_input) if shot_input else None
+        if stage == "03":
+            prompt = read_text(shot["stills"]["prompt_file"])
+            if prompt is None or not has_image(shot): return None
+            return stage_module("03").stage_fingerprint(prompt)
+        if stage == "04":
+            if scene is None or read_text(shot["video"]["prompt_file"]) is None: return None
+            return stage_module("04").stage_fingerprint(shot, scene)
+        if stage == "05":
+            return stage_module("05").current_fingerprint(shot_id)
+    return current
+
+def make_plan(shot_ids):
+    """
+    {shot_id: {track: {"stage", "reason", "reruns"}}} - רק שוטים שיש להם מה להריץ מחדש.
+    """
+    plan = {}
+    for sid in shot_ids:
+        shot = store.get(sid)
+        if not shot: continue
+        tracks = plan_shot(shot, current_fingerprints(sid, shot))
+        if tracks:
+            plan[sid] = tracks
+    return plan
+
+def print_plan(plan, untracked):
+    if not plan:
+        print("✅ Everything is up to date.")
+    for sid, tracks in plan.items():
+        for track, p in tracks.items():
+            print(f"🔁 {sid} {track}: {STAGE_SCRIPTS[p['stage']]} ({p['reason']}) -> re-runs {' '.join(p['reruns'])}")
+    counts = Counter(p["stage"] for tracks in plan.values() for p in tracks.values())
+    if counts:
+        print("📊 Stale: " + ", ".join(f"{stage}: {n}" for stage, n in sorted(counts.items())))
+    if untracked:
+        print(f"ℹ️ {untracked} shots ran stages before fingerprints were recorded (untracked) - "
+              f"'build.py stamp' records them as up to date, 'build.py build --untracked' rebuilds them.")
+
+def entry_stage(sid, tracks):
+    """
+    שלב הכניסה של השוט. מסלול התמונות קודם: הוידאו נבנה אחרי שהבמאי מאשר את התמונה החדשה.
+    """
+    if "stills" in tracks:
+        return tracks["stills"]["stage"]
+    stage = tracks["video"]["stage"]
+    if store.get(sid)["stills"]["status"] != "APPROVED":
+        print(f"⏸️ {sid}: video is stale but the still is not approved - skipped.")
+        return None
+    return stage
+
+def build(plan):
+    entry = {}
+    for sid, tracks in plan.items():
+        stage = entry_stage(sid, tracks)
+        if not stage: continue
+        # החזרה לסטטוס הקלט של השלב - רק אם השוט לא השתנה מאז ה-plan
+        track, status = INPUT_STATUS[stage]
+        shot = store.get(sid)
+        if store.update_if(sid, {f"{track}.status": shot[track]["status"]}, {f"{track}.status": status}) is None:
+            print(f"⚠️ {sid}: Changed on the board meanwhile - skipped.")
+            continue
+        entry[sid] = stage
+
+    if not entry:
+        print("✅ Nothing to build.")
+        return
+    run_pipeline(list(entry), list(STAGE_SCRIPTS), entry)
+
+def stamp(shot_ids):
+    stamped = 0
+    for sid in shot_ids:
+        shot = store.get(sid)
+        if not shot: continue
+        changes = stamp_changes(shot, current_fingerprints(sid, shot))
+        if changes:
+            store.update(sid, changes)
+            stamped += 1
+    print(f"🏷️ Recorded fingerprints for {stamped} shots.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Make-style incremental builds of the shot pipeline")
+    parser.add_argument("command", choices=["plan", "build", "stamp"])
+    parser.add_argument("--shots", nargs="+", help="shot ids (default: the whole board)")
+    parser.add_argument("--affected", help="only shots depending on this asset or scene ID")
+    parser.add_argument("--untracked", action="store_true", help="also rebuild stages that ran before fingerprints")
+    args = parser.parse_args()
+    shot_ids = args.shots or store.ids()
+    if args.affected:
+        affected = open_dep_index(config, store).affected_shots(args.affected)
+        print(f"🔗 {args.affected}: scenes {', '.join(affected['scenes']) or '-'} -> {len(affected['shots'])} shots")
+        shot_ids = [sid for sid in shot_ids if sid in set(affected["shots"])]
+
+    if args.command == "stamp":
+        stamp(shot_ids)
+        return
+
+    plan = make_plan(shot_ids)
+    untracked = sum(1 for tracks in plan.values() if any(p["reason"] == "untracked" for p in tracks.values()))
+    if not args.untracked:
+        plan = {sid: {t: p for t, p in tracks.items() if p["reason"] != "untracked"} for sid, tracks in plan.items()}
+        plan = {sid: tracks for sid, tracks in plan.items() if tracks}
+
+    if args.command == "plan":
+        print_plan(plan, 0 if args.untracked else untracked)
+    else:
+        build(plan)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
 import os
+import sys
 import yaml
+import json
+import time
+import hashlib
+import threading
 import anthropic
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.response_cache import cached_response, open_response_cache, response_key
+from utils.concurrency import adaptive_limiter
+from utils.rate_limiter import estimate_tokens, open_rate_limiter
+
 # טעינת מפתחות
 load_dotenv()
 
@@ -22,24 +32,190 @@ try:
         MODEL_NAME = config.get("models", {}).get("claude", "claude-3-5-sonnet-20241022")
 except Exception as e:
     print(f"⚠️ Warning: Could not load config.yaml ({e}). Using default model.")
+    config = None
     MODEL_NAME = "claude-3-5-sonnet-20241022"
 
 print(f"🧠 Claude Client initialized with model: {MODEL_NAME}")
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def get_claude_response(system_prompt, user_prompt):
+# מונים מצטברים של טוקנים (כולל prompt caching) לאורך כל הריצה
+_usage_lock = threading.Lock()
+USAGE_TOTALS = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+def get_claude_response(system_prompt, user_prompt, cache=False, max_tokens=1000, temperature=None, shared_context=None, label=None, validate=None):
     """
     פונקציה עוטפת ששולחת בקשה לקלוד עם ניהול שגיאות אוטומטי (Retry)
+    cache=True: אותם קלטים (מודל, system, user, temperature, max_tokens) מחזירים את התשובה השמורה בלי קריאה ל-API
+    shared_context: הקשר משותף לכמה שוטים (סצנה/נכסים) - נשלח אחרי ה-system הקבוע ולפני ההודעה, ושניהם מסומנים
+                    ל-prompt caching בצד של Anthropic, כך שהשוט הבא באותה סצנה משלם רק על ה-brief שלו
+    label: שם לשורת דיווח הטוקנים (למשל shot_id)
+    validate: פונקציה שמקבלת את הטקסט וזורקת חריגה אם הוא פגום - תשובה פגומה לא נשמרת ב-cache
+    """
+    request = build_request(system_prompt, user_prompt, max_tokens, temperature, shared_context)
+
+    def call():
+        text = _create_message(request, label)
+        if validate:
+            validate(text)
+        return text
+
+    if not cache:
+        return call()
+    return cached_response(
+        "anthropic", MODEL_NAME, _cache_system(system_prompt, shared_context), user_prompt, call,
+        temperature=temperature, max_tokens=max_tokens, config=config,
+    )
+
+def _cache_system(system_prompt, shared_context):
+    return system_prompt if not shared_context else f"{system_prompt}\n\n{shared_context}"
+
+def build_request(system_prompt, user_prompt, max_tokens=1000, temperature=None, shared_context=None):
+    """
+    פרמטרים ל-messages.create. החלקים הקבועים באים ראשונים, כל אחד עם נקודת cache:
+    1. ה-system הקבוע (זהה לכל השוטים)   2. ההקשר המשותף (זהה לכל שוטי הסצנה)
+    """
+    system = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+    if shared_context:
+        system.append({"type": "text", "text": shared_context, "cache_control": {"type": "ephemeral"}})
+    request = {
+        "model": MODEL_NAME,
+        "max_tokens": max_tokens,
+        "system": system,
+        "messages": [
+            {"role": "user", "content": user_prompt}
+        ],
+    }
+    if temperature is not None:
+        request["temperature"] = temperature
+    return request
+
+def record_usage(usage, label=None):
+    counts = {k: getattr(usage, k, None) or 0 for k in USAGE_TOTALS if k != "calls"}
+    with _usage_lock:
+        USAGE_TOTALS["calls"] += 1
+        for k, v in counts.items():
+            USAGE_TOTALS[k] += v
+    if label:
+        print(f"   🧮 {label}: input {counts['input_tokens']}, cache read {counts['cache_read_input_tokens']}, "
+              f"cache write {counts['cache_creation_input_tokens']}, output {counts['output_tokens']}")
+
+def reset_usage():
+    # warm worker (tools/worker_pool.py): המונים מתאפסים בתחילת כל עבודה, כדי שהסיכום יהיה של הריצה הזו בלבד
+    with _usage_lock:
+        for k in USAGE_TOTALS:
+            USAGE_TOTALS[k] = 0
+
+def usage_summary():
+    with _usage_lock:
+        t = dict(USAGE_TOTALS)
+    return (f"{t['calls']} calls | input {t['input_tokens']} | cache read {t['cache_read_input_tokens']} | "
+            f"cache write {t['cache_creation_input_tokens']} | output {t['output_tokens']}")
+
+def get_claude_responses_batch(items, cache=True, state_path=None, poll_interval=30):
     """
+    מצב batch (Message Batches API): כל הבקשות נשלחות כ-job אחד אסינכרוני במחיר batch, בלי ThreadPool ובלי rate limits.
+    items: {custom_id: {"system_prompt", "user_prompt", "shared_context"?, "max_tokens"?, "temperature"?}}
+    מחזיר generator של (custom_id, text, error) - תשובה אחרי תשובה, כדי שהסקריפט ישמור כל שוט מיד.
+    cache=True: תשובות שכבר שמורות ב-response cache חוזרות מיד ולא נכנסות ל-batch, ותוצאות ה-batch נשמרות בו.
+    state_path: קובץ שבו נשמר ה-batch_id - ריצה חוזרת אחרי קריסה ממשיכה לחכות לאותו batch במקום לשלוח שוב.
+    """
+    response_cache = open_response_cache(config) if cache else None
+    requests_by_id, cache_keys = {}, {}
+    for custom_id, item in items.items():
+        max_tokens = item.get("max_tokens", 1000)
+        temperature = item.get("temperature")
+        if response_cache:
+            key = response_key("anthropic", MODEL_NAME, _cache_system(item["system_prompt"], item.get("shared_context")),
+                               item["user_prompt"], temperature, max_tokens)
+            text = response_cache.get(key, "anthropic")
+            if text is not None:
+                yield custom_id, text, None
+                continue
+            cache_keys[custom_id] = key
+        requests_by_id[custom_id] = build_request(item["system_prompt"], item["user_prompt"], max_tokens, temperature, item.get("shared_context"))
+
+    if not requests_by_id:
+        return
+
+    for custom_id, text, error in run_batch(requests_by_id, state_path=state_path, poll_interval=poll_interval):
+        if text is not None and custom_id in cache_keys:
+            response_cache.put(cache_keys[custom_id], "anthropic", MODEL_NAME, text)
+        yield custom_id, text, error
+
+def params_hash(params):
+    # טביעת אצבע של בקשה (מודל, סיסטם, הקשר, פרומפט, max_tokens...) - כמו args_hash של עבודות fal ב-03
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def run_batch(requests_by_id, state_path=None, poll_interval=30):
+    """
+    שולח {custom_id: פרמטרים ל-messages.create} כ-Message Batch, מחכה לסיום ומחזיר generator של (custom_id, text, error).
+    """
+    batch_id = None
+    hashes = {custom_id: params_hash(params) for custom_id, params in requests_by_id.items()}
+    if state_path and os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        # גם אם חלק מהשוטים כבר נשמרו לפני הקריסה, ה-batch הקודם עדיין מכסה את כל השאר -
+        # אבל רק אם כל בקשה זהה לזו שנשלחה בו (brief / סיסטם פרומפט / מודל שהשתנו = batch חדש)
+        saved = state.get("requests", {})
+        if all(saved.get(custom_id) == h for custom_id, h in hashes.items()):
+            batch_id = state["batch_id"]
+            print(f"♻️ Resuming batch {batch_id} (no new submit)...")
+        else:
+            print(f"⚠️ Saved batch {state.get('batch_id')} was sent with different requests - submitting a new batch.")
+            os.remove(state_path)
+
+    if not batch_id:
+        batch = client.messages.batches.create(requests=[
+            {"custom_id": custom_id, "params": params} for custom_id, params in requests_by_id.items()
+        ])
+        batch_id = batch.id
+        print(f"📦 Batch {batch_id} submitted with {len(requests_by_id)} requests.")
+        if state_path:
+            os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump({"batch_id": batch_id, "requests": hashes, "submitted_at": time.time()}, f)
+
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            break
+        counts = batch.request_counts
+        print(f"⏳ Batch {batch_id}: {counts.processing} processing, {counts.succeeded} done, {counts.errored} errored...")
+        time.sleep(poll_interval)
+
+    for entry in client.messages.batches.results(batch_id):
+        if entry.custom_id not in requests_by_id:
+            continue
+        result = entry.result
+        if result.type == "succeeded":
+            record_usage(result.message.usage, entry.custom_id)
+            yield entry.custom_id, result.message.content[0].text, None
+        elif result.type == "errored":
+            yield entry.custom_id, None, str(getattr(result.error, "error", result.error))
+        else:  # canceled / expired
+            yield entry.custom_id, None, result.type
+
+    if state_path and os.path.exists(state_path):
+        os.remove(state_path)
+
+def response_cache_summary():
+    return open_response_cache(config).summary()
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def _create_message(request, label=None):
     try:
-        response = client.messages.create(
-            model=MODEL_NAME,
-            max_tokens=1000,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": user_prompt}
-            ]
+        # מכסת RPM/TPM של החשבון, משותפת לכל התהליכים (סקריפטים, app.py, main.py) - הערכה לפני, תיקון לפי השימוש בפועל
+        reservation = open_rate_limiter(config).acquire(
+            "anthropic", request["model"],
+            estimate_tokens(request["system"], request["messages"]) + request["max_tokens"],
         )
+        # מקביליות אדפטיבית (AIMD) לכל מודל - 429/529 מורידים את הגבול, הצלחות מעלות אותו
+        with adaptive_limiter("anthropic", request["model"]).slot():
+            response = client.messages.create(**request)
+        usage = response.usage
+        reservation.settle((usage.input_tokens or 0) + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+                           + (usage.output_tokens or 0))
+        record_usage(response.usage, label)
         return response.content[0].text
     except Exception as e:
         print(f"❌ Claude API Error: {e}")
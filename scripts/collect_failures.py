@@ -1,5 +1,8 @@
 import os
-import shutil
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.downloader import sync_links
 
 def collect_failures_for_upload():
     # הגדרות נתיבים
@@ -13,12 +16,8 @@ def collect_failures_for_upload():
         print(f"❌ Error: Could not find folder '{source_root}'")
         return
 
-    # ניקוי תיקיית היעד
-    if os.path.exists(dest_dir):
-        shutil.rmtree(dest_dir)
-    os.makedirs(dest_dir)
-    
-    count = 0
+    # תיקיית היעד מתעדכנת בהדרגה (בלי rmtree): רק קבצים חדשים/שהשתנו מקושרים מחדש
+    entries = {}
     print(f"🚀 Flattening files to: {dest_dir} ...\n")
 
     # סריקה
@@ -34,11 +33,13 @@ def collect_failures_for_upload():
                 parent_folder = os.path.basename(root)
                 new_filename = f"{parent_folder}_{file}"
                 
-                dest_path = os.path.join(dest_dir, new_filename)
-                
-                shutil.copy2(src_path, dest_path)
-                print(f"   📄 Copied: {new_filename}")
-                count += 1
+                entries[new_filename] = src_path
+
+    counts = sync_links(entries, dest_dir)
+    for mode in ("hardlink", "symlink", "copy", "unchanged", "removed"):
+        if counts.get(mode):
+            print(f"   📄 {mode}: {counts[mode]}")
+    count = len(entries)
 
     print(f"\n✅ Done! {count} failure files are ready.")
     print(f"👉 Go to folder: {dest_dir}")
@@ -1,13 +1,18 @@
 import os
+import sys
 import json
 import yaml
 import re
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+
 def enforce_proximity():
     print("🔍 Inspecting prompts for 'Distance' issues...")
     
     with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-    with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+    store = open_shot_store(config)
+    shots = store.all()
 
     changed_count = 0
 
@@ -38,13 +43,9 @@ def enforce_proximity():
                 f.write(new_prompt)
             
             # מסמנים שהשוט מוכן ליצירה מחדש
-            data["stills"]["status"] = "APPROVED" 
+            store.update(shot_id, {"stills.status": "APPROVED"})
             changed_count += 1
 
-    # שמירת הלוח
-    with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
-
     print(f"\n✅ Updated {changed_count} prompts to be closer to camera.")
     print("👉 Now run 'python scripts/03_img_gen.py' to generate the zoomed-in versions.")
 
@@ -1,7 +1,11 @@
 import os
+import sys
 import json
 import yaml
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
+
 # --- המילון שמכיל את התיקונים לכל הבעיות שעלו בדוח ---
 REPAIRS = {
     # תיקון גחלים מרחפות - הוספת אפר ומגע פיזי
@@ -23,34 +27,34 @@ def apply_bulk_fixes():
     print("🚑 Applying BULK FIXES based on User Report...")
     
     with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-    shots_path = config["paths"]["shots_board"]
-    
-    with open(shots_path, "r", encoding="utf-8") as f: shots = json.load(f)
+    store = open_shot_store(config)
 
     for shot_id, new_prompt in REPAIRS.items():
-        if shot_id in shots:
+        shot = store.get(shot_id)
+        if shot:
             print(f"🔧 Fixing {shot_id}...")
             
             # 1. עדכון קובץ הפרומפט
-            prompt_path = shots[shot_id]["stills"]["prompt_file"]
+            prompt_path = shot["stills"]["prompt_file"]
             with open(prompt_path, "w", encoding="utf-8") as f:
                 f.write(new_prompt)
             
             # 2. איפוס סטטוס ל-APPROVED (מוכן ליצירה)
-            shots[shot_id]["stills"]["status"] = "APPROVED"
-            shots[shot_id]["stills"]["inspector_feedback"] = "Fixed via Bulk Script (Identity & Physics)"
+            changes = {
+                "stills.status": "APPROVED",
+                "stills.inspector_feedback": "Fixed via Bulk Script (Identity & Physics)",
+            }
             
             # 3. מחיקת תמונה ישנה כדי להכריח יצירה מחדש
-            old_img = shots[shot_id]["stills"].get("image_path")
+            old_img = shot["stills"].get("image_path")
             if old_img and os.path.exists(old_img):
                 try:
                     os.remove(old_img)
                     print(f"   🗑️ Deleted old failure image.")
                 except: pass
-            shots[shot_id]["stills"]["image_path"] = None
+            changes["stills.image_path"] = None
 
-    with open(shots_path, "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
+            store.update(shot_id, changes)
         
     print("\n✅ All fixes applied. The shots are now marked APPROVED.")
     print("👉 Now run: 'python scripts/03_img_gen.py' to generate the corrected versions.")
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.job_queue import open_job_queue
+from tools.scheduler import SCRIPTS, scheduler_from_config
+
+# --- מתזמן העבודות: מריץ את עבודות 03 / 04 / 05 מהתור הקבוע (utils/job_queue.py) דרך ה-wrapper ---
+# הצ'אט וה-Chainlit רק מכניסים עבודות לתור; עבודה זהה שכבר ממתינה / רצה לא נכנסת פעמיים.
+# אפשר להריץ כמה מתזמנים במקביל (גם זה שבתוך האפליקציה, jobs.embedded) - כל עבודה נלקחת ב-lease ע"י אחד בלבד.
+#
+#   python scripts/job_scheduler.py                                  # דמון: רץ עד Ctrl+C
+#   python scripts/job_scheduler.py --once                           # מריץ את כל מה שמוכן ויוצא
+#   python scripts/job_scheduler.py --enqueue 03_img_gen.py 1-5      # ריצה ידנית דרך התור
+#   python scripts/job_scheduler.py --status                         # ספירה לפי סטטוס + העבודות האחרונות
+#   python scripts/job_scheduler.py --retry 12                       # החזרת עבודה מה-dead-letter לתור
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def print_status(queue):
+    print(f"📋 Jobs: {queue.counts() or 'none'}")
+    for job in queue.jobs(limit=10):
+        line = f"   #{job['id']} {job['status']:<8} {job['script']} {' '.join(job['args'])} (attempts {job['attempts']}/{job['max_attempts']})"
+        if job["error"]:
+            line += f" - {job['error']}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the queued generation jobs")
+    parser.add_argument("--once", action="store_true", help="run the ready jobs and exit")
+    parser.add_argument("--enqueue", nargs="+", metavar=("SCRIPT", "ARGS"), help="queue a stage run instead of running it")
+    parser.add_argument("--priority", type=int, default=0, help="priority of --enqueue (higher runs first)")
+    parser.add_argument("--status", action="store_true", help="show the queue")
+    parser.add_argument("--retry", type=int, metavar="JOB_ID", help="requeue a dead-lettered job")
+    args = parser.parse_args()
+    queue = open_job_queue()
+
+    if args.enqueue:
+        script, script_args = args.enqueue[0], args.enqueue[1:]
+        if script not in SCRIPTS:
+            sys.exit(f"❌ {script} does not run through the queue (only {', '.join(SCRIPTS)})")
+        job_id, new = queue.enqueue(script, script_args, priority=args.priority)
+        print(f"📥 Job #{job_id} {'queued' if new else 'already queued (same script and args)'}.")
+        return
+    if args.retry:
+        print(f"🔁 Job #{args.retry} requeued." if queue.retry(args.retry) else f"⚠️ Job #{args.retry} is not dead-lettered.")
+        return
+    if args.status:
+        print_status(queue)
+        return
+
+    scheduler = scheduler_from_config()
+    if args.once:
+        ran = scheduler.drain()
+        print(f"🏁 Ran {ran} jobs.")
+        print_status(queue)
+        return
+
+    print(f"⏱️ Scheduler running with {scheduler.workers} workers (Ctrl+C to stop)...")
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping - waiting for the running jobs to finish...")
+        scheduler.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import os
-import shutil
+import sys
 import yaml
 import json
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.downloader import sync_links
+
 def collect_all_latest_images():
     print("🧹 Starting Image Collection Service...")
 
@@ -15,19 +18,20 @@ def collect_all_latest_images():
     # תיקיית היעד (התיקייה השטוחה החדשה)
     dest_dir = "production/for_upload"
     
-    # מחיקה ויצירה מחדש של תיקיית היעד (כדי שלא יהיו שם זבלים ישנים)
-    if os.path.exists(dest_dir):
-        shutil.rmtree(dest_dir)
-    os.makedirs(dest_dir)
-    
+    # לא מוחקים ובונים מחדש: מעדכנים רק מה שהשתנה, ו-sync_links מסיר זבלים ישנים
     print(f"📂 Scanning: {source_root}")
     print(f"🎯 Target: {dest_dir}\n")
 
-    count = 0
+    entries = {}
     
+    # ה-cache של הרינדורים (production/images/_cache) לא נאסף
+    cache_dir = os.path.normpath(config["paths"].get("image_cache", os.path.join(source_root, "_cache")))
+
     # מעבר על כל התיקיות
     for root, dirs, files in os.walk(source_root):
-        for file in files:
+        # סדר קבוע, כדי ששמות ה-duplicate יישארו יציבים בין ריצות
+        dirs[:] = sorted(d for d in dirs if os.path.normpath(os.path.join(root, d)) != cache_dir)
+        for file in sorted(files):
             if file.lower().endswith(('.jpg', '.jpeg', '.png')):
                 # מצאנו תמונה!
                 full_path = os.path.join(root, file)
@@ -38,17 +42,18 @@ def collect_all_latest_images():
                 
                 new_filename = file
                 
-                # העתקה לתיקייה השטוחה
-                dest_path = os.path.join(dest_dir, new_filename)
-                
                 # אם כבר יש קובץ כזה (משוט אחר אולי?), נוסיף לו מספר
-                if os.path.exists(dest_path):
+                if new_filename in entries:
                     name, ext = os.path.splitext(new_filename)
-                    dest_path = os.path.join(dest_dir, f"{name}_duplicate_{count}{ext}")
+                    new_filename = f"{name}_duplicate_{len(entries)}{ext}"
                 
-                shutil.copy2(full_path, dest_path)
-                print(f"✅ Collected: {new_filename}")
-                count += 1
+                entries[new_filename] = full_path
+
+    # קישור (hardlink/symlink) לתיקייה השטוחה במקום העתקה
+    counts = sync_links(entries, dest_dir)
+    print(f"✅ Collected: {counts.get('hardlink', 0) + counts.get('symlink', 0) + counts.get('copy', 0)} new/changed, "
+          f"{counts.get('unchanged', 0)} unchanged, {counts.get('removed', 0)} removed")
+    count = len(entries)
 
     print(f"\n🎉 Done! {count} images are waiting for you in:")
     print(f"👉 {os.path.abspath(dest_dir)}")
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import yaml
+import time
+import queue
+import argparse
+import threading
+import importlib.util
+from contextlib import ExitStack
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPTS_DIR))
+from utils.shot_store import open_shot_store
+from utils.concurrency import concurrency_summary
+
+# --- הרצה זורמת לפי שוט: 01 -> 02 -> 03 -> 04 -> 05 ---
+# במקום לחכות שכל שלב יסיים את כל הלוח, כל שוט עובר לשלב הבא ברגע שסיים את הקודם.
+# כל שלב: תור חסום (backpressure) + מספר workers משלו. הסטטוסים בלוח הם אלה של הסקריפטים עצמם,
+# וכל שמירה נעשית ע"י פונקציות השלב (update_if) - אפשר להריץ במקביל את review_board או סקריפט בודד.
+#
+#   python scripts/pipeline_runner.py                     # כל השלבים, כל הלוח
+#   python scripts/pipeline_runner.py --stages 01 02 03   # רק מסלול התמונות
+#   python scripts/pipeline_runner.py --shots SHOT_001 SHOT_002
+
+with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
+store = open_shot_store(config)
+with open(config["paths"]["scenes_db"], "r", encoding="utf-8") as f: SCENES = json.load(f)
+with open(config["paths"]["assets"], "r", encoding="utf-8") as f: ASSETS = yaml.safe_load(f)
+
+STAGE_SCRIPTS = {
+    "01": "01_stills_prompt_creator",
+    "02": "02_stills_inspect",
+    "03": "03_img_gen",
+    "04": "04_video_prompt_creator",
+    "05": "05_video_inspect",
+}
+DEFAULT_WORKERS = {"01": 3, "02": 4, "03": 16, "04": 3, "05": 8}
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+def stage_module(name):
+    """
+    טוען את סקריפט השלב כמודול (פעם אחת) - משתמשים באותן פונקציות של שוט בודד כמו ה-main שלו.
+    """
+    with _modules_lock:
+        if name not in _modules:
+            path = os.path.join(SCRIPTS_DIR, STAGE_SCRIPTS[name] + ".py")
+            spec = importlib.util.spec_from_file_location(f"stage_{name}", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _modules[name] = module
+        return _modules[name]
+
+def has_image(shot):
+    path = (shot["stills"].get("image_path") or "").replace("\\", "/")
+    return bool(path) and os.path.exists(path)
+
+def next_stage(shot, stages, after=None):
+    """
+    השלב הבא של השוט לפי הסטטוסים שלו (אותם תנאים כמו בבחירת השוטים של כל סקריפט).
+    APPROVED בתמונות הוא גם "פרומפט אושר" (02) וגם "תמונה אושרה" (review_board):
+    שוט שאושר ב-02 בריצה הזו ממשיך ל-03; שוט שנכנס כ-APPROVED עם תמונה קיימת נחשב מאושר ע"י הבמאי.
+    """
+    stills, video = shot["stills"]["status"], shot["video"]["status"]
+    eligible = {
+        "01": stills == "PENDING",
+        "02": stills == "PROMPT_READY",
+        "03": stills == "APPROVED" and (after == "02" or not has_image(shot)),
+        "04": stills == "APPROVED" and video == "READY_FOR_PROMPT",
+        "05": video == "PROMPT_READY",
+    }
+    for name in stages:
+        if (after is None or name > after) and eligible[name]:
+            return name
+    return None
+
+# --- שלבים: כל אחד מקבל רשימת שוטים ומחזיר {shot_id: האם התקדם} ---
+
+def run_01(shot_ids):
+    m = stage_module("01")
+    done = {}
+    for sid in shot_ids:
+        shot = store.get(sid)
+        scene = SCENES.get(shot["scene_ref"])
+        if not scene:
+            print(f"⚠️ {sid}: Scene {shot['scene_ref']} not found - skipped.")
+            done[sid] = False
+            continue
+        _, prompt = m.generate_prompt_for_shot(sid, shot, scene, ASSETS)
+        done[sid] = bool(prompt) and m.save_prompt(store, {sid: shot}, sid, prompt, m.stage_fingerprint(shot, scene, ASSETS))
+    return done
+
+def run_02(shot_ids):
+    m = stage_module("02")
+    shot_inputs = [i for i in (m.load_shot_input(sid) for sid in shot_ids) if i]
+    results = [m.skipped_result(i) for i in shot_inputs if m.already_passed(i)]
+    skipped = {r["id"] for r in results}
+    to_inspect = [i for i in shot_inputs if i["id"] not in skipped]
+    if to_inspect:
+        results += [r for r in m.process_batch(to_inspect) if r]
+    approved = {r["id"] for r in results if m.commit_result(r)}
+    return {sid: sid in approved for sid in shot_ids}
+
+def run_03(shot_ids):
+    m = stage_module("03")
+    engine = m.FalJobEngine(
+        max_submissions=1,
+        max_downloads=1,
+        on_submitted=m.on_submitted,
+        on_event=m.on_event,
+        on_done=m.on_done,
+    )
+    done = {}
+    for sid in shot_ids:
+        prepared = m.prepare_shot(sid)
+        if isinstance(prepared, m.FalJob):
+            engine.run_sync([prepared])  # on_done שומר את התוצאה בלוח
+        elif prepared:
+            m.report_result(prepared)
+        done[sid] = store.get(sid)["stills"]["status"] == "IMAGE_READY"
+    return done
+
+def run_04(shot_ids):
+    m = stage_module("04")
+    done = {}
+    for sid in shot_ids:
+        shot = store.get(sid)
+        scene = SCENES[shot["scene_ref"]]
+        _, prompt = m.generate_video_prompt(sid, shot, scene)
+        done[sid] = bool(prompt) and m.save_video_prompt(store, {sid: shot}, sid, prompt, m.stage_fingerprint(shot, scene))
+    return done
+
+def run_05(shot_ids):
+    m = stage_module("05")
+    done = {}
+    for sid in shot_ids:
+        res = m.inspect_video_prompt(sid)
+        done[sid] = bool(res) and m.commit_result(res)
+    return done
+
+STAGE_RUNNERS = {"01": run_01, "02": run_02, "03": run_03, "04": run_04, "05": run_05}
+
+class PipelineRunner:
+    def __init__(self, stages, workers, queue_size):
+        self.stages = stages
+        self.workers = workers
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in stages}
+        self.stats = {name: {"done": 0, "failed": 0} for name in stages}
+        self.started = {}
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def put(self, stage, shot_id):
+        # הספירה עולה לפני ה-put, כדי שהריצה לא תיגמר בזמן ששוט עובר בין שלבים
+        with self.cond:
+            self.in_flight += 1
+        self.queues[stage].put(shot_id)  # נחסם כשהתור של השלב מלא (backpressure)
+
+    def finished(self, count):
+        with self.cond:
+            self.in_flight -= count
+            if self.in_flight == 0:
+                self.cond.notify_all()
+
+    def take(self, stage):
+        """
+        שוט אחד מהתור; ב-02 גם שוטים נוספים שכבר מחכים (עד inspect_batch_size) - בקשת Gemini אחת.
+        """
+        shot_id = self.queues[stage].get()
+        if shot_id is None:
+            return None
+        batch = [shot_id]
+        max_batch = config["pipeline"].get("inspect_batch_size", 8) if stage == "02" else 1
+        while len(batch) < max_batch:
+            try:
+                extra = self.queues[stage].get_nowait()
+            except queue.Empty:
+                break
+            if extra is None:
+                self.queues[stage].put(None)
+                break
+            batch.append(extra)
+        return batch
+
+    def route(self, shot_id, after):
+        shot = store.get(shot_id)
+        stage = next_stage(shot, self.stages, after) if shot else None
+        if stage:
+            self.put(stage, shot_id)
+        elif shot:
+            elapsed = time.time() - self.started[shot_id]
+            print(f"🏁 {shot_id}: stills {shot['stills']['status']} / video {shot['video']['status']} ({elapsed:.0f}s)")
+
+    def worker(self, stage):
+        while True:
+            batch = self.take(stage)
+            if batch is None:
+                return
+            try:
+                try:
+                    done = STAGE_RUNNERS[stage](batch)
+                except Exception as e:
+                    print(f"❌ Stage {stage} failed for {', '.join(batch)}: {e}")
+                    done = {}
+                for shot_id in batch:
+                    with self.cond:
+                        self.stats[stage]["done" if done.get(shot_id) else "failed"] += 1
+                    if done.get(shot_id):
+                        self.route(shot_id, stage)
+                    else:
+                        print(f"⛔ {shot_id}: Stopped at stage {stage} (status unchanged, rerun to retry).")
+            finally:
+                self.finished(len(batch))
+
+    def run(self, shot_ids, entry=None):
+        """
+        entry: {shot_id: stage} - שלב כניסה מפורש (scripts/build.py), במקום הבחירה לפי הסטטוס.
+        """
+        entry = entry or {}
+        threads = []
+        for stage in self.stages:
+            for _ in range(self.workers.get(stage, DEFAULT_WORKERS[stage])):
+                t = threading.Thread(target=self.worker, args=(stage,), daemon=True)
+                t.start()
+                threads.append((stage, t))
+
+        # הזנה: כל שוט נכנס לשלב שמתאים לסטטוס הנוכחי שלו
+        for shot_id in shot_ids:
+            stage = entry.get(shot_id) or next_stage(store.get(shot_id), self.stages)
+            if stage:
+                self.started[shot_id] = time.time()
+                self.put(stage, shot_id)
+
+        with self.cond:
+            while self.in_flight:
+                self.cond.wait()
+        for stage, _ in threads:
+            self.queues[stage].put(None)
+        for _, t in threads:
+            t.join()
+        return self.stats
+
+def run_pipeline(shot_ids, stages, entry=None):
+    """
+    מריץ את השוטים דרך השלבים (משותף ל-main ול-scripts/build.py) ומדפיס סיכום.
+    """
+    all_shots = store.all()
+    shot_ids = [sid for sid in shot_ids if sid in all_shots]
+    # שוטים של אותה סצנה ברצף (prompt cache חם ב-01/04)
+    shot_ids.sort(key=lambda sid: (all_shots[sid]["scene_ref"], sid))
+
+    runner = PipelineRunner(
+        stages,
+        workers=config["pipeline"].get("runner_workers", {}),
+        queue_size=config["pipeline"].get("runner_queue_size", 8),
+    )
+    print(f"🚀 Streaming {len(shot_ids)} shots through stages {' -> '.join(stages)}...")
+    start = time.time()
+
+    # ספרי החוקים של 02/05 מוחזקים ב-context cache לכל אורך הריצה
+    with ExitStack() as stack:
+        for name in ("02", "05"):
+            if name in stages:
+                stack.enter_context(stage_module(name).RULEBOOK_CACHE)
+        stats = runner.run(shot_ids, entry)
+
+    for stage in stages:
+        print(f"📊 {STAGE_SCRIPTS[stage]}: {stats[stage]['done']} done, {stats[stage]['failed']} stopped")
+    if "03" in stages:
+        evicted = stage_module("03").IMAGE_CACHE.evict()
+        if evicted:
+            print(f"🧹 Evicted {evicted} old renders from the image cache.")
+    if "01" in stages or "04" in stages:
+        from claude_client import response_cache_summary, usage_summary
+        print(f"💾 Response cache: {response_cache_summary()}")
+        print(f"🧮 Claude tokens: {usage_summary()}")
+    print(f"🎚️ Concurrency: {concurrency_summary()}")
+    print(f"🏁 Pipeline finished in {time.time() - start:.0f}s.")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-shot streaming pipeline (01 -> 05)")
+    parser.add_argument("--stages", nargs="+", default=list(STAGE_SCRIPTS), choices=list(STAGE_SCRIPTS))
+    parser.add_argument("--shots", nargs="+", help="shot ids (default: the whole board)")
+    args = parser.parse_args()
+    run_pipeline(args.shots or store.ids(), sorted(set(args.stages)))
+
+if __name__ == "__main__":
+    main()
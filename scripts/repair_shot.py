@@ -1,17 +1,30 @@
 import os
+import sys
 import json
 import yaml
-import fal_client
-import requests
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import ConflictError, open_shot_store
+from utils.fal_engine import FalJobEngine
+from utils.downloader import download_file
+from utils.upload_cache import cached_upload
+
 load_dotenv()
 
 with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
+store = open_shot_store(config)
+
+def on_fal_event(job, event, **info):
+    if event == "queued":
+        print(f"   ⏳ In fal queue (position {info['position']})")
+
+# אותו מנוע תורים של fal כמו ב-03 (סטטוס תור במקום המתנה עיוורת)
+engine = FalJobEngine(on_event=on_fal_event)
 
 def repair_shot(shot_id):
-    shot = shots.get(shot_id)
+    # שומרים את הגרסה שראינו, כדי לא לדרוס שינויים שנעשו בזמן התיקון
+    shot, rev = store.get_with_rev(shot_id)
     current_img = shot["stills"]["image_path"]
     
     if not current_img or not os.path.exists(current_img):
@@ -26,7 +39,7 @@ def repair_shot(shot_id):
     choice = input("Choice (1/2): ").strip()
     
     mask_url = None
-    img_url = fal_client.upload_file(current_img)
+    img_url = cached_upload(current_img, config)
     
     prompt = input("Enter Inpaint Prompt (What should be there?): ")
 
@@ -35,10 +48,10 @@ def repair_shot(shot_id):
         what_to_fix = input("What object to fix? (e.g., 'the right hand'): ")
         print("🤖 Generating AI Mask...")
         
-        res = fal_client.submit("fal-ai/segment-anything", arguments={
+        res = engine.run_one("fal-ai/segment-anything", {
             "image_url": img_url,
             "prompt": what_to_fix
-        }).get()
+        })
         
         if res and 'mask' in res:
             mask_url = res['mask']['url']
@@ -51,7 +64,7 @@ def repair_shot(shot_id):
         # --- אופציה 2: מסיכה ידנית ---
         mask_path = input("Enter path to mask file (PNG): ").strip()
         if os.path.exists(mask_path):
-            mask_url = fal_client.upload_file(mask_path)
+            mask_url = cached_upload(mask_path, config)
         else:
             print("❌ Mask file not found.")
             return
@@ -69,23 +82,24 @@ def repair_shot(shot_id):
     
     # הסרנו את ה-LoRA מהארגומנטים אם הוא לא קיים בקונפיג
     # כאן אנחנו משתמשים במודל Inpainting ייעודי
-    res = fal_client.submit("fal-ai/flux-lora/inpainting", arguments=args).get()
+    res = engine.run_one("fal-ai/flux-lora/inpainting", args)
     
     # שמירת התוצאה
     new_url = res["images"][0]["url"]
     save_path = current_img.replace(".jpg", "_fixed.jpg")
     
-    with open(save_path, "wb") as f:
-        f.write(requests.get(new_url).content)
+    download_file(new_url, save_path)
         
     print(f"✨ Repair Saved: {save_path}")
     
     # שאל אם לעדכן את הדאטה
     if input("Update Shot Data to use this file? (y/n): ") == 'y':
-        shot["stills"]["image_path"] = save_path
-        with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-            json.dump(shots, f, indent=4, ensure_ascii=False)
-        print("✅ Database Updated.")
+        try:
+            store.update(shot_id, {"stills.image_path": save_path}, expected_rev=rev)
+            print("✅ Database Updated.")
+        except ConflictError:
+            print(f"⚠️ {shot_id} was changed by another process during the repair. Database NOT updated.")
+            print(f"   The repaired image is still at: {save_path}")
 
 if __name__ == "__main__":
     sid = input("Enter Shot ID to Repair: ").strip()
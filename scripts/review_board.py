@@ -2,28 +2,29 @@ import streamlit as st
 import json
 import yaml
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import ConflictError, open_shot_store
+from utils.dep_index import open_dep_index
 
 # הגדרת עמוד
 st.set_page_config(layout="wide", page_title="Director's Cut Board")
 
 def load_data():
     with open("config.yaml", "r", encoding="utf-8") as f: config = yaml.safe_load(f)
-    with open(config["paths"]["shots_board"], "r", encoding="utf-8") as f: shots = json.load(f)
-    return config, shots
-
-def save_shots(shots, config):
-    with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
-        json.dump(shots, f, indent=4, ensure_ascii=False)
+    return config, open_shot_store(config)
 
-config, shots = load_data()
+config, store = load_data()
 
 # --- סטטיסטיקות בצד (Sidebar) ---
-total = len(shots)
-# ספירת סטטוסים
-img_ready = len([s for s in shots.values() if s["stills"].get("status") == "IMAGE_READY"])
-approved = len([s for s in shots.values() if s["stills"].get("status") == "APPROVED"])
-rejected = len([s for s in shots.values() if s["stills"].get("status") == "REJECTED"])
-waiting_gen = len([s for s in shots.values() if s["stills"].get("status") == "PROMPT_READY"])
+# ספירת סטטוסים (שאילתה אחת על האינדקס, בלי לטעון את כל הלוח)
+counts = store.status_counts()
+total = sum(counts.values())
+img_ready = counts.get("IMAGE_READY", 0)
+approved = counts.get("APPROVED", 0)
+rejected = counts.get("REJECTED", 0)
+waiting_gen = counts.get("PROMPT_READY", 0)
 
 st.sidebar.title("📊 Production Status")
 st.sidebar.progress(approved / total if total > 0 else 0)
@@ -41,10 +42,10 @@ if waiting_gen > 0:
 # --- גוף ראשי ---
 st.title("🎬 Director's Review Board")
 
-mode = st.radio("Select Mode:", ["👀 Review Queue", "✅ Approved Gallery", "📋 All Data"], horizontal=True)
+mode = st.radio("Select Mode:", ["👀 Review Queue", "✅ Approved Gallery", "🔗 Dependencies", "📋 All Data"], horizontal=True)
 
 if mode == "👀 Review Queue":
-    to_review = [sid for sid, s in shots.items() if s["stills"].get("status") == "IMAGE_READY"]
+    to_review = store.ids_by_status("IMAGE_READY")
     
     if not to_review:
         st.success("🎉 הכל נקי! אין תמונות שמחכות לביקורת.")
@@ -53,7 +54,10 @@ if mode == "👀 Review Queue":
     else:
         # לוקחים את הראשון בתור
         shot_id = to_review[0]
-        shot = shots[shot_id]
+        shot, rev = store.get_with_rev(shot_id)
+        # הגרסה שהבמאי ראה על המסך (נשמרת בין ריצות של streamlit)
+        seen_revs = st.session_state.setdefault("seen_revs", {})
+        seen_rev = seen_revs.get(shot_id, rev)
         
         col1, col2 = st.columns([2, 1])
         
@@ -81,26 +85,54 @@ if mode == "👀 Review Queue":
                 
                 if st.form_submit_button("Submit Decision"):
                     if status == "Approve":
-                        shots[shot_id]["stills"]["status"] = "APPROVED"
-                        st.balloons()
+                        changes = {"stills.status": "APPROVED"}
                     else:
-                        shots[shot_id]["stills"]["status"] = "REJECTED"
-                        shots[shot_id]["stills"]["inspector_feedback"] = notes
-                    
-                    save_shots(shots, config)
-                    st.rerun()
+                        changes = {
+                            "stills.status": "REJECTED",
+                            "stills.inspector_feedback": notes,
+                        }
+
+                    try:
+                        store.update(shot_id, changes, expected_rev=seen_rev)
+                        seen_revs.pop(shot_id, None)
+                        if status == "Approve":
+                            st.balloons()
+                        st.rerun()
+                    except ConflictError:
+                        # המסך כבר מציג את הגרסה העדכנית - הבמאי מחליט שוב
+                        st.warning("⚠️ This shot was changed by another process while you reviewed it. Showing the latest version - please decide again.")
+
+            seen_revs[shot_id] = rev
 
 elif mode == "✅ Approved Gallery":
-    approved_shots = [sid for sid, s in shots.items() if s["stills"].get("status") == "APPROVED"]
+    approved_shots = store.by_status("APPROVED")
     if not approved_shots:
         st.write("No approved shots yet.")
     else:
         # תצוגת גריד
         cols = st.columns(3)
-        for i, sid in enumerate(approved_shots):
-            img = shots[sid]["stills"].get("image_path")
+        for i, (sid, s) in enumerate(approved_shots.items()):
+            img = s["stills"].get("image_path")
             if img and os.path.exists(img):
                 cols[i % 3].image(img, caption=sid)
 
+elif mode == "🔗 Dependencies":
+    # אילו סצנות ושוטים תלויים בנכס / סצנה - לפני שעורכים אותם
+    index = open_dep_index(config, store)
+    index.refresh()
+    assets = sorted(a for cat in ("locations", "wardrobe") for a in (index.assets.get(cat) or {}))
+    ref = st.selectbox("Asset or scene:", assets + sorted(index.scenes))
+    affected = index.affected_shots(ref)
+    st.write(f"**Scenes:** {', '.join(affected['scenes']) or '-'}")
+    st.write(f"**Shots ({len(affected['shots'])}):**")
+    cols = st.columns(3)
+    for i, sid in enumerate(affected["shots"]):
+        s = store.get(sid)
+        img = s["stills"].get("image_path")
+        with cols[i % 3]:
+            st.caption(f"{sid} - stills {s['stills']['status']} / video {s['video']['status']}")
+            if img and os.path.exists(img):
+                st.image(img)
+
 elif mode == "📋 All Data":
-    st.json(shots)
\ No newline at end of file
+    st.json(store.all())
\ No newline at end of file
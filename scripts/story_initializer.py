@@ -1,5 +1,9 @@
 import json
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shot_store import open_shot_store
 
 # נתיב לקובץ היעד
 TARGET_FILE = "assets/shots_board.json"
@@ -190,6 +194,11 @@ def generate_full_json():
         json.dump(shots_output, f, indent=4, ensure_ascii=False)
     print(f"✅ Created {len(shots_output)} shots in {TARGET_FILE}")
 
+    # סנכרון מסד הנתונים של הלוח עם הקובץ החדש
+    store = open_shot_store()
+    store.import_json(TARGET_FILE)
+    print("✅ Shot store synced with the new board")
+
     # שמירת קובץ הסצנות
     with open(SCENES_FILE, "w", encoding="utf-8") as f:
         json.dump(SCENES_DATA, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Anthropic Message Batches API, for offline runs of
+`01_stills_prompt_creator.py --batch` / `04_video_prompt_creator.py --batch`.
+
+    python tests/fake_batch_server.py --port 8765
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake python scripts/01_stills_prompt_creator.py --batch
+
+A batch reports "in_progress" for the first `polls_until_done` retrieves and
+then "ended". Every request succeeds with "FAKE PROMPT for <custom_id>",
+except custom ids listed in `fail_ids`, which come back errored.
+"""
+import argparse
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BATCHES_PATH = "/v1/messages/batches"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeBatchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, polls_until_done: int = 1, fail_ids=()):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.polls_until_done = polls_until_done
+        self.fail_ids = set(fail_ids)
+        self.batches = {}
+        self.created = []  # request lists, one per created batch
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "FakeBatchServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def batch_json(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = batch["polls"] >= self.polls_until_done
+        total = len(batch["requests"])
+        failed = sum(1 for r in batch["requests"] if r["custom_id"] in self.fail_ids)
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total - failed if ended else 0,
+                "errored": failed if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": batch["created_at"],
+            "expires_at": (datetime.now(timezone.utc) + timedelta(days=1)).isoformat(),
+            "ended_at": _now() if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}{BATCHES_PATH}/{batch_id}/results" if ended else None,
+        }
+
+    def result_line(self, request: dict) -> dict:
+        custom_id = request["custom_id"]
+        if custom_id in self.fail_ids:
+            return {"custom_id": custom_id, "result": {"type": "errored", "error": {
+                "type": "error", "error": {"type": "invalid_request_error", "message": f"fake failure for {custom_id}"}}}}
+        system = request["params"].get("system") or []
+        cached = sum(len(block["text"]) // 4 for block in system if isinstance(block, dict) and block.get("cache_control"))
+        return {"custom_id": custom_id, "result": {"type": "succeeded", "message": {
+            "id": f"msg_{uuid.uuid4().hex[:12]}",
+            "type": "message",
+            "role": "assistant",
+            "model": request["params"]["model"],
+            "content": [{"type": "text", "text": f"FAKE PROMPT for {custom_id}"}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 50, "output_tokens": 10,
+                      "cache_read_input_tokens": cached, "cache_creation_input_tokens": 0},
+        }}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeBatchServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = "application/json") -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self) -> None:
+        self._send(404, json.dumps({"type": "error", "error": {"type": "not_found_error", "message": self.path}}))
+
+    def do_POST(self):
+        if self.path.split("?")[0] != BATCHES_PATH:
+            return self._not_found()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:16]}"
+        with self.server.lock:
+            self.server.batches[batch_id] = {"requests": body["requests"], "polls": 0, "created_at": _now()}
+            self.server.created.append(body["requests"])
+            payload = self.server.batch_json(batch_id)
+        self._send(200, json.dumps(payload))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0][len(BATCHES_PATH):].strip("/").split("/")
+        if not self.path.startswith(BATCHES_PATH) or parts[0] not in self.server.batches:
+            return self._not_found()
+        batch_id = parts[0]
+        with self.server.lock:
+            batch = self.server.batches[batch_id]
+            if len(parts) == 1:
+                payload = self.server.batch_json(batch_id)
+                batch["polls"] += 1
+                return self._send(200, json.dumps(payload))
+            if parts[1:] == ["results"]:
+                lines = [json.dumps(self.server.result_line(r)) for r in batch["requests"]]
+                return self._send(200, "\n".join(lines) + "\n", "application/binary")
+        self._not_found()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Anthropic Message Batches server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--polls", type=int, default=1, help="in_progress polls before a batch ends")
+    parser.add_argument("--fail", nargs="*", default=[], help="custom ids that should come back errored")
+    args = parser.parse_args()
+    server = FakeBatchServer(args.port, polls_until_done=args.polls, fail_ids=args.fail)
+    print(f"Fake batch server on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,249 @@
+import sys
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.generation_cache import GenerationCache, cache_key
+from utils.upload_cache import UploadCache
+from utils.response_cache import ResponseCache, response_key
+from utils.gemini_cache import GeminiContextCache
+from utils import gemini_client
+from utils.inspection import InspectionLedger, InspectionVerdict, PromptEdit, apply_edits
+
+
+class TestGenerationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_file(self, name, size):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test01_key_is_stable_and_sensitive(self):
+        params = {"prompt": "Miri by the fire", "model": "fal-ai/flux-lora", "seed": None}
+        self.assertEqual(cache_key(params), cache_key(dict(reversed(list(params.items())))))
+        self.assertNotEqual(cache_key(params), cache_key({**params, "prompt": "Miri by the fire."}))
+
+    def test02_put_and_restore(self):
+        cache = GenerationCache(os.path.join(self.tmp, "cache"))
+        key = cache_key({"prompt": "a"})
+        self.assertIsNone(cache.lookup(key))
+        cache.put(key, self.make_file("SHOT_001.jpg", 10))
+
+        dest = os.path.join(self.tmp, "out", "SHOT_001.jpg")
+        self.assertTrue(cache.restore(key, dest))
+        self.assertEqual(os.path.getsize(dest), 10)
+        self.assertFalse(cache.restore(cache_key({"prompt": "b"}), dest))
+
+    def test03_eviction_by_size_and_age(self):
+        cache = GenerationCache(os.path.join(self.tmp, "cache"), max_bytes=25)
+        keys = [cache_key({"n": i}) for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.put(key, self.make_file(f"{i}.jpg", 10))
+            time.sleep(0.01)
+        cache.lookup(keys[0])  # keys[1] is now the least recently used
+
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.lookup(keys[1]))
+        self.assertIsNotNone(cache.lookup(keys[0]))
+        self.assertLessEqual(cache.total_bytes(), 25)
+
+        cache.max_age_days = 1
+        cache.db.conn().execute("UPDATE entries SET last_used = ?", (time.time() - 2 * 86400,))
+        self.assertEqual(cache.evict(), 2)
+        self.assertEqual(cache.total_bytes(), 0)
+
+
+class TestUploadCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def fake_upload(self, path, ttl_seconds):
+        self.calls.append(path)
+        time.sleep(0.05)  # long enough for the other threads to pile up
+        return f"https://cdn.test/{len(self.calls)}"
+
+    def make_file(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test01_same_content_is_uploaded_once(self):
+        cache = UploadCache(os.path.join(self.tmp, "uploads.db"), upload_fn=self.fake_upload)
+        lora = self.make_file("lora.safetensors", b"weights")
+        copy = self.make_file("lora_copy.safetensors", b"weights")
+
+        urls = []
+        threads = [threading.Thread(target=lambda: urls.append(cache.upload(lora))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(set(urls), {"https://cdn.test/1"})
+        self.assertEqual(cache.upload(copy), "https://cdn.test/1")
+
+        # changed bytes -> new upload
+        self.make_file("lora.safetensors", b"weights v2")
+        self.assertEqual(cache.upload(lora), "https://cdn.test/2")
+
+    def test02_expiring_url_is_replaced(self):
+        cache = UploadCache(os.path.join(self.tmp, "uploads.db"), upload_fn=self.fake_upload,
+                            ttl_seconds=3600, min_remaining_seconds=600)
+        ref = self.make_file("face_ref.jpg", b"face")
+        self.assertEqual(cache.upload(ref), "https://cdn.test/1")
+        cache.db.conn().execute("UPDATE uploads SET expires_at = ?", (time.time() + 60,))
+        self.assertEqual(cache.upload(ref), "https://cdn.test/2")
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_hits_misses_and_key(self):
+        cache = ResponseCache(os.path.join(self.tmp, "responses.db"))
+        key = response_key("anthropic", "claude-x", "system", "brief", None, 1000)
+        self.assertNotEqual(key, response_key("anthropic", "claude-x", "system", "brief", None, 2000))
+        self.assertIsNone(cache.get(key, "anthropic"))
+        cache.put(key, "anthropic", "claude-x", "prompt text")
+        self.assertEqual(cache.get(key, "anthropic"), "prompt text")
+        self.assertEqual(cache.stats["anthropic"], {"hits": 1, "misses": 1})
+
+    def test02_eviction_is_per_provider(self):
+        cache = ResponseCache(os.path.join(self.tmp, "responses.db"), limits={
+            "default": {"max_entries": 2},
+            "gemini": {"max_entries": 1, "ttl_days": 1},
+        })
+        for i in range(3):
+            cache.put(f"a{i}", "anthropic", "claude-x", str(i))
+            cache.put(f"g{i}", "gemini", "gemini-x", str(i))
+            time.sleep(0.01)
+        cache.get("a0", "anthropic")  # a1 is now the least recently used
+
+        self.assertEqual(cache.evict(), 3)
+        self.assertIsNotNone(cache.get("a0", "anthropic"))
+        self.assertIsNone(cache.get("a1", "anthropic"))
+        self.assertIsNotNone(cache.get("g2", "gemini"))
+
+        cache.db.conn().execute("UPDATE responses SET created_at = ?", (time.time() - 2 * 86400,))
+        self.assertIsNone(cache.get("g2", "gemini"))
+        self.assertIsNotNone(cache.get("a0", "anthropic"))
+
+
+class TestGeminiContextCache(unittest.TestCase):
+    def test01_reuses_by_display_name_and_deletes(self):
+        client = MagicMock()
+        client.caches.list.return_value = []
+        client.caches.create.return_value = SimpleNamespace(name="cachedContents/1")
+
+        first = GeminiContextCache("gemini-x", "stills-rulebook", "RULES v1", client=client)
+        with first:
+            self.assertEqual(first.config_kwargs(), {"cached_content": "cachedContents/1"})
+        client.caches.delete.assert_called_once_with(name="cachedContents/1")
+
+        # a live cache with the same rules version is reused, not duplicated
+        client.caches.list.return_value = [SimpleNamespace(
+            name="cachedContents/1", display_name=first.display_name, model="models/gemini-x")]
+        again = GeminiContextCache("gemini-x", "stills-rulebook", "RULES v1", client=client)
+        self.assertEqual(again.acquire(), "cachedContents/1")
+        self.assertTrue(again.reused)
+        again.release()
+        self.assertEqual(client.caches.create.call_count, 1)
+        # the process that created it may still be using it: a reused cache is left to its TTL
+        self.assertEqual(client.caches.delete.call_count, 1)
+
+        # new rules -> new version, new cache
+        self.assertNotEqual(GeminiContextCache("gemini-x", "stills-rulebook", "RULES v2", client=client).display_name,
+                            first.display_name)
+
+    def test02_falls_back_to_inline_rules(self):
+        client = MagicMock()
+        client.caches.list.return_value = []
+        client.caches.create.side_effect = RuntimeError("content too small to cache")
+        with GeminiContextCache("gemini-x", "video-rulebook", "RULES", client=client) as rulebook:
+            self.assertEqual(rulebook.config_kwargs(), {"system_instruction": "RULES"})
+
+    def test03_refresh_pushes_the_ttl(self):
+        client = MagicMock()
+        client.caches.list.return_value = []
+        client.caches.create.return_value = SimpleNamespace(name="cachedContents/1")
+        with GeminiContextCache("gemini-x", "stills-rulebook", "RULES", client=client, ttl_minutes=0.002):
+            time.sleep(0.2)  # refreshes every half TTL (~0.06s)
+        self.assertGreaterEqual(client.caches.update.call_count, 2)
+        self.assertEqual(client.caches.update.call_args.kwargs["name"], "cachedContents/1")
+
+    def test04_deleted_cache_falls_back_inline(self):
+        cache_client = MagicMock()
+        cache_client.caches.list.return_value = []
+        cache_client.caches.create.return_value = SimpleNamespace(name="cachedContents/9")
+        genai_client = MagicMock()
+        sent = []
+
+        def generate_content(model, contents, config):
+            sent.append((config.cached_content, config.system_instruction))
+            if config.cached_content:
+                raise RuntimeError("404 NOT_FOUND. CachedContent not found (or permission denied)")
+            return SimpleNamespace(text="ok", usage_metadata=None)
+
+        genai_client.models.generate_content.side_effect = generate_content
+        with patch.object(gemini_client, "get_gemini_client", return_value=genai_client), \
+                patch.object(gemini_client, "open_rate_limiter"):
+            with GeminiContextCache("gemini-x", "video-rulebook", "RULES", client=cache_client) as rulebook:
+                self.assertEqual(gemini_client.generate_text("gemini-x", "prompt", context_cache=rulebook), "ok")
+                self.assertEqual(gemini_client.generate_text("gemini-x", "prompt", context_cache=rulebook), "ok")
+        # one failed call on the dead cache, then the rules go inline
+        self.assertEqual(sent, [("cachedContents/9", None), (None, "RULES"), (None, "RULES")])
+
+
+class TestInspectionLedger(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_apply_edits(self):
+        prompt = "Wide shot, man running fast, 35mm."
+        edits = [PromptEdit(find="running fast", replace="jogging"), PromptEdit(find="", replace="Natural light.")]
+        self.assertEqual(apply_edits(prompt, edits), "Wide shot, man jogging, 35mm. Natural light.")
+        with self.assertRaises(ValueError):
+            apply_edits(prompt, [PromptEdit(find="not there", replace="x")])
+
+    def test02_only_unchanged_verdicts_pass(self):
+        ledger = InspectionLedger(os.path.join(self.tmp, "ledger.db"))
+        unchanged = InspectionVerdict(verdict="unchanged", violated_rules=[], edits=[])
+        edits = InspectionVerdict(verdict="edits", violated_rules=["NO MORPHING"], edits=[PromptEdit(find="a", replace="b")])
+
+        ledger.record("prompt A\n", "v1", "gemini-x", "video", unchanged, "SHOT_001")
+        ledger.record("prompt B", "v1", "gemini-x", "video", edits, "SHOT_002")
+        self.assertTrue(ledger.passed("prompt A", "v1", "gemini-x", "video"))
+        self.assertFalse(ledger.passed("prompt B", "v1", "gemini-x", "video"))
+        # new rules, another model or the other inspector -> inspect again
+        self.assertFalse(ledger.passed("prompt A", "v2", "gemini-x", "video"))
+        self.assertFalse(ledger.passed("prompt A", "v1", "gemini-y", "video"))
+        self.assertFalse(ledger.passed("prompt A", "v1", "gemini-x", "stills"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import anthropic
+
+# Add project root and scripts to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "scripts"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import claude_client
+from fake_batch_server import FakeBatchServer
+
+
+def shot_request(shot_id):
+    return {
+        "system_prompt": "You are an Expert Cinematographer.",
+        "shared_context": "LOCATION: Hut interior, 1850s",
+        "user_prompt": f"Brief for {shot_id}",
+    }
+
+
+class TestClaudeBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.server = FakeBatchServer(polls_until_done=2, fail_ids={"SHOT_003"}).start()
+        config = {"paths": {"response_cache": os.path.join(self.tmp, "responses.db")}}
+        fake_client = anthropic.Anthropic(base_url=self.server.base_url, api_key="fake", max_retries=0)
+        self.patches = [patch.object(claude_client, "client", fake_client), patch.object(claude_client, "config", config)]
+        for p in self.patches:
+            p.start()
+        self.state_path = os.path.join(self.tmp, "batches", "01.json")
+        self.items = {sid: shot_request(sid) for sid in ("SHOT_001", "SHOT_002", "SHOT_003")}
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.server.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_batch(self, items):
+        gen = claude_client.get_claude_responses_batch(items, state_path=self.state_path, poll_interval=0)
+        return {sid: (text, error) for sid, text, error in gen}
+
+    def test01_results_per_shot_and_cached(self):
+        results = self.run_batch(self.items)
+        self.assertEqual(results["SHOT_001"], ("FAKE PROMPT for SHOT_001", None))
+        self.assertIsNone(results["SHOT_003"][0])
+        self.assertIn("fake failure", results["SHOT_003"][1])
+        self.assertFalse(os.path.exists(self.state_path))
+
+        # the static system blocks are sent first and marked for prompt caching
+        params = self.server.created[0][0]["params"]
+        self.assertEqual([b["cache_control"] for b in params["system"]], [{"type": "ephemeral"}] * 2)
+
+        # rerun: succeeded shots come from the response cache, only the failed one is re-batched
+        results = self.run_batch(self.items)
+        self.assertEqual(results["SHOT_002"], ("FAKE PROMPT for SHOT_002", None))
+        self.assertEqual(len(self.server.created), 2)
+        self.assertEqual([r["custom_id"] for r in self.server.created[1]], ["SHOT_003"])
+
+    def test02_resumes_open_batch_after_crash(self):
+        gen = claude_client.get_claude_responses_batch(self.items, state_path=self.state_path, poll_interval=0)
+        first_id, _, _ = next(gen)  # "crash" after the first result was saved
+        gen.close()
+        self.assertTrue(os.path.exists(self.state_path))
+
+        remaining = {sid: item for sid, item in self.items.items() if sid != first_id}
+        results = self.run_batch(remaining)
+        self.assertEqual(set(results), set(remaining))
+        self.assertEqual(len(self.server.created), 1)
+
+    def test03_changed_requests_are_not_resumed(self):
+        gen = claude_client.get_claude_responses_batch(self.items, state_path=self.state_path, poll_interval=0)
+        first_id, _, _ = next(gen)
+        gen.close()
+
+        # same shot ids, but the briefs changed since the saved batch was sent
+        changed = {sid: {**item, "user_prompt": item["user_prompt"] + " (rewritten)"}
+                   for sid, item in self.items.items() if sid != first_id}
+        results = self.run_batch(changed)
+        self.assertEqual(set(results), set(changed))
+        self.assertEqual(len(self.server.created), 2)
+        self.assertIn("(rewritten)", self.server.created[1][0]["params"]["messages"][0]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import sys
+import os
+import time
+import unittest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.concurrency import AdaptiveLimiter, is_overload
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test01_additive_increase_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter("test/model", initial=2, min_limit=1, max_limit=4, latency_factor=0)
+        for _ in range(20):
+            with limiter.slot():
+                pass
+        self.assertEqual(limiter.limit, 4)
+
+        # a burst of 429s from calls started before the cut counts once
+        started = [limiter.acquire() for _ in range(4)]
+        for s in started:
+            limiter.release(s, RateLimitError())
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.overloads, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+        # other errors release the slot without touching the limit
+        with self.assertRaises(ValueError):
+            with limiter.slot():
+                raise ValueError("bad prompt")
+        self.assertEqual((limiter.limit, limiter.in_flight), (2, 0))
+
+    def test02_limit_bounds_in_flight(self):
+        limiter = AdaptiveLimiter("test/model", initial=1, max_limit=1)
+        started = limiter.acquire()
+        self.assertFalse(limiter.try_acquire())
+        limiter.release(started)
+        self.assertTrue(limiter.try_acquire())
+
+    def test03_rising_latency_cuts(self):
+        limiter = AdaptiveLimiter("test/model", initial=8, max_limit=8, latency_factor=2.0)
+        for _ in range(6):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(limiter.acquire() - 60)  # a call that took a minute
+        self.assertEqual(limiter.limit, 4)
+
+    def test04_is_overload(self):
+        self.assertTrue(is_overload(RateLimitError()))
+        self.assertTrue(is_overload(Exception("429 RESOURCE_EXHAUSTED")))
+        self.assertFalse(is_overload(ValueError("bad")))
+
+
+if __name__ == "__main__":
+    unittest.main()
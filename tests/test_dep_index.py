@@ -0,0 +1,83 @@
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dep_index import DependencyIndex
+from utils.shot_store import open_shot_store
+
+
+def make_board():
+    return {
+        "SHOT_001": {"scene_ref": "SCENE_1", "stills": {"status": "APPROVED"}, "video": {"status": "PENDING"}},
+        "SHOT_002": {"scene_ref": "SCENE_1", "stills": {"status": "IMAGE_READY"}, "video": {"status": "PENDING"}},
+        "SHOT_003": {"scene_ref": "SCENE_2", "stills": {"status": "IMAGE_READY"}, "video": {"status": "PENDING"}},
+    }
+
+
+class TestDependencyIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        board_path = os.path.join(self.tmp, "shots_board.json")
+        with open(board_path, "w", encoding="utf-8") as f:
+            json.dump(make_board(), f)
+        self.scenes_path = os.path.join(self.tmp, "scenes_db.json")
+        self.write_scenes({
+            "SCENE_1": {"location_id": "DUNES", "wardrobe_id": "MIRI_DIRTY_MUD"},
+            "SCENE_2": {"location_id": "CAVE", "wardrobe_id": "MIRI_DIRTY_MUD"},
+        })
+        assets_path = os.path.join(self.tmp, "assets.yaml")
+        with open(assets_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump({"locations": {"DUNES": {"description": "red dunes"}},
+                            "wardrobe": {"MIRI_DIRTY_MUD": {"description": "muddy dress"}}}, f)
+        self.store = open_shot_store({"paths": {"shots_board": board_path}})
+        self.index = DependencyIndex(self.store, self.scenes_path, assets_path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write_scenes(self, scenes):
+        with open(self.scenes_path, "w", encoding="utf-8") as f:
+            json.dump(scenes, f)
+        # mtime granularity: make sure the edit is seen as a new version of the file
+        os.utime(self.scenes_path, ns=(0, os.stat(self.scenes_path).st_mtime_ns + 1_000_000_000))
+
+    def test01_queries(self):
+        self.assertEqual(self.index.shots_for_asset("MIRI_DIRTY_MUD"), ["SHOT_001", "SHOT_002", "SHOT_003"])
+        self.assertEqual(self.index.affected_shots("DUNES"),
+                         {"kind": "asset", "scenes": ["SCENE_1"], "shots": ["SHOT_001", "SHOT_002"]})
+        self.assertEqual(self.index.affected_shots("SCENE_2")["shots"], ["SHOT_003"])
+        self.assertEqual(self.index.shots_with_status("IMAGE_READY"), ["SHOT_002", "SHOT_003"])
+        self.assertEqual(self.index.resolved_assets("SCENE_1"), {"location": "red dunes", "wardrobe": "muddy dress"})
+
+    def test02_incremental_refresh(self):
+        self.index.refresh()
+        self.assertEqual(self.index.refresh(), {"shots": [], "scenes": [], "assets": []})
+
+        # only the updated shot is re-read
+        self.store.update("SHOT_003", {"stills.status": "APPROVED", "scene_ref": "SCENE_1"})
+        self.assertEqual(self.index.refresh()["shots"], ["SHOT_003"])
+        self.assertEqual(self.index.shots_with_status("IMAGE_READY"), ["SHOT_002"])
+        self.assertEqual(self.index.shots_for_scene("SCENE_2"), [])
+        self.assertEqual(self.index.shots_for_asset("DUNES"), ["SHOT_001", "SHOT_002", "SHOT_003"])
+
+        # only the edited scene is re-indexed
+        self.write_scenes({
+            "SCENE_1": {"location_id": "CAVE", "wardrobe_id": "MIRI_DIRTY_MUD"},
+            "SCENE_2": {"location_id": "CAVE", "wardrobe_id": "MIRI_DIRTY_MUD"},
+        })
+        self.assertEqual(self.index.refresh()["scenes"], ["SCENE_1"])
+        self.assertEqual(self.index.shots_for_asset("DUNES"), [])
+        self.assertEqual(self.index.scenes_for_asset("CAVE"), ["SCENE_1", "SCENE_2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
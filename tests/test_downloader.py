@@ -0,0 +1,68 @@
+import sys
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.downloader import ChecksumError, download_file, sync_links
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.served = os.path.join(self.tmp, "served")
+        os.makedirs(self.served)
+        self.payload = os.urandom(3 * 1024 * 1024 + 17)
+        with open(os.path.join(self.served, "img.jpg"), "wb") as f:
+            f.write(self.payload)
+        self.server = HTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=self.served))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/img.jpg"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_streams_with_checksum(self):
+        dest = os.path.join(self.tmp, "out", "SHOT_001.jpg")
+        res = download_file(self.url, dest)
+        self.assertEqual(res["sha256"], hashlib.sha256(self.payload).hexdigest())
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), self.payload)
+
+        # a bad checksum leaves the existing file alone and no temp files behind
+        with self.assertRaises(ChecksumError):
+            download_file(self.url, dest, expected_sha256="0" * 64)
+        self.assertEqual(os.path.getsize(dest), len(self.payload))
+        self.assertEqual(os.listdir(os.path.dirname(dest)), ["SHOT_001.jpg"])
+
+    def test02_sync_links_is_incremental(self):
+        src_a = os.path.join(self.served, "img.jpg")
+        src_b = os.path.join(self.tmp, "b.jpg")
+        shutil.copy(src_a, src_b)
+        flat = os.path.join(self.tmp, "flat")
+
+        first = sync_links({"A.jpg": src_a, "B.jpg": src_b}, flat)
+        self.assertEqual(first.get("unchanged", 0), 0)
+        self.assertTrue(os.path.samefile(src_a, os.path.join(flat, "A.jpg")))
+
+        second = sync_links({"A.jpg": src_a}, flat)
+        self.assertEqual(second, {"unchanged": 1, "removed": 1})
+        self.assertEqual(os.listdir(flat), ["A.jpg"])
+
+
+if __name__ == "__main__":
+    unittest.main()
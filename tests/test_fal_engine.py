@@ -0,0 +1,149 @@
+import sys
+import os
+import time
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fal_client
+from utils import fal_engine
+from utils.fal_engine import FalJob, FalJobEngine
+
+
+class FakeHandle:
+    def __init__(self, client, request_id):
+        self.client = client
+        self.request_id = request_id
+
+    async def status(self):
+        if self.request_id not in self.client.known:
+            raise RuntimeError("Request not found")
+        return fal_client.InProgress(logs=None)
+
+    async def iter_events(self, interval=1.0):
+        yield fal_client.Queued(position=1)
+        yield fal_client.InProgress(logs=None)
+        error = self.client.errors.get(self.request_id)
+        yield fal_client.Completed(logs=None, metrics={}, error=error, error_type="nsfw" if error else None)
+
+
+class FakeAsyncClient:
+    """In-memory stand-in for fal_client.AsyncClient that records how many submits overlap."""
+
+    def __init__(self):
+        self.known = {"req-old"}
+        self.errors = {}
+        self.submitted = []
+        self.active = 0
+        self.peak = 0
+
+    def get_handle(self, application, request_id):
+        return FakeHandle(self, request_id)
+
+    async def submit(self, application, arguments):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.02)
+        self.active -= 1
+        request_id = f"req-{arguments['n']}"
+        self.known.add(request_id)
+        self.submitted.append(request_id)
+        if arguments.get("fail"):
+            self.errors[request_id] = "flagged"
+        return FakeHandle(self, request_id)
+
+    async def result(self, application, request_id):
+        return {"images": [{"url": f"https://fal.media/{request_id}.jpg"}]}
+
+
+class FakeLimiter:
+    async def acquire_async(self, provider, model):
+        return 0.0
+
+    @asynccontextmanager
+    async def slot_async(self):
+        yield
+
+
+class TestFalJobEngine(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeAsyncClient()
+        limiter = FakeLimiter()
+        patches = [
+            patch.object(fal_client, "AsyncClient", return_value=self.client),
+            patch.object(fal_engine, "open_rate_limiter", return_value=limiter),
+            patch.object(fal_engine, "adaptive_limiter", return_value=limiter),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test01_submit_follow_and_download(self):
+        events, done = [], []
+        engine = FalJobEngine(
+            max_submissions=4, poll_interval=0,
+            on_event=lambda job, event, **info: events.append((job.key, event)),
+            on_done=lambda job: done.append(job.key),
+        )
+        jobs = engine.run_sync([
+            FalJob("SHOT_001", "fal-ai/flux-lora", {"n": 1}, download=lambda r: r["images"][0]["url"]),
+            FalJob("SHOT_002", "fal-ai/flux-lora", {"n": 2, "fail": True}),
+        ])
+
+        self.assertTrue(jobs[0].ok)
+        self.assertEqual(jobs[0].output, "https://fal.media/req-1.jpg")
+        self.assertEqual(set(jobs[0].timings), {"submit_s", "generate_s", "download_s", "total_s"})
+        self.assertEqual(
+            [e for key, e in events if key == "SHOT_001"],
+            ["submitted", "queued", "in_progress", "completed"],
+        )
+        # a failed generation is reported on its job and does not stop the batch
+        self.assertFalse(jobs[1].ok)
+        self.assertEqual(jobs[1].error, "nsfw: flagged")
+        self.assertEqual(sorted(done), ["SHOT_001", "SHOT_002"])
+
+    def test02_resume_by_request_id(self):
+        submitted = []
+        engine = FalJobEngine(poll_interval=0, on_submitted=lambda job: submitted.append(job.key))
+        events = []
+        engine.on_event = lambda job, event, **info: events.append((job.key, event))
+        resumed, lost = engine.run_sync([
+            FalJob("SHOT_001", "fal-ai/flux-lora", {"n": 1}, request_id="req-old"),
+            FalJob("SHOT_002", "fal-ai/flux-lora", {"n": 2}, request_id="req-expired"),
+        ])
+
+        # the known request is followed without paying for a new one
+        self.assertTrue(resumed.resumed and resumed.ok)
+        self.assertEqual(resumed.request_id, "req-old")
+        # the unknown one is submitted again, and the new id is handed to on_submitted
+        self.assertFalse(lost.resumed)
+        self.assertEqual((lost.request_id, lost.ok), ("req-2", True))
+        self.assertIn(("SHOT_002", "resume_failed"), events)
+        self.assertEqual((self.client.submitted, submitted), (["req-2"], ["SHOT_002"]))
+
+    def test03_submits_and_downloads_are_bounded_separately(self):
+        downloading = {"active": 0, "peak": 0}
+
+        def download(result):
+            downloading["active"] += 1
+            downloading["peak"] = max(downloading["peak"], downloading["active"])
+            time.sleep(0.05)
+            downloading["active"] -= 1
+            return result
+
+        engine = FalJobEngine(max_submissions=3, max_downloads=1, poll_interval=0)
+        jobs = engine.run_sync(
+            [FalJob(f"SHOT_{n:03d}", "fal-ai/flux-lora", {"n": n}, download=download) for n in range(8)]
+        )
+
+        self.assertTrue(all(job.ok for job in jobs))
+        self.assertEqual(self.client.peak, 3)
+        self.assertEqual(downloading["peak"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
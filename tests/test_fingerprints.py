@@ -0,0 +1,40 @@
+import sys
+import os
+import unittest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.fingerprints import plan_shot, stamp_changes
+
+
+def shot(stills="IMAGE_READY", video="PENDING", fingerprints=None):
+    return {
+        "stills": {"status": stills, "image_path": "production/images/SHOT_001.jpg"},
+        "video": {"status": video},
+        "fingerprints": fingerprints or {},
+    }
+
+
+class TestPlanShot(unittest.TestCase):
+    def test01_first_stale_stage_reruns_the_rest_of_its_track(self):
+        current = {"01": "a", "02": "b2", "03": "c", "04": "d", "05": "e"}.get
+        s = shot(video="VIDEO_READY", fingerprints={"01": "a", "02": "b", "03": "c", "04": "d", "05": "e"})
+        self.assertEqual(plan_shot(s, current), {
+            "stills": {"stage": "02", "reason": "inputs changed", "reruns": ["02", "03"]},
+        })
+
+    def test02_missing_output_untracked_and_not_built(self):
+        current = {"01": None, "02": "b", "03": "c"}.get
+        self.assertEqual(plan_shot(shot(fingerprints={"01": "a"}), current)["stills"]["reason"], "output missing")
+        # ran before fingerprints existed -> untracked, and stamp records it without a rebuild
+        current = {"01": "a", "02": "b", "03": "c"}.get
+        self.assertEqual(plan_shot(shot(), current)["stills"]["reason"], "untracked")
+        self.assertEqual(stamp_changes(shot(), current),
+                         {"fingerprints.01": "a", "fingerprints.02": "b", "fingerprints.03": "c"})
+        # never built -> the normal pipeline run handles it, not the planner
+        self.assertEqual(plan_shot(shot(stills="PENDING", fingerprints={}), current), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import sys
+import os
+import json
+import yaml
+import shutil
+import tempfile
+import unittest
+import importlib.util
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from utils import gemini_cache, gemini_client
+
+PROMPTS = {
+    "SHOT_001": "Wide shot, Miri running fast through the forest, 35mm.",
+    "SHOT_002": "Close up, embers in a stone fireplace, warm glow.",
+    "SHOT_003": "Medium shot, grandmother knitting by the window.",
+}
+
+
+def verdict(shot_id=None, edits=()):
+    v = {"verdict": "edits" if edits else "unchanged", "violated_rules": ["SLOW MOTION"] if edits else [],
+         "edits": [{"find": find, "replace": replace} for find, replace in edits]}
+    return {"shot_id": shot_id, **v} if shot_id else v
+
+
+def shot_ids_in(contents):
+    return [line.split()[2] for line in contents.splitlines() if line.startswith("=== SHOT")]
+
+
+class StageTestCase(unittest.TestCase):
+    """
+    Runs a stage script against a throwaway project: its own config.yaml, board,
+    prompt files and databases, with a fake google-genai client.
+    """
+    stage = None
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(os.path.join(ROOT, "config.yaml"), "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        for key, value in config["paths"].items():
+            config["paths"][key] = os.path.join(self.tmp, value)
+        with open(os.path.join(self.tmp, "config.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f)
+
+        board = {}
+        for folder in ("stills", "video"):
+            os.makedirs(os.path.join(self.tmp, "prompts", folder))
+        for shot_id, prompt in PROMPTS.items():
+            paths = {f: os.path.join(self.tmp, "prompts", f, f"{shot_id.lower()}.txt") for f in ("stills", "video")}
+            for path in paths.values():
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(prompt)
+            board[shot_id] = {
+                "scene_ref": "SCENE_1", "brief": {"visual": "visual", "motion": "motion"}, "constraints": {},
+                "stills": {"status": "PROMPT_READY", "prompt_file": paths["stills"], "image_path": ""},
+                "video": {"status": "PROMPT_READY", "prompt_file": paths["video"], "video_path": ""},
+            }
+        os.makedirs(os.path.dirname(config["paths"]["shots_board"]))
+        with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
+            json.dump(board, f)
+
+        self.calls = []
+        self.replies = []
+        self.genai = MagicMock()
+        self.genai.models.generate_content.side_effect = self.generate_content
+        self.genai.models.get.return_value = SimpleNamespace(input_token_limit=100000, output_token_limit=8192)
+        self.genai.caches.list.return_value = []
+        self.genai.caches.create.return_value = SimpleNamespace(name="cachedContents/rules")
+        for p in (patch.object(gemini_client, "get_gemini_client", return_value=self.genai),
+                  patch.object(gemini_cache, "get_gemini_client", return_value=self.genai),
+                  patch.object(gemini_client, "open_rate_limiter")):
+            p.start()
+            self.addCleanup(p.stop)
+
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            spec = importlib.util.spec_from_file_location(f"stage_{self.stage}", os.path.join(ROOT, "scripts", self.stage))
+            self.module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self.module)
+        finally:
+            os.chdir(cwd)
+
+    def tearDown(self):
+        self.module.store.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def generate_content(self, model, contents, config):
+        self.calls.append(contents)
+        reply = self.replies.pop(0)
+        return SimpleNamespace(text=reply(contents) if callable(reply) else reply, usage_metadata=None)
+
+    def prompt_file(self, shot_id, folder):
+        with open(os.path.join(self.tmp, "prompts", folder, f"{shot_id.lower()}.txt"), encoding="utf-8") as f:
+            return f.read()
+
+
+class TestStillsInspect(StageTestCase):
+    stage = "02_stills_inspect.py"
+
+    def inputs(self, *shot_ids):
+        return [self.module.load_shot_input(shot_id) for shot_id in shot_ids]
+
+    def test01_plan_batches(self):
+        m = self.module
+        shots = self.inputs(*PROMPTS)
+        self.assertEqual([len(b) for b in m.plan_batches(shots, 100000, 8192, max_batch=2)], [2, 1])
+
+        # a context that fits only one shot block next to the rulebook splits every shot out
+        fixed = m.estimate_tokens(m.RULEBOOK + m.BATCH_INSTRUCTIONS)
+        block = max(m.estimate_tokens(m.format_shot_block(s)) for s in shots)
+        self.assertEqual([len(b) for b in m.plan_batches(shots, 2 * (fixed + block) + 1, 8192)], [1, 1, 1])
+
+    def test02_parse_verdicts(self):
+        m = self.module
+        shots = self.inputs("SHOT_001", "SHOT_002")
+        by_id = m.parse_verdicts(json.dumps([
+            verdict("SHOT_002"), verdict("SHOT_001", [("running fast", "walking")]),
+        ]), shots)
+        self.assertEqual((by_id["SHOT_001"].verdict, by_id["SHOT_002"].verdict), ("edits", "unchanged"))
+
+        for bad in (
+            "not json",
+            json.dumps([verdict("SHOT_001")]),  # a shot is missing
+            json.dumps([verdict("SHOT_001"), verdict("SHOT_001")]),  # the same shot twice
+            json.dumps([verdict("SHOT_001"), verdict("SHOT_009")]),  # a shot that was not sent
+            json.dumps([verdict("SHOT_001", [("not in the prompt", "x")]), verdict("SHOT_002")]),
+        ):
+            with self.assertRaises(ValueError):
+                m.parse_verdicts(bad, shots)
+
+    def test03_batch_applies_edits(self):
+        self.replies.append(lambda contents: json.dumps(
+            [verdict(s, [("running fast", "walking slowly")] if s == "SHOT_001" else ()) for s in shot_ids_in(contents)]
+        ))
+        results = self.module.process_batch(self.inputs(*PROMPTS))
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(shot_ids_in(self.calls[0]), list(PROMPTS))
+        self.assertEqual([r["status"] for r in results], ["APPROVED"] * 3)
+        # nothing is written until the board accepts the result
+        self.assertEqual(self.prompt_file("SHOT_001", "stills"), PROMPTS["SHOT_001"])
+        self.assertEqual([self.module.commit_result(r) for r in results], [True] * 3)
+        self.assertEqual(self.prompt_file("SHOT_001", "stills"), "Wide shot, Miri walking slowly through the forest, 35mm.")
+        self.assertEqual(self.prompt_file("SHOT_002", "stills"), PROMPTS["SHOT_002"])
+
+    def test04_bad_batch_falls_back_to_single_shots(self):
+        # the batch answer drops a shot: nothing is applied from it, every shot is asked again alone
+        self.replies.append(json.dumps([verdict("SHOT_001"), verdict("SHOT_002")]))
+        self.replies += [json.dumps(verdict()), json.dumps(verdict()), json.dumps(verdict(edits=[("knitting", "reading")]))]
+        results = self.module.process_batch(self.inputs(*PROMPTS))
+
+        self.assertEqual(len(self.calls), 4)
+        self.assertTrue(all("=== SHOT" not in contents for contents in self.calls[1:]))
+        self.assertEqual([r["status"] for r in results], ["APPROVED"] * 3)
+        self.assertTrue(all("(Parallel)" in r["msg"] for r in results))
+        for res in results:
+            self.module.commit_result(res)
+        self.assertEqual(self.prompt_file("SHOT_003", "stills"), "Medium shot, grandmother reading by the window.")
+
+    def test05_conflict_keeps_the_prompt(self):
+        m = self.module
+        self.replies.append(json.dumps(verdict(edits=[("running fast", "walking")])))
+        res = m.process_single_shot("SHOT_001")
+        # 01 rewrites the shot while the inspector was working
+        m.store.update("SHOT_001", {"stills.status": "PENDING"})
+
+        self.assertFalse(m.commit_result(res))
+        self.assertEqual(self.prompt_file("SHOT_001", "stills"), PROMPTS["SHOT_001"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, "prompts", "stills"))),
+                         ["shot_001.txt", "shot_002.txt", "shot_003.txt"])  # no temp file left behind
+        self.assertEqual(m.store.get("SHOT_001")["stills"]["status"], "PENDING")
+        # a verdict that was never applied is not in the ledger
+        self.assertEqual(m.LEDGER.db.conn().execute("SELECT COUNT(*) FROM inspections").fetchone()[0], 0)
+
+
+class TestVideoInspect(StageTestCase):
+    stage = "05_video_inspect.py"
+
+    def reply(self, contents):
+        # the parallel workers ask in any order: answer by the prompt in the request
+        if PROMPTS["SHOT_001"] in contents:
+            return json.dumps(verdict(edits=[("running fast", "jogging")]))
+        return json.dumps(verdict())
+
+    def test01_parallel_run_and_ledger(self):
+        m = self.module
+        self.replies += [self.reply] * 3
+        m.main()
+
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual({m.store.get(s)["video"]["status"] for s in PROMPTS}, {"VIDEO_READY"})
+        self.assertEqual(self.prompt_file("SHOT_001", "video"), "Wide shot, Miri jogging through the forest, 35mm.")
+        self.assertEqual(self.prompt_file("SHOT_002", "video"), PROMPTS["SHOT_002"])
+        # the rulebook went to the context cache once, and the cache is gone after the run
+        self.assertEqual(self.genai.caches.create.call_count, 1)
+        self.genai.caches.delete.assert_called_once_with(name="cachedContents/rules")
+
+        # sent back for inspection: the prompts that passed unchanged skip the model, the edited one is asked again
+        for shot_id in PROMPTS:
+            m.store.update(shot_id, {"video.status": "PROMPT_READY"})
+        self.replies.append(self.reply)
+        m.main()
+        self.assertEqual(len(self.calls), 4)
+        self.assertIn("Miri jogging", self.calls[-1])
+        self.assertEqual({m.store.get(s)["video"]["status"] for s in PROMPTS}, {"VIDEO_READY"})
+
+    def test02_conflict_keeps_the_prompt(self):
+        m = self.module
+        self.replies.append(self.reply)
+        res = m.inspect_video_prompt("SHOT_001")
+        m.store.update("SHOT_001", {"video.status": "READY_FOR_PROMPT"})  # sent back to 04 meanwhile
+
+        self.assertFalse(m.commit_result(res))
+        self.assertEqual(self.prompt_file("SHOT_001", "video"), PROMPTS["SHOT_001"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, "prompts", "video"))),
+                         ["shot_001.txt", "shot_002.txt", "shot_003.txt"])
+        self.assertEqual(m.LEDGER.db.conn().execute("SELECT COUNT(*) FROM inspections").fetchone()[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
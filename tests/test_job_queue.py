@@ -0,0 +1,147 @@
+import sys
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.job_queue import JobQueue
+from tools import scheduler
+from tools.scheduler import JobScheduler
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp, "jobs.db"), max_attempts=2, retry_delay=0)
+
+    def tearDown(self):
+        self.queue.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_dedupe_and_priority(self):
+        first, new = self.queue.enqueue("03_img_gen.py", ["1-5"])
+        self.assertTrue(new)
+        # the same request while the first is pending is the same job, raised to the higher priority
+        self.assertEqual(self.queue.enqueue("03_img_gen.py", ["1-5"], priority=10), (first, False))
+        other, _ = self.queue.enqueue("03_img_gen.py", ["SHOT_007"], priority=5)
+
+        job = self.queue.lease("w1")
+        self.assertEqual((job["id"], job["status"], job["attempts"]), (first, "running", 1))
+        self.assertEqual(self.queue.enqueue("03_img_gen.py", ["1-5"]), (first, False))  # still running
+        self.assertTrue(self.queue.complete(first, "w1", {"summary": {"IMAGE_READY": 5}}))
+        self.assertEqual(self.queue.get(first)["result"], {"summary": {"IMAGE_READY": 5}})
+
+        # once done, asking again queues a new run
+        self.assertTrue(self.queue.enqueue("03_img_gen.py", ["1-5"])[1])
+        self.assertEqual(self.queue.lease("w1")["id"], other)
+
+    def test02_retry_then_dead_letter(self):
+        job_id, _ = self.queue.enqueue("05_video_inspect.py")
+        self.queue.lease("w1")
+        self.assertEqual(self.queue.fail(job_id, "w1", "SHOT_001: 529 overloaded"), "pending")
+        self.queue.lease("w1")
+        self.assertEqual(self.queue.fail(job_id, "w1", "SHOT_001: 529 overloaded"), "dead")
+        self.assertIsNone(self.queue.lease("w1"))
+        self.assertEqual(self.queue.get(job_id)["error"], "SHOT_001: 529 overloaded")
+
+        self.assertTrue(self.queue.retry(job_id))
+        self.assertEqual(self.queue.lease("w1")["attempts"], 1)
+
+    def test03_expired_lease_is_handed_back(self):
+        job_id, _ = self.queue.enqueue("03_img_gen.py")
+        self.queue.lease("crashed", lease_seconds=0.05)
+        self.assertIsNone(self.queue.lease("w2"))  # leased and alive
+        time.sleep(0.1)
+
+        job = self.queue.lease("w2")
+        self.assertEqual((job["id"], job["attempts"], job["lease_owner"]), (job_id, 2, "w2"))
+        # the old owner lost the job: its heartbeat and result are refused
+        self.assertFalse(self.queue.heartbeat(job_id, "crashed"))
+        self.assertFalse(self.queue.complete(job_id, "crashed"))
+        self.assertTrue(self.queue.heartbeat(job_id, "w2", progress={"SHOT_001": {"event": "queued"}}))
+        self.assertEqual(self.queue.get(job_id)["progress"], {"SHOT_001": {"event": "queued"}})
+
+    def test04_same_shots_are_the_same_job(self):
+        job_id, _ = self.queue.enqueue("03_img_gen.py", ["5"])
+        for args in (["SHOT_005"], ["5-5"], [" shot_005 "]):
+            self.assertEqual(self.queue.enqueue("03_img_gen.py", args), (job_id, False))
+        self.assertEqual(self.queue.enqueue("03_img_gen.py", ["1-3"])[1], True)
+        self.assertEqual(self.queue.enqueue("03_img_gen.py", ["SHOT_001-SHOT_003"])[1], False)
+        # flags and other scripts still make a different job; "all" is the same as no range
+        self.assertEqual(self.queue.enqueue("03_img_gen.py", ["5", "--force"])[1], True)
+        self.assertEqual(self.queue.enqueue("05_video_inspect.py", ["5"])[1], True)
+        all_id, _ = self.queue.enqueue("03_img_gen.py", ["all"])
+        self.assertEqual(self.queue.enqueue("03_img_gen.py"), (all_id, False))
+
+    def test05_cancel(self):
+        leased, _ = self.queue.enqueue("03_img_gen.py", ["1"])
+        waiting, _ = self.queue.enqueue("03_img_gen.py", ["2"])
+        self.assertEqual(self.queue.lease("w1")["id"], leased)
+        self.assertTrue(self.queue.cancel(waiting))
+        self.assertIsNone(self.queue.lease("w1"))  # a cancelled job is never handed out
+
+        # a running job: its owner's heartbeat and result are refused from now on
+        self.assertTrue(self.queue.cancel(leased))
+        self.assertFalse(self.queue.heartbeat(leased, "w1"))
+        self.assertFalse(self.queue.complete(leased, "w1"))
+        self.assertEqual(self.queue.get(leased)["status"], "cancelled")
+        self.assertFalse(self.queue.cancel(leased))
+        # asking again queues a new run
+        self.assertTrue(self.queue.enqueue("03_img_gen.py", ["1"])[1])
+
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp, "jobs.db"), retry_delay=60)
+        self.scheduler = JobScheduler(self.queue, lease_seconds=0.3)
+
+    def tearDown(self):
+        self.queue.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_lost_lease_stops_the_run(self):
+        job_id, _ = self.queue.enqueue("03_img_gen.py", ["1-5"])
+        cancelled = []
+
+        def run_script(script, args, timeout, on_line, cancel):
+            # the queue hands the job to another scheduler mid-run (as after an expired lease)
+            self.queue.db.conn().execute("UPDATE jobs SET lease_owner = 'other' WHERE id = ?", (job_id,))
+            cancelled.append(cancel.wait(2))
+            return {"success": False, "output": "Execution cancelled.", "error": "Cancelled", "results": []}
+
+        with patch.object(scheduler, "run_script", run_script), patch.object(self.queue, "fail") as fail:
+            job = self.scheduler.run_next()
+        self.assertEqual(cancelled, [True])
+        fail.assert_not_called()
+        # the run's outcome is dropped: the job stays with its new owner
+        self.assertEqual((job["status"], job["lease_owner"], job["error"]), ("running", "other", None))
+
+    def test02_results_and_failures(self):
+        done, _ = self.queue.enqueue("03_img_gen.py", ["SHOT_001"])
+        failed, _ = self.queue.enqueue("03_img_gen.py", ["SHOT_002"])
+        outcomes = {
+            "SHOT_001": [{"stage": "03", "shot_id": "SHOT_001", "status": "IMAGE_READY", "path": "x.jpg"}],
+            "SHOT_002": [{"stage": "03", "shot_id": "SHOT_002", "status": "ERROR", "error": "nsfw"}],
+        }
+
+        def run_script(script, args, timeout, on_line, cancel):
+            on_line("stdout", '@@progress {"event": "queued", "shot_id": "%s"}' % args[0])
+            return {"success": True, "output": "", "results": outcomes[args[0]],
+                    "summary": {outcomes[args[0]][0]["status"]: 1}}
+
+        with patch.object(scheduler, "run_script", run_script):
+            self.assertEqual(self.scheduler.drain(), 2)
+        self.assertEqual(self.queue.get(done)["status"], "done")
+        self.assertEqual(self.queue.get(done)["progress"], {"SHOT_001": {"event": "queued", "shot_id": "SHOT_001"}})
+        # a shot that ended in ERROR fails the job, which goes back to the queue for a retry
+        self.assertEqual((self.queue.get(failed)["status"], self.queue.get(failed)["error"]), ("pending", "SHOT_002: nsfw"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import sys
+import os
+import json
+import yaml
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import importlib.util
+from unittest.mock import patch
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+SHOT_IDS = [f"SHOT_{n:03d}" for n in range(1, 11)]
+
+
+def shot(stills="PENDING", video="PENDING", image_path=""):
+    return {"scene_ref": "SCENE_1", "brief": {"visual": "v", "motion": "m"},
+            "stills": {"status": stills, "prompt_file": "", "image_path": image_path},
+            "video": {"status": video, "prompt_file": "", "video_path": ""}}
+
+
+class TestPipelineRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(os.path.join(ROOT, "config.yaml"), "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        for key, value in config["paths"].items():
+            config["paths"][key] = os.path.join(self.tmp, value)
+        config["pipeline"]["inspect_batch_size"] = 4
+        with open(os.path.join(self.tmp, "config.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f)
+        os.makedirs(os.path.join(self.tmp, "assets"))
+        with open(config["paths"]["shots_board"], "w", encoding="utf-8") as f:
+            json.dump({sid: shot() for sid in SHOT_IDS}, f)
+        with open(config["paths"]["scenes_db"], "w", encoding="utf-8") as f:
+            json.dump({}, f)
+        with open(config["paths"]["assets"], "w", encoding="utf-8") as f:
+            yaml.safe_dump({}, f)
+
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            spec = importlib.util.spec_from_file_location("pipeline_runner", os.path.join(ROOT, "scripts", "pipeline_runner.py"))
+            self.runner = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self.runner)
+        finally:
+            os.chdir(cwd)
+        self.store = self.runner.store
+
+    def tearDown(self):
+        self.store.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_next_stage(self):
+        stages = ["01", "02", "03", "04", "05"]
+        image = os.path.join(self.tmp, "SHOT_001.jpg")
+        with open(image, "w") as f:
+            f.write("x")
+        next_stage = self.runner.next_stage
+        self.assertEqual(next_stage(shot(), stages), "01")
+        self.assertEqual(next_stage(shot("PROMPT_READY"), stages), "02")
+        self.assertEqual(next_stage(shot("APPROVED"), stages), "03")
+        # an approved shot with its image on disk was approved by the director: on to the video prompt
+        self.assertIsNone(next_stage(shot("APPROVED", image_path=image), stages))
+        self.assertEqual(next_stage(shot("APPROVED", "READY_FOR_PROMPT", image), stages), "04")
+        # ...but a prompt approved by 02 in this run is rendered again
+        self.assertEqual(next_stage(shot("APPROVED", image_path=image), stages, after="02"), "03")
+        self.assertEqual(next_stage(shot("IMAGE_READY", "PROMPT_READY"), stages), "05")
+        self.assertIsNone(next_stage(shot("PROMPT_READY"), ["01", "03"]))
+
+    def test02_shots_stream_through_the_stages(self):
+        batches, active, peak = [], {"03": 0}, {"03": 0}
+        lock = threading.Lock()
+
+        def advance(status, fail=(), sizes=None):
+            def run(shot_ids):
+                if sizes is not None:
+                    sizes.append(len(shot_ids))
+                for sid in shot_ids:
+                    if sid not in fail:
+                        self.store.update(sid, {"stills.status": status})
+                return {sid: sid not in fail for sid in shot_ids}
+            return run
+
+        def render(shot_ids):
+            with lock:
+                active["03"] += 1
+                peak["03"] = max(peak["03"], active["03"])
+            time.sleep(0.02)
+            with lock:
+                active["03"] -= 1
+            for sid in shot_ids:
+                self.store.update(sid, {"stills.status": "IMAGE_READY"})
+            return {sid: True for sid in shot_ids}
+
+        def broken(shot_ids):
+            raise RuntimeError("Gemini is down")
+
+        runners = {"01": advance("PROMPT_READY", fail={"SHOT_004"}), "02": advance("APPROVED", sizes=batches), "03": render}
+        with patch.dict(self.runner.STAGE_RUNNERS, runners):
+            pipeline = self.runner.PipelineRunner(["01", "02", "03"], workers={"01": 2, "02": 1, "03": 3}, queue_size=2)
+            stats = pipeline.run(SHOT_IDS)
+
+        self.assertEqual(stats, {"01": {"done": 9, "failed": 1}, "02": {"done": 9, "failed": 0},
+                                 "03": {"done": 9, "failed": 0}})
+        self.assertEqual(self.store.get("SHOT_004")["stills"]["status"], "PENDING")  # stopped, left for a rerun
+        self.assertEqual({self.store.get(sid)["stills"]["status"] for sid in SHOT_IDS if sid != "SHOT_004"}, {"IMAGE_READY"})
+        # 02 takes the shots already waiting in one request, up to inspect_batch_size
+        self.assertEqual(sum(batches), 9)
+        self.assertLessEqual(max(batches), 4)
+        self.assertLessEqual(peak["03"], 3)
+
+        # a stage that raises stops its shots and the run still ends
+        self.store.update("SHOT_004", {"stills.status": "PROMPT_READY"})
+        with patch.dict(self.runner.STAGE_RUNNERS, {"02": broken}):
+            stats = self.runner.PipelineRunner(["02", "03"], workers={}, queue_size=2).run(["SHOT_004"])
+        self.assertEqual(stats["02"], {"done": 0, "failed": 1})
+        self.assertEqual(self.store.get("SHOT_004")["stills"]["status"], "PROMPT_READY")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, "rate_limits.db")
+        self.limits = {"anthropic": {"rpm": 2, "tpm": 1000}, "fal": {"rpm": 60, "models": {"fal-ai/slow": {"rpm": 1}}}}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test01_buckets_are_shared_between_instances(self):
+        # two limiters on the same file stand in for two processes
+        a = RateLimiter(self.db_path, self.limits)
+        b = RateLimiter(self.db_path, self.limits)
+        self.assertEqual(a._try("anthropic/m", 2, 1000, 300), 0)
+        self.assertEqual(b._try("anthropic/m", 2, 1000, 300), 0)
+        # the RPM bucket is empty now: one request refills in ~30s
+        self.assertAlmostEqual(a._try("anthropic/m", 2, 1000, 300), 30, delta=1)
+        # a different model has its own buckets
+        self.assertEqual(b._try("anthropic/other", 2, 1000, 300), 0)
+
+    def test02_settle_corrects_the_estimate(self):
+        limiter = RateLimiter(self.db_path, self.limits)
+        reservation = limiter.acquire("anthropic", "m", tokens=900)
+        self.assertGreater(limiter._try("anthropic/m", None, 1000, 500), 0)
+        reservation.settle(100)  # the call used far fewer tokens than estimated
+        self.assertEqual(limiter._try("anthropic/m", None, 1000, 500), 0)
+
+    def test03_limits_per_model_and_unthrottled_providers(self):
+        limiter = RateLimiter(self.db_path, self.limits)
+        self.assertEqual(limiter._limits("fal", "fal-ai/slow"), {"rpm": 1})
+        self.assertEqual(limiter._limits("fal", "fal-ai/flux-lora"), {"rpm": 60})
+        limiter.acquire("gemini", "g", tokens=10**9)  # no limits configured - returns at once
+
+
+if __name__ == "__main__":
+    unittest.main()
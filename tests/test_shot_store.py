@@ -0,0 +1,103 @@
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.shot_store import JsonShotStore, SQLiteShotStore, open_shot_store
+
+
+def make_board():
+    return {
+        "SHOT_001": {
+            "scene_ref": "SCENE_1",
+            "stills": {"status": "APPROVED", "prompt_file": "prompts/stills/shot_001.txt"},
+            "video": {"status": "PENDING"},
+        },
+        "SHOT_002": {
+            "scene_ref": "SCENE_1",
+            "stills": {"status": "PROMPT_READY", "prompt_file": "prompts/stills/shot_002.txt"},
+            "video": {"status": "PENDING"},
+        },
+        "SHOT_003": {
+            "scene_ref": "SCENE_2",
+            "stills": {"status": "APPROVED", "prompt_file": "prompts/stills/shot_003.txt"},
+            "video": {"status": "READY_FOR_PROMPT"},
+        },
+    }
+
+
+class TestShotStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.board_path = os.path.join(self.tmp, "shots_board.json")
+        with open(self.board_path, "w", encoding="utf-8") as f:
+            json.dump(make_board(), f)
+        self.config = {"paths": {"shots_board": self.board_path}}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def stores(self):
+        sqlite_store = open_shot_store(self.config)
+        json_store = open_shot_store({**self.config, "pipeline": {"shot_store": "json"}})
+        return [sqlite_store, json_store]
+
+    def test01_sqlite_seeded_from_json(self):
+        store = open_shot_store(self.config)
+        self.assertIsInstance(store, SQLiteShotStore)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, "shots_board.db")))
+        self.assertEqual(store.ids(), ["SHOT_001", "SHOT_002", "SHOT_003"])
+        self.assertEqual(store.all(), make_board())
+
+    def test02_queries(self):
+        for store in self.stores():
+            self.assertEqual(store.ids_by_status("APPROVED"), ["SHOT_001", "SHOT_003"])
+            self.assertEqual(list(store.by_status("READY_FOR_PROMPT", stage="video")), ["SHOT_003"])
+            self.assertEqual(list(store.by_scene("SCENE_1")), ["SHOT_001", "SHOT_002"])
+            self.assertEqual(store.status_counts(), {"APPROVED": 2, "PROMPT_READY": 1})
+            self.assertIsNone(store.get("SHOT_999"))
+
+    def test03_update_single_shot(self):
+        for store in self.stores():
+            shot = store.update("SHOT_002", {"stills.status": "APPROVED", "stills.inspector_feedback": "ok"})
+            self.assertEqual(shot["stills"]["status"], "APPROVED")
+            self.assertEqual(store.get("SHOT_002")["stills"]["inspector_feedback"], "ok")
+            # untouched fields survive the update
+            self.assertEqual(store.get("SHOT_002")["stills"]["prompt_file"], "prompts/stills/shot_002.txt")
+            self.assertEqual(store.ids_by_status("APPROVED"), ["SHOT_001", "SHOT_002", "SHOT_003"])
+
+    def test04_update_many_is_atomic(self):
+        store = open_shot_store(self.config)
+        with self.assertRaises(KeyError):
+            store.update_many({
+                "SHOT_001": {"stills.status": "IMAGE_READY"},
+                "SHOT_999": {"stills.status": "IMAGE_READY"},
+            })
+        self.assertEqual(store.get("SHOT_001")["stills"]["status"], "APPROVED")
+
+    def test05_export_roundtrip(self):
+        store = open_shot_store(self.config)
+        store.update("SHOT_001", {"stills.status": "IMAGE_READY"})
+        out_path = os.path.join(self.tmp, "export.json")
+        self.assertEqual(store.export_json(out_path), 3)
+
+        reloaded = JsonShotStore(out_path)
+        self.assertEqual(reloaded.ids(), ["SHOT_001", "SHOT_002", "SHOT_003"])
+        self.assertEqual(reloaded.get("SHOT_001")["stills"]["status"], "IMAGE_READY")
+
+    def test06_chat_service_status(self):
+        from unittest.mock import patch
+        from chat_service import ChatService
+        with patch("chat_service.open_shot_store", return_value=open_shot_store(self.config)):
+            stats = ChatService.tool_check_status(None)
+        self.assertIn("'TOTAL': 3", stats)
+        self.assertIn("'APPROVED': 2", stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.shot_store import ConflictError, get_path, open_shot_store
+
+WRITERS = 6
+UPDATES_PER_WRITER = 25
+SHOT_IDS = ["SHOT_001", "SHOT_002"]
+
+
+def writer(config, writer_id, updates):
+    """Runs in a separate process: read-modify-write the same shots as everyone else."""
+    store = open_shot_store(config)
+    for i in range(updates):
+        sid = SHOT_IDS[i % len(SHOT_IDS)]
+        store.mutate(sid, lambda shot: {
+            "stills.counter": get_path(shot, "stills.counter", 0) + 1,
+            f"stills.writer_{writer_id}": get_path(shot, f"stills.writer_{writer_id}", 0) + 1,
+        })
+    store.close()
+
+
+@unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "needs fork()")
+class TestShotStoreConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.board_path = os.path.join(self.tmp, "shots_board.json")
+        board = {sid: {"scene_ref": "SCENE_1", "stills": {"status": "APPROVED"}, "video": {"status": "PENDING"}}
+                 for sid in SHOT_IDS}
+        with open(self.board_path, "w", encoding="utf-8") as f:
+            json.dump(board, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_writers(self, config):
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=writer, args=(config, i, UPDATES_PER_WRITER)) for i in range(WRITERS)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(120)
+            self.assertEqual(p.exitcode, 0)
+
+    def assert_no_lost_updates(self, store):
+        shots = store.all()
+        total = sum(get_path(shots[sid], "stills.counter", 0) for sid in SHOT_IDS)
+        self.assertEqual(total, WRITERS * UPDATES_PER_WRITER)
+        for w in range(WRITERS):
+            per_writer = sum(get_path(shots[sid], f"stills.writer_{w}", 0) for sid in SHOT_IDS)
+            self.assertEqual(per_writer, UPDATES_PER_WRITER)
+
+    def test01_sqlite_writers(self):
+        config = {"paths": {"shots_board": self.board_path}}
+        open_shot_store(config).close()  # seed the db before the writers race
+        self.run_writers(config)
+        self.assert_no_lost_updates(open_shot_store(config))
+
+    def test02_json_writers(self):
+        config = {"paths": {"shots_board": self.board_path}, "pipeline": {"shot_store": "json"}}
+        self.run_writers(config)
+        self.assert_no_lost_updates(open_shot_store(config))
+
+    def test03_stale_rev_is_rejected(self):
+        for backend in ("sqlite", "json"):
+            store = open_shot_store({"paths": {"shots_board": self.board_path}, "pipeline": {"shot_store": backend}})
+            shot, rev = store.get_with_rev("SHOT_001")
+            store.update("SHOT_001", {"stills.status": "REJECTED"})
+            with self.assertRaises(ConflictError):
+                store.update("SHOT_001", {"stills.status": "IMAGE_READY"}, expected_rev=rev)
+            self.assertEqual(store.get("SHOT_001")["stills"]["status"], "REJECTED")
+
+            # update_if only applies while the precondition still holds
+            self.assertIsNone(store.update_if("SHOT_001", {"stills.status": "APPROVED"}, {"stills.status": "IMAGE_READY"}))
+            store.update("SHOT_001", {"stills.status": "APPROVED"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import sys
+import os
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from tools.worker_pool import ScriptPool
+from tools.wrapper import compact_result, run_script, stream_script
+
+SCRIPTS = {
+    "ok.py": "import sys, warm\nwarm.runs += 1\nprint('args', sys.argv[1:], 'runs', warm.runs)\n",
+    "fail.py": "import sys\nprint('bad input', file=sys.stderr)\nsys.exit(3)\n",
+    "crash.py": "import os\nos._exit(9)\n",
+    "slow.py": "import time\ntime.sleep(30)\n",
+    "tick.py": "import time\nprint('started', flush=True)\ntime.sleep(30)\n",
+    "warm.py": "runs = 0\n",
+    "events.py": f"import sys\nsys.path.append({ROOT!r})\nfrom utils import progress\nprint('rendering')\nprogress.emit('downloaded', shot_id='SHOT_001', path='x.jpg')\n",
+    "results.py": f"import sys\nsys.path.append({ROOT!r})\nfrom utils import progress\nprint('log ' * 500)\n"
+                  "progress.result('03', 'SHOT_001', 'IMAGE_READY', path='x.jpg', timings={'total_s': 12.345})\n"
+                  "progress.result('03', 'SHOT_002', 'ERROR', error='nsfw')\n",
+    "ask.py": "answer = input('Enter Range (e.g., 1-5), or ENTER for ALL: ')\nprint('answer', repr(answer))\n",
+    "usage.py": f"import sys\nsys.path.append({ROOT!r})\nfrom utils import response_cache\n"
+                "cache = response_cache.open_response_cache({'paths': {'response_cache': 'responses.db'}})\n"
+                "print('misses', cache.stats.get('anthropic', {}).get('misses', 0))\ncache._count('anthropic', 'misses')\n",
+}
+
+
+class TestScriptPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.tmp, "scripts"))
+        for name, code in SCRIPTS.items():
+            with open(os.path.join(cls.tmp, "scripts", name), "w", encoding="utf-8") as f:
+                f.write(code)
+        cls.pool = ScriptPool(cls.tmp, size=1, preload=[])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def script(self, name):
+        return os.path.join(self.tmp, "scripts", name)
+
+    def test01_contract_and_warm_state(self):
+        first = self.pool.run(self.script("ok.py"), ["SHOT_001"])
+        self.assertEqual((first["success"], first["returncode"]), (True, 0))
+        self.assertIn("args ['SHOT_001']", first["output"])
+        # the same interpreter serves the next job: imported modules stay loaded
+        runs = int(first["output"].split("runs ")[1])
+        self.assertIn(f"runs {runs + 1}", self.pool.run(self.script("ok.py"))["output"])
+
+        failed = self.pool.run(self.script("fail.py"))
+        self.assertEqual((failed["success"], failed["returncode"]), (False, 3))
+        self.assertIn("[STDERR]\nbad input", failed["output"])
+
+    def test02_crash_and_timeout_do_not_kill_the_pool(self):
+        crashed = self.pool.run(self.script("crash.py"))
+        self.assertEqual((crashed["success"], crashed["error"]), (False, "WorkerCrashed"))
+        timed_out = self.pool.run(self.script("slow.py"), timeout=1)
+        self.assertEqual(timed_out["error"], "Timeout")
+        self.assertTrue(self.pool.run(self.script("ok.py"))["success"])
+
+        cancel = threading.Event()
+        threading.Timer(0.2, cancel.set).start()
+        self.assertEqual(self.pool.run(self.script("slow.py"), cancel=cancel)["error"], "Cancelled")
+        self.assertTrue(self.pool.run(self.script("ok.py"))["success"])
+
+    def test03_live_lines_and_events(self):
+        lines = []
+        result = self.pool.run(self.script("events.py"), on_line=lambda stream, text: lines.append((stream, text)))
+        self.assertTrue(result["success"])
+        self.assertEqual(lines[0], ("stdout", "rendering"))
+        self.assertIn('"event": "downloaded"', lines[1][1])
+
+    def test04_prompts_and_counters_start_fresh(self):
+        # a queued job has no terminal: input() gets an empty line instead of EOFError
+        asked = self.pool.run(self.script("ask.py"))
+        self.assertTrue(asked["success"], asked["output"])
+        self.assertIn("answer ''", asked["output"])
+
+        # the module stays loaded, but its per-run counters are zeroed for every job
+        for _ in range(2):
+            self.assertIn("misses 0", self.pool.run(self.script("usage.py"))["output"])
+
+    def test05_stream_script_cold(self):
+        async def collect():
+            return [item async for item in stream_script("events.py", warm=False)]
+
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            items = asyncio.run(collect())
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(items[0], {"type": "line", "stream": "stdout", "text": "rendering"})
+        self.assertEqual(items[1], {"type": "event", "event": "downloaded", "shot_id": "SHOT_001", "path": "x.jpg"})
+        self.assertEqual(items[-1]["type"], "result")
+        self.assertEqual(items[-1]["events"], [{"event": "downloaded", "shot_id": "SHOT_001", "path": "x.jpg"}])
+        self.assertEqual(items[-1]["output"], "rendering")
+
+    def test06_closed_stream_cancels_the_run(self):
+        async def first_line():
+            stream = stream_script("tick.py")
+            item = await stream.__anext__()
+            await stream.aclose()  # the SSE client went away
+            return item
+
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        started = time.monotonic()
+        try:
+            with patch("tools.wrapper.warm_pool", return_value=self.pool):
+                item = asyncio.run(first_line())
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(item, {"type": "line", "stream": "stdout", "text": "started"})
+        # the worker is free again long before tick.py would have finished
+        self.assertTrue(self.pool.run(self.script("ok.py"))["success"])
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test07_result_records(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            result = run_script("results.py", warm=False)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(result["results"][0], {
+            "stage": "03", "shot_id": "SHOT_001", "status": "IMAGE_READY", "path": "x.jpg",
+            "error": None, "timings": {"total_s": 12.35},
+        })
+        self.assertEqual(result["summary"], {"IMAGE_READY": 1, "ERROR": 1})
+        # the tool response keeps the outcome per shot, not the log
+        self.assertEqual(compact_result(result), {
+            "success": True, "summary": {"IMAGE_READY": 1, "ERROR": 1},
+            "shots": [{"shot_id": "SHOT_001", "status": "IMAGE_READY", "path": "x.jpg"},
+                      {"shot_id": "SHOT_002", "status": "ERROR", "error": "nsfw"}],
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
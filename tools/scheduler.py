@@ -0,0 +1,175 @@
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+from tools.wrapper import DEFAULT_TIMEOUT, compact_result, run_script
+from utils import progress
+from utils.job_queue import JobQueue, open_job_queue, worker_id
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Stage scripts the queue runs (the generation work that costs money when it runs twice)
+SCRIPTS = ["03_img_gen.py", "04_video_prompt_creator.py", "05_video_inspect.py"]
+
+
+class JobScheduler:
+    """
+    Leases jobs from the persistent queue (utils/job_queue.py) and runs them
+    through the wrapper, `workers` at a time.
+
+    While a job runs its lease is heartbeated, and the latest progress event
+    of every shot is stored on the job (for job_status and the Chainlit view).
+    If the lease is lost (a stall longer than `lease_seconds` let the queue hand
+    the job to another scheduler), the run is killed and its outcome dropped.
+    A job succeeds when the script exits cleanly and no shot reports ERROR;
+    otherwise the queue retries it and finally dead-letters it.
+    Several schedulers (the app, the FastAPI server, the daemon) can serve one
+    queue: each job is leased by one of them only.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = 2, lease_seconds: float = 120.0,
+                 timeout: int = DEFAULT_TIMEOUT, poll_seconds: float = 2.0, scripts: Optional[List[str]] = None):
+        self.queue = queue
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.poll_seconds = poll_seconds
+        self.scripts = scripts or SCRIPTS
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def run_next(self) -> Optional[Dict[str, Any]]:
+        """Runs the next ready job in this thread; returns it as it ended, or None if none was ready."""
+        owner = worker_id()
+        job = self.queue.lease(owner, self.lease_seconds, self.scripts)
+        if job is None:
+            return None
+        logger.info(f"📋 Job {job['id']}: {job['script']} {' '.join(job['args'])} (attempt {job['attempts']})")
+
+        shots: Dict[str, Dict[str, Any]] = {}
+        finished = threading.Event()
+        lost = threading.Event()
+
+        def lease_lost() -> None:
+            if not lost.is_set():
+                logger.warning(f"Job {job['id']}: lease lost (expired or cancelled) - stopping the run")
+                lost.set()
+
+        def on_line(stream: str, text: str) -> None:
+            event = progress.parse(text)
+            if event and event.get("shot_id"):
+                shots[event["shot_id"]] = event
+                if not self.queue.heartbeat(job["id"], owner, self.lease_seconds, progress=dict(shots)):
+                    lease_lost()
+
+        def keep_lease() -> None:
+            while not finished.wait(self.lease_seconds / 3):
+                if not self.queue.heartbeat(job["id"], owner, self.lease_seconds):
+                    lease_lost()
+                    return
+
+        heart = threading.Thread(target=keep_lease, daemon=True)
+        heart.start()
+        try:
+            result = run_script(job["script"], job["args"], timeout=self.timeout, on_line=on_line, cancel=lost)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} crashed the wrapper")
+            result = {"success": False, "output": "", "error": str(e), "results": [], "summary": {}}
+        finally:
+            finished.set()
+
+        if lost.is_set():
+            # another scheduler owns the job now: this run's outcome is not ours to record
+            return self.queue.get(job["id"])
+
+        # a cold run has no live output: its progress is known only now
+        for event in result.get("events", []):
+            if event.get("shot_id"):
+                shots[event["shot_id"]] = event
+        self.queue.heartbeat(job["id"], owner, self.lease_seconds, progress=shots)
+
+        compact = compact_result(result)
+        failed = [s for s in compact["shots"] if s["status"] == "ERROR"]
+        if result.get("success") and not failed:
+            if self.queue.complete(job["id"], owner, compact):
+                logger.info(f"✅ Job {job['id']} done: {compact['summary']}")
+            else:
+                logger.warning(f"Job {job['id']} finished after its lease was lost - result dropped: {compact['summary']}")
+        else:
+            if failed:
+                error = "; ".join(f"{s['shot_id']}: {s.get('error')}" for s in failed)
+            else:
+                error = result.get("error") or f"Exit code {result.get('returncode')}"
+            status = self.queue.fail(job["id"], owner, error, compact)
+            if status is None:
+                logger.warning(f"Job {job['id']} failed after its lease was lost - not recorded ({error})")
+            else:
+                logger.warning(f"❌ Job {job['id']} failed ({error}) -> {status}")
+        return self.queue.get(job["id"])
+
+    def drain(self) -> int:
+        """Runs ready jobs in this thread until none is left; returns how many ran."""
+        ran = 0
+        while self.run_next() is not None:
+            ran += 1
+        return ran
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.run_next()
+            except Exception:
+                logger.exception("Scheduler loop error")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-scheduler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait: bool = True) -> None:
+        """Stops leasing new jobs; running ones finish first when `wait`."""
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def scheduler_from_config(config: Optional[Dict[str, Any]] = None) -> JobScheduler:
+    if config is None:
+        from utils.config_loader import get_config
+        settings = get_config("jobs", {}) or {}
+    else:
+        settings = config.get("jobs", {}) or {}
+    return JobScheduler(
+        open_job_queue(config),
+        workers=int(settings.get("workers", 2)),
+        lease_seconds=float(settings.get("lease_seconds", 120)),
+        timeout=int(settings.get("timeout_seconds", DEFAULT_TIMEOUT)),
+        poll_seconds=float(settings.get("poll_seconds", 2)),
+    )
+
+
+def start_scheduler() -> Optional[JobScheduler]:
+    """
+    Starts the process-wide scheduler (`jobs.embedded` in config.yaml), so queued
+    jobs run even without the scripts/job_scheduler.py daemon; None when disabled.
+    """
+    global _scheduler
+    from utils.config_loader import get_config
+    if not get_config("jobs.embedded", True):
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = scheduler_from_config()
+            _scheduler.start()
+        return _scheduler
@@ -0,0 +1,274 @@
+import io
+import os
+import sys
+import glob
+import time
+import queue
+import runpy
+import logging
+import threading
+import traceback
+import importlib
+import multiprocessing
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import progress
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Imported once per worker, before its first job (the slow part of a cold spawn)
+PRELOAD = [
+    "yaml", "json", "requests", "tenacity", "dotenv", "pydantic",
+    "fal_client", "anthropic", "google.genai",
+    "utils.config_loader", "utils.shot_store", "utils.generation_cache", "utils.upload_cache",
+    "utils.fal_engine", "utils.downloader", "utils.gemini_client", "utils.gemini_cache",
+    "utils.response_cache", "utils.fingerprints", "utils.inspection", "utils.concurrency", "utils.rate_limiter",
+    "claude_client",
+]
+
+# How often a running job checks its cancel event
+CANCEL_POLL_SECONDS = 0.5
+
+# Per-run counters of preloaded modules ("module:function"), zeroed before every job so a
+# run's summary (tokens, cache hits, limiter outcomes) is not the worker's lifetime total
+RUN_RESETS = [
+    "claude_client:reset_usage",
+    "utils.concurrency:reset_counters",
+    "utils.response_cache:reset_stats",
+]
+
+
+def source_signature(project_root: str) -> float:
+    """Latest change to config.yaml or the pipeline code - warm workers older than that are replaced."""
+    paths = [os.path.join(project_root, "config.yaml")]
+    for folder in ("scripts", "utils"):
+        paths += glob.glob(os.path.join(project_root, folder, "*.py"))
+    return max((os.path.getmtime(p) for p in paths if os.path.exists(p)), default=0.0)
+
+
+class _LineWriter(io.StringIO):
+    """Captures a stream and also forwards every complete line (live output for stream_script)."""
+
+    def __init__(self, name: str, send, lock: threading.Lock):
+        super().__init__()
+        self.name = name
+        self.send = send
+        self.lock = lock
+        self.pending = ""
+
+    def write(self, text: str) -> int:
+        with self.lock:
+            super().write(text)
+            self.pending += text
+            *complete, self.pending = self.pending.split("\n")
+            for line in complete:
+                self.send(("line", self.name, line))
+        return len(text)
+
+    def close_lines(self) -> None:
+        with self.lock:
+            if self.pending:
+                self.send(("line", self.name, self.pending))
+                self.pending = ""
+
+
+def _reset_run_state() -> None:
+    for hook in RUN_RESETS:
+        module_name, func = hook.split(":")
+        module = sys.modules.get(module_name)
+        if module is not None:
+            getattr(module, func)()
+
+
+def _run_job(script_path: str, args: List[str], project_root: str, send=None) -> Dict[str, Any]:
+    """
+    Runs a script as __main__ in this process, with the same contract as the subprocess path.
+    stdin reads as a single empty line, so a prompt like 03's "ENTER for ALL" takes its default.
+    """
+    if send:
+        lock = threading.Lock()
+        stdout, stderr = _LineWriter("stdout", send, lock), _LineWriter("stderr", send, lock)
+    else:
+        stdout, stderr = io.StringIO(), io.StringIO()
+    returncode = 0
+    saved_argv, saved_stdin = sys.argv, sys.stdin
+    sys.argv = [script_path] + list(args)
+    sys.stdin = io.StringIO("\n")
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                _reset_run_state()
+                runpy.run_path(script_path, run_name="__main__")
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    returncode = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    returncode = 1
+            except BaseException:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        sys.argv, sys.stdin = saved_argv, saved_stdin
+        os.chdir(project_root)  # a job must not move the next one
+        if send:
+            stdout.close_lines()
+            stderr.close_lines()
+
+    output = stdout.getvalue()
+    if stderr.getvalue():
+        output += "\n[STDERR]\n" + stderr.getvalue()
+    return {"success": returncode == 0, "output": output, "returncode": returncode}
+
+
+def _worker_main(conn, project_root: str, preload: List[str]) -> None:
+    os.chdir(project_root)
+    os.environ[progress.ENV_FLAG] = "1"
+    for path in (project_root, os.path.join(project_root, "scripts")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    with redirect_stdout(io.StringIO()):  # import-time banners (e.g. claude_client) are not job output
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass  # the job that needs it will report the error
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        script_path, args, stream = job
+        conn.send(("result", _run_job(script_path, args, project_root, conn.send if stream else None)))
+
+
+class _Worker:
+    def __init__(self, ctx, project_root: str, preload: List[str]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, project_root, preload), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.signature = source_signature(project_root)
+        self.jobs = 0
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ScriptPool:
+    """
+    Long-lived interpreters with the pipeline modules preloaded, running stage
+    scripts as jobs (runpy, as __main__) instead of a fresh `python script.py`.
+
+    Each job runs in its own worker process, so a crash or a timeout only costs
+    that worker: it is killed and replaced, and the pool keeps serving.
+    Workers are recycled after `max_jobs_per_worker` jobs and whenever
+    config.yaml or the pipeline code changed since they started.
+    """
+
+    def __init__(self, project_root: str, size: int = 2, max_jobs_per_worker: int = 50,
+                 preload: Optional[List[str]] = None):
+        self.project_root = project_root
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.preload = PRELOAD if preload is None else preload
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.project_root, self.preload)
+
+    def _checkout(self) -> _Worker:
+        worker = self._idle.get()
+        stale = worker.signature < source_signature(self.project_root)
+        if stale or worker.jobs >= self.max_jobs_per_worker or not worker.process.is_alive():
+            worker.stop()
+            worker = self._spawn()
+        return worker
+
+    def run(self, script_path: str, args: Optional[List[str]] = None, timeout: float = 600,
+            on_line: Optional[Callable[[str, str], None]] = None,
+            cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Runs the script on a warm worker. `on_line(stream, text)` is called with
+        each stdout / stderr line as it is printed. Setting `cancel` stops the
+        job: its worker is killed and replaced, like on a timeout.
+        """
+        worker = self._checkout()
+        worker.jobs += 1
+        deadline = time.monotonic() + timeout
+        try:
+            worker.conn.send((str(script_path), list(args or []), on_line is not None))
+            while True:
+                if cancel is not None and cancel.is_set():
+                    logger.warning(f"Warm job {script_path} cancelled - replacing its worker")
+                    worker.kill()
+                    worker = self._spawn()
+                    return {"success": False, "output": "Execution cancelled.", "error": "Cancelled"}
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.error(f"Warm job {script_path} timed out after {timeout}s - replacing its worker")
+                    worker.kill()
+                    worker = self._spawn()
+                    return {"success": False, "output": f"Execution timed out after {timeout} seconds.", "error": "Timeout"}
+                if not worker.conn.poll(min(remaining, CANCEL_POLL_SECONDS) if cancel is not None else remaining):
+                    continue
+                kind, *payload = worker.conn.recv()
+                if kind == "result":
+                    return payload[0]
+                on_line(*payload)
+        except (EOFError, OSError) as e:
+            # the worker died mid-job (segfault, os._exit, OOM kill)
+            exitcode = worker.process.exitcode
+            logger.error(f"Warm worker crashed running {script_path} (exit code {exitcode}): {e}")
+            worker.kill()
+            worker = self._spawn()
+            return {"success": False, "output": f"Worker crashed (exit code {exitcode}).",
+                    "returncode": exitcode, "error": "WorkerCrashed"}
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self._idle.get().stop()
+
+
+_pool: Optional[ScriptPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(project_root: str) -> Optional[ScriptPool]:
+    """
+    The process-wide pool (`pipeline.script_pool` in config.yaml), started on
+    first use; None when it is disabled.
+    """
+    global _pool
+    from utils.config_loader import get_config
+    settings = get_config("pipeline.script_pool", {}) or {}
+    if not settings.get("enabled", True):
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ScriptPool(
+                project_root,
+                size=int(settings.get("workers", 2)),
+                max_jobs_per_worker=int(settings.get("max_jobs_per_worker", 50)),
+            )
+        return _pool
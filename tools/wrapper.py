@@ -1,12 +1,15 @@
 
 import subprocess
 import threading
+import asyncio
 import time
 import os
 import sys
 import logging
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, Callable, List, Optional, Dict, Any
+from tools.worker_pool import CANCEL_POLL_SECONDS, get_pool
+from utils import progress
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -14,46 +17,233 @@ logger = logging.getLogger(__name__)
 # Timeout in seconds
 DEFAULT_TIMEOUT = 600  # 10 minutes for long generations
 
-def run_script(script_name: str, args: Optional[List[str]] = None, timeout: int = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+def warm_up() -> None:
+    """
+    Starts the warm pool ahead of the first request (its workers preload in the background).
+    """
+    try:
+        get_pool(os.getcwd())
+    except Exception as e:
+        logger.warning(f"Warm pool unavailable ({e}) - scripts will use cold spawns")
+
+def script_env() -> Dict[str, str]:
+    """
+    Environment of a script run by the wrapper: unbuffered output and progress events on.
+    """
+    return {**os.environ, "PYTHONUNBUFFERED": "1", progress.ENV_FLAG: "1"}
+
+def split_events(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Moves the progress event lines out of the human-readable output into result["events"],
+    with the per-shot result records in result["results"] and their count per status in result["summary"].
+    """
+    lines, events = [], []
+    for line in result.get("output", "").split("\n"):
+        event = progress.parse(line)
+        if event is None:
+            lines.append(line)
+        else:
+            events.append(event)
+    results = [{k: v for k, v in e.items() if k != "event"} for e in events if e.get("event") == "shot_result"]
+    return {**result, "output": "\n".join(lines), "events": events,
+            "results": results, "summary": progress.summarize(results)}
+
+def compact_result(result: Dict[str, Any], tail: int = 15) -> Dict[str, Any]:
+    """
+    A short account of a run for an LLM tool response: count per status and each shot's outcome.
+    The end of the log is only included when there is no per-shot record to explain the run
+    (a crash, a timeout, nothing to do).
+    """
+    shots = []
+    for record in result.get("results", []):
+        shot = {"shot_id": record["shot_id"], "status": record["status"]}
+        if record.get("error"):
+            shot["error"] = record["error"]
+        elif record.get("path"):
+            shot["path"] = record["path"]
+        shots.append(shot)
+    compact = {"success": result.get("success", False), "summary": result.get("summary", {}), "shots": shots}
+    if result.get("error"):
+        compact["error"] = result["error"]
+    if not result.get("success") or not shots:
+        compact["log_tail"] = "\n".join(result.get("output", "").strip().split("\n")[-tail:])
+    return compact
+
+def resolve_script(script_name: str):
+    # Use independent path resolution relative to project root (assuming wrapper is in tools/)
+    # Or rely on CWD being project root. Let's rely on CWD but verify.
+    project_root = Path(os.getcwd())
+    return project_root, project_root / "scripts" / script_name
+
+def warm_pool(project_root: Path):
+    try:
+        return get_pool(str(project_root))
+    except Exception as e:
+        logger.warning(f"Warm pool unavailable ({e}) - falling back to a cold spawn")
+        return None
+
+def run_script(script_name: str, args: Optional[List[str]] = None, timeout: int = DEFAULT_TIMEOUT,
+               warm: bool = True, on_line: Optional[Callable[[str, str], None]] = None,
+               cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
     """
     Executes a script from the 'scripts' directory.
     Captures stdout/stderr and handles timeouts.
+    warm=True runs it on the warm worker pool (tools/worker_pool.py) when it is
+    enabled, and falls back to a fresh subprocess if the pool is unavailable.
+    on_line(stream, text) gets each output line live on the warm pool (a cold run only returns the output).
+    Setting `cancel` kills the run (error "Cancelled").
     """
     if args is None:
         args = []
     
-    # Use independent path resolution relative to project root (assuming wrapper is in tools/)
-    # Or rely on CWD being project root. Let's rely on CWD but verify.
-    project_root = Path(os.getcwd())
-    script_path = project_root / "scripts" / script_name
+    project_root, script_path = resolve_script(script_name)
     
     if not script_path.exists():
         logger.error(f"Script not found at: {script_path}")
         return {"success": False, "output": f"Script not found: {script_name}", "error": "File missing"}
 
+    pool = warm_pool(project_root) if warm else None
+    if pool is not None:
+        logger.info(f"🔥 Wrapper: Running {script_name} {' '.join(args)} on the warm pool")
+        return split_events(pool.run(script_path, args, timeout=timeout, on_line=on_line, cancel=cancel))
+
+    return split_events(run_cold(script_path, args, timeout, project_root, cancel))
+
+async def stream_script(script_name: str, args: Optional[List[str]] = None, timeout: int = DEFAULT_TIMEOUT,
+                        warm: bool = True) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs a script like run_script, yielding while it runs:
+        {"type": "line", "stream": "stdout" | "stderr", "text": ...}
+        {"type": "event", "event": ..., "shot_id": ..., ...}   (utils/progress.py)
+    and last {"type": "result", ...} with the run_script result.
+    Closing the generator early (e.g. an SSE client disconnected) kills the run.
+    """
+    args = args or []
+    project_root, script_path = resolve_script(script_name)
+    if not script_path.exists():
+        logger.error(f"Script not found at: {script_path}")
+        yield {"type": "result", "success": False, "output": f"Script not found: {script_name}", "error": "File missing"}
+        return
+
+    loop = asyncio.get_running_loop()
+    lines: "asyncio.Queue" = asyncio.Queue()
+    cancel = threading.Event()
+    pool = warm_pool(project_root) if warm else None
+    if pool is not None:
+        logger.info(f"🔥 Wrapper: Streaming {script_name} {' '.join(args)} on the warm pool")
+        on_line = lambda stream, text: loop.call_soon_threadsafe(lines.put_nowait, (stream, text))
+        task = loop.run_in_executor(None, lambda: pool.run(script_path, args, timeout=timeout, on_line=on_line,
+                                                           cancel=cancel))
+    else:
+        task = asyncio.ensure_future(stream_cold(script_path, args, timeout, project_root, lines))
+
+    try:
+        while True:
+            getter = asyncio.ensure_future(lines.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                break
+            stream, text = getter.result()
+            event = progress.parse(text)
+            yield {"type": "event", **event} if event else {"type": "line", "stream": stream, "text": text}
+
+        # lines still queued when the script finished
+        while not lines.empty():
+            stream, text = lines.get_nowait()
+            event = progress.parse(text)
+            yield {"type": "event", **event} if event else {"type": "line", "stream": stream, "text": text}
+        yield {"type": "result", **split_events(task.result())}
+    finally:
+        if not task.done():
+            # nobody is reading anymore: stop the run instead of keeping a worker busy
+            logger.warning(f"Stream of {script_name} closed early - cancelling the run")
+            cancel.set()
+            if pool is None:
+                task.cancel()
+
+async def stream_cold(script_path: Path, args: List[str], timeout: int, project_root: Path,
+                      lines: "asyncio.Queue") -> Dict[str, Any]:
+    """
+    Cold-spawn path of stream_script: line-buffered stdout/stderr pushed to `lines` as (stream, text).
+    """
+    logger.info(f"🔧 Wrapper: Streaming {sys.executable} {script_path} {' '.join(args)}")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-u", str(script_path), *args,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        cwd=str(project_root), env=script_env(),
+    )
+    captured = {"stdout": [], "stderr": []}
+
+    async def pump(reader, stream):
+        async for raw in reader:
+            text = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            captured[stream].append(text)
+            lines.put_nowait((stream, text))
+
+    try:
+        await asyncio.wait_for(asyncio.gather(pump(proc.stdout, "stdout"), pump(proc.stderr, "stderr"), proc.wait()), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        logger.error(f"Script {script_path.name} timed out after {timeout}s")
+        return {"success": False, "output": f"Execution timed out after {timeout} seconds.", "error": "Timeout"}
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+
+    output = "\n".join(captured["stdout"])
+    if captured["stderr"]:
+        output += "\n[STDERR]\n" + "\n".join(captured["stderr"])
+    return {"success": proc.returncode == 0, "output": output, "returncode": proc.returncode}
+
+def run_cold(script_path: Path, args: List[str], timeout: int, project_root: Path,
+             cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Runs the script in a fresh interpreter (the original path, and the pool's fallback).
+    """
+    script_name = script_path.name
     cmd = [sys.executable, str(script_path)] + args
     
     logger.info(f"🔧 Wrapper: Executing {' '.join(cmd)}")
     
     try:
-        # Using Popen to capture realtime output if needed, but for now run() is safer for atomic execution
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=timeout,
-            cwd=str(project_root)  # Ensure it runs from project root
+            cwd=str(project_root),  # Ensure it runs from project root
+            env=script_env(),
         )
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                # short waits while a cancel can come, so a cancelled run is killed promptly
+                stdout, stderr = proc.communicate(timeout=max(0.0, min(remaining, CANCEL_POLL_SECONDS) if cancel else remaining))
+                break
+            except subprocess.TimeoutExpired:
+                if cancel is not None and cancel.is_set():
+                    proc.kill()
+                    proc.communicate()
+                    logger.warning(f"Script {script_name} cancelled")
+                    return {"success": False, "output": "Execution cancelled.", "error": "Cancelled"}
+                if time.monotonic() >= deadline:
+                    proc.kill()
+                    proc.communicate()
+                    raise
         
-        success = result.returncode == 0
-        output = result.stdout
-        if result.stderr:
-            output += "\n[STDERR]\n" + result.stderr
+        success = proc.returncode == 0
+        output = stdout
+        if stderr:
+            output += "\n[STDERR]\n" + stderr
             
         return {
             "success": success,
             "output": output,
-            "returncode": result.returncode
+            "returncode": proc.returncode
         }
         
     except subprocess.TimeoutExpired:
@@ -0,0 +1,265 @@
+"""
+Adaptive (AIMD) concurrency limits per provider and model.
+
+Every Claude, Gemini and fal call runs inside a slot of the limiter for its
+(provider, model):
+
+    with adaptive_limiter("anthropic", MODEL_NAME).slot():
+        client.messages.create(...)
+
+The in-flight limit grows additively while calls succeed (+1 per `limit`
+successes, i.e. about +1 per round of calls) and is cut multiplicatively on
+overload: a 429 / 503 / 529 error or a latency average above
+`latency_factor` x the baseline. Only calls started after the previous cut
+can cut again, so a burst of 429s from one round counts once.
+
+Stages size their thread pools with `max_limit` and let the limiter decide
+how many calls actually run. Limits come from `concurrency` in config.yaml
+(per provider, with per-model overrides). Each process publishes its current
+limits to `paths.concurrency_metrics`; `concurrency_metrics()` reads them
+(`GET /api/metrics`), `concurrency_summary()` prints this process's.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.sqlite_db import SQLiteDB
+
+DEFAULTS = {
+    "anthropic": {"initial": 3, "min": 1, "max": 16},
+    "gemini": {"initial": 8, "min": 1, "max": 32},
+    "fal": {"initial": 16, "min": 2, "max": 64},
+}
+OVERLOAD_STATUS = (429, 503, 529)
+PUBLISH_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS limits (
+    key TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    concurrency_limit REAL NOT NULL,
+    in_flight INTEGER NOT NULL,
+    successes INTEGER NOT NULL,
+    overloads INTEGER NOT NULL,
+    latency_s REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (key, pid)
+);
+"""
+
+
+def is_overload(error: BaseException) -> bool:
+    """True for rate-limit / overloaded errors of the Anthropic, google-genai and fal clients."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if status in OVERLOAD_STATUS:
+        return True
+    name = type(error).__name__
+    return name in ("RateLimitError", "OverloadedError", "ResourceExhausted", "ServiceUnavailable") or \
+        "RESOURCE_EXHAUSTED" in str(error)
+
+
+class AdaptiveLimiter:
+    def __init__(self, key: str, initial: int, min_limit: int = 1, max_limit: int = 16,
+                 decrease: float = 0.5, latency_factor: float = 2.0, publish=None):
+        self.key = key
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+        self.latency: Optional[float] = None   # EWMA of successful call latency
+        self.baseline: Optional[float] = None  # lowest recent latency average
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+        self._publish = publish
+        self._published = 0.0
+
+    # --- slots ---
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self) -> float:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def acquire_async(self, poll_interval: float = 0.05) -> float:
+        while not self.try_acquire():
+            await asyncio.sleep(poll_interval)
+        return time.monotonic()
+
+    def release(self, started: float, error: Optional[BaseException] = None) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if error is not None and is_overload(error):
+                self.overloads += 1
+                self._cut(started, now)
+            elif error is None:
+                self.successes += 1
+                self._observe(now - started)
+                if self.latency_factor and self.baseline and self.latency > self.latency_factor * self.baseline:
+                    self._cut(started, now)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+        self._maybe_publish()
+
+    def _observe(self, latency: float) -> None:
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.successes >= 5:
+            # the baseline follows the average down at once and up slowly (the provider may just be slower today)
+            self.baseline = self.latency if self.baseline is None else min(self.latency, self.baseline * 1.01)
+
+    def _cut(self, started: float, now: float) -> None:
+        if started < self._last_cut:
+            return  # started before the last cut - already accounted for
+        self.limit = max(float(self.min_limit), self.limit * self.decrease)
+        self._last_cut = now
+
+    @contextmanager
+    def slot(self):
+        started = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(started, e)
+            raise
+        self.release(started)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        started = await self.acquire_async()
+        try:
+            yield
+        except BaseException as e:
+            self.release(started, e)
+            raise
+        self.release(started)
+
+    # --- metrics ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "key": self.key,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "overloads": self.overloads,
+                "latency_s": round(self.latency, 2) if self.latency is not None else None,
+            }
+
+    def _maybe_publish(self) -> None:
+        now = time.monotonic()
+        if self._publish and now - self._published >= PUBLISH_INTERVAL:
+            self._published = now
+            try:
+                self._publish(self.snapshot())
+            except Exception:
+                pass  # metrics must never fail a call
+
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+_metrics_db: Dict[str, SQLiteDB] = {}
+_metrics_lock = threading.Lock()
+
+
+def _settings(provider: str, model: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    from utils.config_loader import get_config
+    concurrency = get_config("concurrency", {}) or {}
+    own = dict(concurrency.get(provider) or {})
+    models = own.pop("models", None) or {}
+    settings = {**DEFAULTS.get(provider, DEFAULTS["anthropic"]), **own, **(models.get(model) or {})}
+    paths = get_config("paths", {}) or {}
+    return settings, {"latency_factor": concurrency.get("latency_factor", 2.0),
+                      "metrics": paths.get("concurrency_metrics", "production/concurrency.db")}
+
+
+def _metrics(db_path: str) -> SQLiteDB:
+    with _metrics_lock:
+        if db_path not in _metrics_db:
+            _metrics_db[db_path] = SQLiteDB(db_path, SCHEMA)
+        return _metrics_db[db_path]
+
+
+def _publisher(db_path: str):
+    def publish(snapshot: Dict[str, Any]) -> None:
+        with _metrics(db_path).transaction() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO limits
+                   (key, pid, concurrency_limit, in_flight, successes, overloads, latency_s, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (snapshot["key"], os.getpid(), snapshot["limit"], snapshot["in_flight"],
+                 snapshot["successes"], snapshot["overloads"], snapshot["latency_s"], time.time()),
+            )
+    return publish
+
+
+def adaptive_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    """Process-wide limiter for (provider, model), configured by `concurrency` in config.yaml."""
+    with _limiters_lock:
+        if (provider, model) not in _limiters:
+            settings, common = _settings(provider, model)
+            _limiters[(provider, model)] = AdaptiveLimiter(
+                f"{provider}/{model}",
+                initial=settings["initial"],
+                min_limit=settings["min"],
+                max_limit=settings["max"],
+                latency_factor=common["latency_factor"],
+                publish=_publisher(common["metrics"]),
+            )
+        return _limiters[(provider, model)]
+
+
+def reset_counters() -> None:
+    """Zeroes the success / overload counts of this process's limiters; the learned limits are kept."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    for limiter in limiters:
+        with limiter._cond:
+            limiter.successes = 0
+            limiter.overloads = 0
+
+
+def concurrency_summary() -> str:
+    """This process's limits (also published, so the end-of-run state is visible in the metrics)."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    parts = []
+    for limiter in limiters:
+        limiter._published = 0.0
+        limiter._maybe_publish()
+        s = limiter.snapshot()
+        parts.append(f"{s['key']}: limit {s['limit']:g} ({s['successes']} ok, {s['overloads']} overloaded)")
+    return ", ".join(parts) or "no provider calls"
+
+
+def concurrency_metrics(max_age_s: float = 3600) -> List[Dict[str, Any]]:
+    """Current limits published by all processes in the last `max_age_s` seconds."""
+    from utils.config_loader import get_config
+    db_path = (get_config("paths", {}) or {}).get("concurrency_metrics", "production/concurrency.db")
+    rows = _metrics(db_path).conn().execute(
+        """SELECT key, pid, concurrency_limit, in_flight, successes, overloads, latency_s, updated_at
+           FROM limits WHERE updated_at >= ? ORDER BY key, pid""",
+        (time.time() - max_age_s,),
+    ).fetchall()
+    names = ("key", "pid", "limit", "in_flight", "successes", "overloads", "latency_s", "updated_at")
+    return [dict(zip(names, row)) for row in rows]
@@ -0,0 +1,202 @@
+"""
+Reverse dependency index of the production: asset -> scenes -> shots,
+scene -> shots and status -> shots.
+
+Answers "which shots does an edit to MIRI_DIRTY_MUD affect?" without
+scanning the board and following scene_ref / wardrobe_id / location_id for
+every shot. Queries cost O(result). Every query first catches up with what
+changed since the last one:
+
+- shots: only the shots in the store's change log (`ShotStore.changes_since`)
+  are re-read;
+- scenes_db.json / assets.yaml: re-read when the file changed, and only the
+  scenes whose record changed are re-indexed.
+
+    index = open_dep_index(config)
+    index.shots_for_asset("MIRI_DIRTY_MUD")
+    index.shots_for_scene("SCENE_3_STORM")
+    index.shots_with_status("IMAGE_READY")
+    index.resolved_assets("SCENE_3_STORM")   # descriptions as injected by 01
+
+Used by the stage scripts, the chat tools and the review board.
+"""
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import yaml
+
+from utils.fingerprints import resolve_assets
+from utils.shot_store import STAGES, ShotStore, open_shot_store
+
+# scene field -> assets.yaml category it refers to
+ASSET_FIELDS = {"location_id": "locations", "wardrobe_id": "wardrobe"}
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class DependencyIndex:
+    def __init__(self, store: ShotStore, scenes_path: str, assets_path: str):
+        self.store = store
+        self.scenes_path = scenes_path
+        self.assets_path = assets_path
+        self._lock = threading.RLock()
+        self._cursor: Any = None
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+
+        self.scenes: Dict[str, Dict[str, Any]] = {}
+        self.assets: Dict[str, Any] = {}
+        self._shot_keys: Dict[str, Tuple[Optional[str], Dict[str, Optional[str]]]] = {}
+        self._scene_shots: Dict[str, Set[str]] = defaultdict(set)
+        self._status_shots: Dict[Tuple[str, Optional[str]], Set[str]] = defaultdict(set)
+        self._scene_assets: Dict[str, Set[str]] = {}
+        self._asset_scenes: Dict[str, Set[str]] = defaultdict(set)
+        self._resolved: Dict[str, Dict[str, Any]] = {}
+
+    # --- incremental maintenance ---
+
+    def _index_shot(self, shot_id: str, shot: Optional[Dict[str, Any]]) -> None:
+        old = self._shot_keys.pop(shot_id, None)
+        if old:
+            scene_ref, statuses = old
+            self._scene_shots[scene_ref].discard(shot_id)
+            for stage, status in statuses.items():
+                self._status_shots[(stage, status)].discard(shot_id)
+        if shot is None:
+            return
+        scene_ref = shot.get("scene_ref")
+        statuses = {stage: (shot.get(stage) or {}).get("status") for stage in STAGES}
+        self._shot_keys[shot_id] = (scene_ref, statuses)
+        self._scene_shots[scene_ref].add(shot_id)
+        for stage, status in statuses.items():
+            self._status_shots[(stage, status)].add(shot_id)
+
+    def _index_scene(self, scene_id: str, scene: Optional[Dict[str, Any]]) -> None:
+        for asset_id in self._scene_assets.pop(scene_id, set()):
+            self._asset_scenes[asset_id].discard(scene_id)
+        self._resolved.pop(scene_id, None)
+        if scene is None:
+            return
+        asset_ids = {scene[field] for field in ASSET_FIELDS if scene.get(field)}
+        self._scene_assets[scene_id] = asset_ids
+        for asset_id in asset_ids:
+            self._asset_scenes[asset_id].add(scene_id)
+
+    def _load_if_changed(self, path: str, loader) -> Optional[Any]:
+        signature = _file_signature(path)
+        if path in self._signatures and self._signatures[path] == signature:
+            return None
+        self._signatures[path] = signature
+        if signature is None:
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return loader(f) or {}
+
+    def refresh(self) -> Dict[str, List[str]]:
+        """Catches up with the board, scenes and assets. Returns what changed."""
+        with self._lock:
+            changed: Dict[str, List[str]] = {"shots": [], "scenes": [], "assets": []}
+
+            scenes = self._load_if_changed(self.scenes_path, json.load)
+            if scenes is not None:
+                for scene_id in set(self.scenes) | set(scenes):
+                    if self.scenes.get(scene_id) != scenes.get(scene_id):
+                        self._index_scene(scene_id, scenes.get(scene_id))
+                        changed["scenes"].append(scene_id)
+                self.scenes = scenes
+
+            assets = self._load_if_changed(self.assets_path, yaml.safe_load)
+            if assets is not None:
+                for category in set(ASSET_FIELDS.values()):
+                    old, new = self.assets.get(category) or {}, assets.get(category) or {}
+                    changed["assets"] += [a for a in set(old) | set(new) if old.get(a) != new.get(a)]
+                self.assets = assets
+                self._resolved.clear()
+
+            self._cursor, shot_ids = self.store.changes_since(self._cursor)
+            if shot_ids is None:
+                shots = self.store.all()
+                for shot_id in set(self._shot_keys) - set(shots):
+                    self._index_shot(shot_id, None)
+                for shot_id, shot in shots.items():
+                    self._index_shot(shot_id, shot)
+                changed["shots"] = list(shots)
+            else:
+                for shot_id in shot_ids:
+                    self._index_shot(shot_id, self.store.get(shot_id))
+                changed["shots"] = shot_ids
+            return changed
+
+    # --- queries ---
+
+    def shots_for_scene(self, scene_id: str) -> List[str]:
+        with self._lock:
+            self.refresh()
+            return sorted(self._scene_shots.get(scene_id, ()))
+
+    def shots_with_status(self, status: str, stage: str = "stills") -> List[str]:
+        with self._lock:
+            self.refresh()
+            return sorted(self._status_shots.get((stage, status), ()))
+
+    def scenes_for_asset(self, asset_id: str) -> List[str]:
+        with self._lock:
+            self.refresh()
+            return sorted(self._asset_scenes.get(asset_id, ()))
+
+    def shots_for_asset(self, asset_id: str) -> List[str]:
+        with self._lock:
+            self.refresh()
+            shots: Set[str] = set()
+            for scene_id in self._asset_scenes.get(asset_id, ()):
+                shots |= self._scene_shots.get(scene_id, set())
+            return sorted(shots)
+
+    def assets_for_scene(self, scene_id: str) -> List[str]:
+        with self._lock:
+            self.refresh()
+            return sorted(self._scene_assets.get(scene_id, ()))
+
+    def resolved_assets(self, scene_id: str) -> Dict[str, Any]:
+        """Location / wardrobe descriptions of a scene, resolved once per scenes/assets version."""
+        with self._lock:
+            self.refresh()
+            if scene_id not in self._resolved:
+                self._resolved[scene_id] = resolve_assets(self.scenes.get(scene_id) or {}, self.assets)
+            return self._resolved[scene_id]
+
+    def affected_shots(self, ref: str) -> Dict[str, Any]:
+        """Shots depending on `ref`, which may be an asset ID or a scene ID."""
+        with self._lock:
+            self.refresh()
+            if ref in self.scenes:
+                return {"kind": "scene", "scenes": [ref], "shots": self.shots_for_scene(ref)}
+            return {"kind": "asset", "scenes": self.scenes_for_asset(ref), "shots": self.shots_for_asset(ref)}
+
+
+_shared: Dict[Tuple[Any, ...], DependencyIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def open_dep_index(config: Optional[Dict[str, Any]] = None, store: Optional[ShotStore] = None) -> DependencyIndex:
+    """Process-wide index for the board / scenes_db / assets configured in config.yaml."""
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+    scenes_path = paths.get("scenes_db", "assets/scenes_db.json")
+    assets_path = paths.get("assets", "assets/assets.yaml")
+    key = (scenes_path, assets_path, paths.get("shots_board"), paths.get("shots_db"), id(store) if store else None)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = DependencyIndex(store or open_shot_store(config), scenes_path, assets_path)
+        return _shared[key]
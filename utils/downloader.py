@@ -0,0 +1,150 @@
+"""
+Downloads and zero-copy publishing of generated media.
+
+`download_file` streams a URL through one shared keep-alive session pool,
+writes it in chunks to a temp file next to the destination, verifies the
+checksum and renames it into place, so readers never see a half-written
+image. Because every write is a rename (a new inode), the same bytes can
+safely be published under other names with hardlinks: `link_file` /
+`sync_links` fill the flat and upload folders that way (symlink, then copy,
+as fallbacks) and only touch entries that actually changed.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 1024 * 1024
+POOL_SIZE = 16
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class ChecksumError(Exception):
+    """Downloaded bytes do not match the expected sha256."""
+
+
+def get_session() -> requests.Session:
+    """Process-wide session; connections to the same host are kept alive and reused."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_file(url: str, dest_path: str, expected_sha256: Optional[str] = None, timeout: float = 120) -> Dict[str, object]:
+    """
+    Streams `url` into `dest_path` atomically.
+    Returns {"path", "sha256", "size"}; raises on HTTP errors or a checksum mismatch
+    (the destination is left untouched in both cases).
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with get_session().get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        sha256 = digest.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256:
+            raise ChecksumError(f"{url}: expected sha256 {expected_sha256}, got {sha256}")
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {"path": dest_path, "sha256": sha256, "size": size}
+
+
+def _is_current(src_path: str, dest_path: str) -> bool:
+    if not os.path.lexists(dest_path):
+        return False
+    try:
+        if os.path.samefile(src_path, dest_path):
+            return True
+    except OSError:  # dangling symlink
+        return False
+    if os.path.islink(dest_path):
+        return False
+    src, dest = os.stat(src_path), os.stat(dest_path)
+    if src.st_dev == dest.st_dev:
+        # same filesystem: anything but the same inode is stale
+        return False
+    # cross-device fallback copies keep the source mtime (copy2)
+    return src.st_size == dest.st_size and src.st_mtime == dest.st_mtime
+
+
+def link_file(src_path: str, dest_path: str, allow_symlink: bool = True) -> str:
+    """
+    Publishes `src_path` under `dest_path` without copying bytes when possible.
+    Returns how: "unchanged", "hardlink", "symlink" or "copy".
+
+    Pass allow_symlink=False when `dest_path` must survive `src_path` being
+    replaced or deleted (e.g. cache blobs): then only hardlink or copy is used.
+    """
+    if _is_current(src_path, dest_path):
+        return "unchanged"
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    mode = "hardlink"
+    try:
+        try:
+            os.link(src_path, tmp_path)
+        except OSError:  # other filesystem / no hardlink support
+            try:
+                if not allow_symlink:
+                    raise OSError("symlinks not allowed")
+                os.symlink(os.path.abspath(src_path), tmp_path)
+                mode = "symlink"
+            except OSError:
+                shutil.copy2(src_path, tmp_path)
+                mode = "copy"
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+    return mode
+
+
+def sync_links(entries: Dict[str, str], dest_dir: str, prune: bool = True) -> Dict[str, int]:
+    """
+    Makes `dest_dir` contain exactly `entries` ({file name: source path}).
+    New or changed entries are linked, unchanged ones are left alone and, with
+    `prune`, files that are no longer listed are removed.
+    Returns counts per outcome ("unchanged", "hardlink", ..., "removed").
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    counts: Dict[str, int] = {}
+    for name, src_path in entries.items():
+        mode = link_file(src_path, os.path.join(dest_dir, name))
+        counts[mode] = counts.get(mode, 0) + 1
+
+    if prune:
+        for name in os.listdir(dest_dir):
+            path = os.path.join(dest_dir, name)
+            if name not in entries and (os.path.isfile(path) or os.path.islink(path)):
+                os.remove(path)
+                counts["removed"] = counts.get("removed", 0) + 1
+    return counts
@@ -0,0 +1,184 @@
+"""
+Async job engine for fal.ai queue requests.
+
+All jobs are submitted up front (at most `max_submissions` submit calls in
+flight at once), then followed through fal's queue status events, and each
+result is downloaded as soon as that job completes (at most `max_downloads`
+downloads at once). No thread is parked on a blocking submit().get().
+Within `max_submissions`, submits also take a request from the shared
+per-minute quota (utils/rate_limiter.py) and a slot of the application's
+adaptive limiter (utils/concurrency.py), which backs off on 429s.
+
+Shared by 03_img_gen, repair_shot and any future stage that runs fal models
+(e.g. Kling image-to-video):
+
+    engine = FalJobEngine(max_submissions=16, max_downloads=4, on_done=commit)
+    engine.run_sync([FalJob("SHOT_001", "fal-ai/flux-lora", args, download=save)])
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import fal_client
+
+from utils.concurrency import adaptive_limiter
+from utils.rate_limiter import open_rate_limiter
+
+
+class FalJob:
+    """
+    One request to a fal application.
+
+    `request_id` resumes a request submitted by an earlier run instead of
+    submitting (and paying for) a new one. `download`, if given, runs in a
+    worker thread with the fal result and its return value becomes `output`.
+    `context` is free-form caller data carried along with the job.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        application: str,
+        arguments: Dict[str, Any],
+        request_id: Optional[str] = None,
+        download: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        context: Optional[Dict[str, Any]] = None,
+    ):
+        self.key = key
+        self.application = application
+        self.arguments = arguments
+        self.request_id = request_id
+        self.download = download
+        self.context = context or {}
+        self.resumed = False
+        self.result: Optional[Dict[str, Any]] = None
+        self.output: Any = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.result is not None
+
+
+class FalJobEngine:
+    """
+    Callbacks (all called from the event loop thread, keep them short):
+        on_submitted(job)             - right after the request ID is known
+        on_event(job, event, **info)  - submitted / queued / in_progress /
+                                        completed / failed / resume_failed
+        on_done(job)                  - once per job, success or failure
+    """
+
+    def __init__(
+        self,
+        max_submissions: int = 16,
+        max_downloads: int = 4,
+        poll_interval: float = 1.0,
+        submit_attempts: int = 3,
+        on_submitted: Optional[Callable[[FalJob], None]] = None,
+        on_event: Optional[Callable[..., None]] = None,
+        on_done: Optional[Callable[[FalJob], None]] = None,
+    ):
+        self.max_submissions = max_submissions
+        self.max_downloads = max_downloads
+        self.poll_interval = poll_interval
+        self.submit_attempts = submit_attempts
+        self.on_submitted = on_submitted
+        self.on_event = on_event
+        self.on_done = on_done
+
+    def _emit(self, job: FalJob, event: str, **info: Any) -> None:
+        if self.on_event:
+            self.on_event(job, event, **info)
+
+    async def run(self, jobs: Iterable[FalJob]) -> List[FalJob]:
+        jobs = list(jobs)
+        # Semaphores are created inside the running loop (required on Python 3.9).
+        self._submit_sem = asyncio.Semaphore(self.max_submissions)
+        self._download_sem = asyncio.Semaphore(self.max_downloads)
+        client = fal_client.AsyncClient()
+        await asyncio.gather(*(self._run_job(client, job) for job in jobs))
+        return jobs
+
+    def run_sync(self, jobs: Iterable[FalJob]) -> List[FalJob]:
+        return asyncio.run(self.run(jobs))
+
+    def run_one(self, application: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Blocking helper for single interactive calls (e.g. repair_shot)."""
+        job = self.run_sync([FalJob(application, application, arguments)])[0]
+        if not job.ok:
+            raise RuntimeError(f"fal request to {application} failed: {job.error}")
+        return job.result
+
+    async def _submit(self, client: fal_client.AsyncClient, job: FalJob):
+        if job.request_id:
+            handle = client.get_handle(job.application, job.request_id)
+            try:
+                await handle.status()
+                job.resumed = True
+                return handle
+            except Exception as e:
+                self._emit(job, "resume_failed", request_id=job.request_id, error=str(e))
+                job.request_id = None
+
+        async with self._submit_sem:
+            for attempt in range(1, self.submit_attempts + 1):
+                try:
+                    await open_rate_limiter().acquire_async("fal", job.application)
+                    async with adaptive_limiter("fal", job.application).slot_async():
+                        handle = await client.submit(job.application, arguments=job.arguments)
+                    break
+                except Exception:
+                    if attempt == self.submit_attempts:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+
+        job.request_id = handle.request_id
+        if self.on_submitted:
+            self.on_submitted(job)
+        return handle
+
+    async def _run_job(self, client: fal_client.AsyncClient, job: FalJob) -> None:
+        started = time.monotonic()
+        try:
+            handle = await self._submit(client, job)
+            job.timings["submit_s"] = time.monotonic() - started
+            self._emit(job, "submitted", request_id=job.request_id, resumed=job.resumed)
+
+            last_state = None
+            async for status in handle.iter_events(interval=self.poll_interval):
+                if isinstance(status, fal_client.Queued):
+                    state = ("queued", status.position)
+                    if state != last_state:
+                        self._emit(job, "queued", position=status.position)
+                elif isinstance(status, fal_client.InProgress):
+                    state = ("in_progress", None)
+                    if state != last_state:
+                        self._emit(job, "in_progress")
+                elif isinstance(status, fal_client.Completed) and status.error:
+                    raise RuntimeError(f"{status.error_type or 'error'}: {status.error}")
+                else:
+                    state = ("completed", None)
+                last_state = state
+
+            job.result = await client.result(job.application, job.request_id)
+            job.timings["generate_s"] = time.monotonic() - started
+
+            if job.download:
+                async with self._download_sem:
+                    download_started = time.monotonic()
+                    job.output = await asyncio.to_thread(job.download, job.result)
+                    job.timings["download_s"] = time.monotonic() - download_started
+            self._emit(job, "completed")
+        except Exception as e:
+            job.error = str(e)
+            self._emit(job, "failed", error=job.error)
+
+        job.timings["total_s"] = time.monotonic() - started
+        if self.on_done:
+            try:
+                self.on_done(job)
+            except Exception as e:
+                # A failing callback must not cancel the other jobs in the batch.
+                job.error = job.error or f"on_done failed: {e}"
@@ -0,0 +1,116 @@
+"""
+Input fingerprints for make-style incremental builds of the shot pipeline.
+
+Every stage records on the shot a fingerprint of the inputs it ran with
+(`fingerprints.<stage>`): brief, constraints, scene record, resolved asset
+descriptions, prompt text, system-prompt / rules version and model, as
+relevant to that stage. `plan_shot` compares the recorded fingerprints with
+the current ones and reports the first stale stage of each track; every
+later stage of that track re-runs after it (its input is that stage's output).
+
+    python scripts/build.py plan     # what is stale and why
+    python scripts/build.py build    # re-run only that
+
+The stills track is 01 -> 02 -> 03 and the video track 04 -> 05. A stage
+with no recorded fingerprint that evidently ran before this was introduced
+is reported as "untracked" and only rebuilt on request (`build.py stamp`
+records the current fingerprints for it instead).
+"""
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.generation_cache import cache_key
+
+TRACKS = {"stills": ("01", "02", "03"), "video": ("04", "05")}
+STAGE_TRACK = {stage: track for track, stages in TRACKS.items() for stage in stages}
+
+# status a shot is reset to so that the stage picks it up again
+INPUT_STATUS = {
+    "01": ("stills", "PENDING"),
+    "02": ("stills", "PROMPT_READY"),
+    "03": ("stills", "APPROVED"),
+    "04": ("video", "READY_FOR_PROMPT"),
+    "05": ("video", "PROMPT_READY"),
+}
+
+# statuses that show a stage already ran for the shot (for shots from before fingerprints)
+_RAN = {
+    "01": lambda s: s["stills"]["status"] != "PENDING",
+    "02": lambda s: s["stills"]["status"] in ("APPROVED", "IMAGE_READY", "REJECTED"),
+    "03": lambda s: bool(s["stills"].get("image_path")),
+    "04": lambda s: s["video"]["status"] in ("PROMPT_READY", "VIDEO_READY"),
+    "05": lambda s: s["video"]["status"] == "VIDEO_READY",
+}
+
+
+def fingerprint(**inputs: Any) -> str:
+    return cache_key(inputs)
+
+
+def text_version(text: str) -> str:
+    """Short version id of a system prompt / rulebook."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def resolve_assets(scene: Dict[str, Any], assets: Dict[str, Any]) -> Dict[str, Any]:
+    """The asset descriptions a scene uses (as injected by 01)."""
+    loc_id = scene.get("location_id")
+    ward_id = scene.get("wardrobe_id")
+    return {
+        "location": (assets.get("locations") or {}).get(loc_id, {}).get("description", loc_id),
+        "wardrobe": (assets.get("wardrobe") or {}).get(ward_id, {}).get("description", ward_id),
+    }
+
+
+def brief_inputs(shot: Dict[str, Any], scene: Optional[Dict[str, Any]], assets: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    inputs = {"brief": shot.get("brief"), "constraints": shot.get("constraints", {}), "scene": scene}
+    if assets is not None and scene is not None:
+        inputs["assets"] = resolve_assets(scene, assets)
+    return inputs
+
+
+def recorded(shot: Dict[str, Any], stage: str) -> Optional[str]:
+    return (shot.get("fingerprints") or {}).get(stage)
+
+
+def plan_shot(shot: Dict[str, Any], current: Callable[[str], Optional[str]],
+              stages: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Per track, the first stage that has to re-run and why.
+
+    `current(stage)` returns the fingerprint of the stage's inputs now, or None
+    when its output is missing (which makes the stage stale as well).
+    Returns {track: {"stage", "reason", "reruns": [stages]}}; tracks that are
+    up to date are left out.
+    """
+    result = {}
+    for track, track_stages in TRACKS.items():
+        track_stages = [s for s in track_stages if stages is None or s in stages]
+        for i, stage in enumerate(track_stages):
+            old = recorded(shot, stage)
+            if old is None and not _RAN[stage](shot):
+                break  # not built yet - the normal pipeline run handles it
+            new = current(stage)
+            if new is None:
+                reason = "output missing"
+            elif old is None:
+                reason = "untracked"
+            elif old != new:
+                reason = "inputs changed"
+            else:
+                continue
+            result[track] = {"stage": stage, "reason": reason, "reruns": track_stages[i:]}
+            break
+    return result
+
+
+def stamp_changes(shot: Dict[str, Any], current: Callable[[str], Optional[str]],
+                  stages: Optional[List[str]] = None) -> Dict[str, str]:
+    """Changes that record the current fingerprints of stages that ran but were never fingerprinted."""
+    changes = {}
+    for stage in STAGE_TRACK:
+        if (stages is None or stage in stages) and recorded(shot, stage) is None and _RAN[stage](shot):
+            new = current(stage)
+            if new is not None:
+                changes[f"fingerprints.{stage}"] = new
+    return changes
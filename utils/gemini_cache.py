@@ -0,0 +1,138 @@
+"""
+Gemini context caches for static prompt prefixes (inspector rulebooks,
+the chat project context).
+
+A cache is identified by `<name>-<hash>`, where the hash covers the model,
+system instruction and contents, i.e. it is the rules version. `acquire()`
+reuses a live cache with that display name (another process, or a run that
+crashed before cleanup) instead of creating a duplicate. While held, a
+background thread pushes the TTL forward so a long batch never loses its
+cache, and `release()` deletes it unless `keep=True` - only if this instance
+created it: a reused cache may still be in use by the process that made it,
+so it is left to expire by its TTL.
+
+    with GeminiContextCache(model, "stills-rulebook", RULEBOOK) as rulebook:
+        generate_text(model, contents, context_cache=rulebook)
+
+If the cache cannot be created (e.g. the rulebook is below the model's
+minimum cacheable size), `config_kwargs()` falls back to sending the system
+instruction inline, so callers never need a second code path. The same
+happens when a call finds the cache gone (`drop()`, see generate_text).
+"""
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+from utils.gemini_client import get_gemini_client
+
+
+class GeminiContextCache:
+    def __init__(
+        self,
+        model: str,
+        name: str,
+        system_instruction: str,
+        contents: Optional[List[Any]] = None,
+        ttl_minutes: float = 30,
+        keep: bool = False,
+        client: Any = None,
+    ):
+        self.model = model
+        self.system_instruction = system_instruction
+        self.contents = contents or []
+        self.ttl_minutes = ttl_minutes
+        self.keep = keep
+        self.client = client or get_gemini_client()
+        digest = hashlib.sha256(
+            "\0".join([model, system_instruction] + [str(c) for c in self.contents]).encode("utf-8")
+        ).hexdigest()
+        self.version = digest[:12]
+        self.display_name = f"{name}-{self.version}"
+        self.cache_name: Optional[str] = None
+        self.reused = False
+        self.created = False
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+    def _ttl(self) -> str:
+        return f"{int(self.ttl_minutes * 60)}s"
+
+    def _find_existing(self) -> Optional[str]:
+        for cache in self.client.caches.list():
+            if cache.display_name == self.display_name and (cache.model or "").endswith(self.model):
+                return cache.name
+        return None
+
+    def acquire(self) -> Optional[str]:
+        """Returns the cache name (reused or new), or None if caching is unavailable."""
+        try:
+            existing = self._find_existing()
+            if existing:
+                self.client.caches.update(name=existing, config=types.UpdateCachedContentConfig(ttl=self._ttl()))
+                self.cache_name, self.reused = existing, True
+            else:
+                cache = self.client.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=self.display_name,
+                        system_instruction=self.system_instruction,
+                        contents=self.contents or None,
+                        ttl=self._ttl(),
+                    ),
+                )
+                self.cache_name, self.created = cache.name, True
+        except Exception as e:
+            print(f"⚠️ Context cache '{self.display_name}' unavailable, sending it inline: {e}")
+            self.cache_name = None
+            return None
+
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresher.start()
+        return self.cache_name
+
+    def _refresh_loop(self) -> None:
+        # extend at half the TTL, so the cache never expires mid-batch
+        while not self._stop.wait(self.ttl_minutes * 30):
+            if not self.cache_name:
+                return
+            try:
+                self.client.caches.update(name=self.cache_name, config=types.UpdateCachedContentConfig(ttl=self._ttl()))
+            except Exception as e:
+                print(f"⚠️ Could not refresh context cache {self.cache_name}: {e}")
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._refresher:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+        if self.cache_name and self.created and not self.keep:
+            try:
+                self.client.caches.delete(name=self.cache_name)
+            except Exception as e:
+                print(f"⚠️ Could not delete context cache {self.cache_name}: {e}")
+        self.cache_name = None
+        self.created = False
+
+    def drop(self, reason: Any = None) -> None:
+        """Stops using a cache that no longer exists (deleted elsewhere, expired); calls go inline from now on."""
+        if self.cache_name:
+            print(f"⚠️ Context cache {self.cache_name} is gone ({reason}) - sending '{self.display_name}' inline.")
+        self.cache_name = None
+        self.created = False
+        self._stop.set()
+
+    def config_kwargs(self) -> Dict[str, Any]:
+        """GenerateContentConfig arguments: the cache when held, the inline system instruction otherwise."""
+        if self.cache_name:
+            return {"cached_content": self.cache_name}
+        return {"system_instruction": self.system_instruction}
+
+    def __enter__(self) -> "GeminiContextCache":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
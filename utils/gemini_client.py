@@ -0,0 +1,86 @@
+"""
+Shared google-genai client for the inspectors (02, 05) and ChatService.
+
+One `genai.Client` per API key per process (it is thread-safe and keeps its
+HTTP connections alive), plus `generate_text`, a retrying text call with
+exponential backoff for the stage scripts (with `context_cache`, a call that
+finds the context cache gone is repeated with the rules inline). Each attempt draws from the shared
+RPM / TPM buckets (utils/rate_limiter.py) and runs inside the adaptive
+concurrency slot of its model (utils/concurrency.py).
+"""
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from google import genai
+from google.genai import types
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from utils.concurrency import adaptive_limiter
+from utils.rate_limiter import estimate_tokens, open_rate_limiter
+
+_clients: Dict[str, genai.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(api_key: Optional[str] = None) -> genai.Client:
+    api_key = api_key or os.environ.get("GEMINI_API_KEY")
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = genai.Client(api_key=api_key)
+        return _clients[api_key]
+
+
+def is_cache_missing(error: Exception) -> bool:
+    """True for the error of a call that named a context cache which no longer exists."""
+    text = str(error).lower()
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return (code in (403, 404) or "not_found" in text or "not found" in text) and "cache" in text
+
+
+@retry(stop=stop_after_attempt(4), wait=wait_exponential(multiplier=1, min=2, max=30), reraise=True)
+def generate_text(model: str, contents: Any, system_instruction: Optional[str] = None,
+                  temperature: Optional[float] = None, context_cache: Any = None, **config_kwargs: Any) -> str:
+    """
+    generate_content + .text, retried with backoff on any API error.
+    `context_cache` (utils/gemini_cache.GeminiContextCache) supplies the cached
+    system instruction; if that cache was deleted or expired meanwhile, it is
+    dropped and the call is repeated with the instruction inline.
+    """
+    if context_cache is None:
+        return _generate(model, contents, system_instruction, temperature, config_kwargs)
+    cached = context_cache.cache_name
+    try:
+        return _generate(model, contents, system_instruction, temperature, {**config_kwargs, **context_cache.config_kwargs()})
+    except Exception as e:
+        if not cached or not is_cache_missing(e):
+            raise
+        context_cache.drop(e)
+    return _generate(model, contents, system_instruction, temperature, {**config_kwargs, **context_cache.config_kwargs()})
+
+
+def _generate(model: str, contents: Any, system_instruction: Optional[str], temperature: Optional[float],
+              config_kwargs: Dict[str, Any]) -> str:
+    config_kwargs = dict(config_kwargs)
+    system_instruction = config_kwargs.pop("system_instruction", None) or system_instruction
+    reservation = open_rate_limiter().acquire(
+        "gemini", model, estimate_tokens(contents, system_instruction) + config_kwargs.get("max_output_tokens", 0),
+    )
+    with adaptive_limiter("gemini", model).slot():
+        response = get_gemini_client().models.generate_content(
+            model=model,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                system_instruction=system_instruction,
+                temperature=temperature,
+                **config_kwargs,
+            ),
+        )
+    reservation.settle(usage_tokens(response))
+    return response.text
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    """Total tokens of a generate_content response, if reported."""
+    total = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+    return total if isinstance(total, int) else None
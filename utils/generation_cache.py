@@ -0,0 +1,132 @@
+"""
+Content-addressed cache of generated media.
+
+The key is a hash of everything that determines the output (prompt, model,
+LoRA, size, steps, guidance, seed), so an unchanged shot maps to the same key
+and its stored image is reused instead of paying for a new render. Blobs live
+under <root>/<key[:2]>/<key><ext>, with a SQLite index tracking size and last
+use for the size/age eviction policy.
+
+Blobs are shared with the output folders through hardlinks, which is safe
+because every writer replaces files by rename (utils.downloader) instead of
+rewriting them in place.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from utils.downloader import link_file
+from utils.sqlite_db import SQLiteDB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+"""
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    """Stable hash of the generation parameters."""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    def __init__(self, root: str, max_bytes: Optional[int] = None, max_age_days: Optional[float] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(root, exist_ok=True)
+        self.db = SQLiteDB(os.path.join(root, "index.db"), SCHEMA)
+
+    def _blob_path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}{ext}")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Returns the cached file for `key`, or None. A hit refreshes its LRU timestamp."""
+        row = self.db.conn().execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row[0]):
+            self.db.conn().execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        self.db.conn().execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, src_path: str, meta: Optional[Dict[str, Any]] = None) -> str:
+        """Stores `src_path` in the cache under `key` and returns the cached path."""
+        blob_path = self._blob_path(key, os.path.splitext(src_path)[1])
+        link_file(src_path, blob_path, allow_symlink=False)
+
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, created_at, last_used, meta) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob_path, os.path.getsize(blob_path), now, now, json.dumps(meta or {}, ensure_ascii=False)),
+            )
+        return blob_path
+
+    def restore(self, key: str, dest_path: str) -> bool:
+        """Puts the cached output for `key` at `dest_path`. Returns False on a miss."""
+        cached = self.lookup(key)
+        if not cached:
+            return False
+        link_file(cached, dest_path, allow_symlink=False)
+        return True
+
+    def total_bytes(self) -> int:
+        return self.db.conn().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Drops entries unused for longer than max_age_days, then the least
+        recently used ones until the cache fits in max_bytes.
+        Returns the number of removed entries.
+        """
+        victims = []
+        conn = self.db.conn()
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            victims += conn.execute("SELECT key, path, size FROM entries WHERE last_used < ?", (cutoff,)).fetchall()
+        if self.max_bytes:
+            excess = self.total_bytes() - sum(v[2] for v in victims) - self.max_bytes
+            if excess > 0:
+                aged = {v[0] for v in victims}
+                for key, path, size in conn.execute("SELECT key, path, size FROM entries ORDER BY last_used"):
+                    if excess <= 0:
+                        break
+                    if key in aged:
+                        continue
+                    victims.append((key, path, size))
+                    excess -= size
+
+        with self.db.transaction() as conn:
+            for key, path, _ in victims:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        for _, path, _ in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(victims)
+
+
+def open_image_cache(config: Dict[str, Any]) -> GenerationCache:
+    """Image cache configured by `paths.image_cache` and `cache.images` in config.yaml."""
+    images_dir = config.get("paths", {}).get("images_output", "production/images")
+    root = config.get("paths", {}).get("image_cache", os.path.join(images_dir, "_cache"))
+    settings = (config.get("cache") or {}).get("images") or {}
+    max_size_mb = settings.get("max_size_mb")
+    return GenerationCache(
+        root,
+        max_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb else None,
+        max_age_days=settings.get("max_age_days"),
+    )
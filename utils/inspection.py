@@ -0,0 +1,108 @@
+"""
+Structured inspector verdicts and the inspection ledger (02 / 05).
+
+Inspectors answer with a verdict instead of re-emitting the whole prompt:
+"unchanged", or a short list of find/replace edits applied locally. A clean
+prompt therefore costs a handful of output tokens.
+
+The ledger records (prompt hash, rules version, model, stage) -> verdict.
+A prompt that already passed unchanged under the current rulebook and model
+is approved on the next run without calling the model again.
+"""
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+from utils.sqlite_db import SQLiteDB
+
+VERDICT_INSTRUCTIONS = """
+--- OUTPUT FORMAT (JSON) ---
+- verdict: "unchanged" if the input prompt already follows every rule, otherwise "edits".
+- violated_rules: short names of the broken rules (empty when unchanged).
+- edits: the MINIMAL changes, each {"find": exact text copied from the input prompt, "replace": new text}.
+  Use an empty "find" to append text at the end. Do NOT rewrite the whole prompt.
+"""
+
+
+class PromptEdit(BaseModel):
+    find: str
+    replace: str
+
+
+class InspectionVerdict(BaseModel):
+    verdict: Literal["unchanged", "edits"]
+    violated_rules: List[str]
+    edits: List[PromptEdit]
+
+
+class ShotVerdict(InspectionVerdict):
+    """One verdict inside a multi-shot response."""
+    shot_id: str
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
+def apply_edits(prompt: str, edits: List[PromptEdit]) -> str:
+    """Applies the edits in order. Raises ValueError if a `find` is not in the prompt."""
+    for edit in edits:
+        if not edit.find:
+            prompt = f"{prompt.rstrip()} {edit.replace.strip()}"
+        elif edit.find in prompt:
+            prompt = prompt.replace(edit.find, edit.replace, 1)
+        else:
+            raise ValueError(f"edit target not found in prompt: {edit.find[:60]!r}")
+    return prompt
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    prompt_hash TEXT NOT NULL,
+    rules_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    violated_rules TEXT NOT NULL,
+    shot_id TEXT,
+    inspected_at REAL NOT NULL,
+    PRIMARY KEY (prompt_hash, rules_version, model, stage)
+);
+"""
+
+
+class InspectionLedger:
+    def __init__(self, db_path: str):
+        self.db = SQLiteDB(db_path, SCHEMA)
+
+    def passed(self, prompt: str, rules_version: str, model: str, stage: str) -> bool:
+        """True if this exact prompt was judged unchanged under these rules and model."""
+        row = self.db.conn().execute(
+            "SELECT verdict FROM inspections WHERE prompt_hash = ? AND rules_version = ? AND model = ? AND stage = ?",
+            (prompt_hash(prompt), rules_version, model, stage),
+        ).fetchone()
+        return bool(row) and row[0] == "unchanged"
+
+    def record(self, prompt: str, rules_version: str, model: str, stage: str,
+               verdict: InspectionVerdict, shot_id: Optional[str] = None) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO inspections
+                   (prompt_hash, rules_version, model, stage, verdict, violated_rules, shot_id, inspected_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (prompt_hash(prompt), rules_version, model, stage, verdict.verdict,
+                 json.dumps(verdict.violated_rules, ensure_ascii=False), shot_id, time.time()),
+            )
+
+
+def open_inspection_ledger(config: Optional[Dict[str, Any]] = None) -> InspectionLedger:
+    """Ledger configured by `paths.inspection_ledger` in config.yaml."""
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+    return InspectionLedger(paths.get("inspection_ledger", "production/inspection_ledger.db"))
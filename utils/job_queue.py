@@ -0,0 +1,254 @@
+"""
+Persistent queue of generation jobs (one SQLite file, `paths.job_queue`).
+
+The chat tools, the Chainlit "generate shot N" path and the CLI enqueue
+stage runs here instead of starting them; schedulers (tools/scheduler.py,
+in the app or as the scripts/job_scheduler.py daemon) lease and run them:
+
+    job_id, new = open_job_queue().enqueue("03_img_gen.py", ["SHOT_005"], priority=10)
+
+- Identical jobs (same script and shots) that are still pending or running
+  are merged: the caller gets the existing job, with the higher priority.
+  Shot arguments are compared as shot IDs, so "5", "SHOT_005" and "5-5"
+  are the same job.
+- Jobs are leased highest priority first. A scheduler heartbeats its lease
+  while the job runs; a job whose lease ran out (its scheduler died) goes
+  back to the queue.
+- A failed job is retried with exponential backoff up to `max_attempts`
+  times, then dead-lettered (status "dead") until `retry` is called.
+
+- `cancel` ends a pending or running job (status "cancelled"); the
+  scheduler running it loses its lease and stops the run.
+
+Statuses: pending -> running -> done | pending (retry) | dead | cancelled.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.shot_store import parse_shot_range
+from utils.sqlite_db import SQLiteDB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    script TEXT NOT NULL,
+    args TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status);
+"""
+
+ACTIVE = ("pending", "running")
+FINISHED = ("done", "dead", "cancelled")
+JSON_FIELDS = ("args", "progress", "result")
+
+
+def dedupe_key(script: str, args: List[str]) -> str:
+    """
+    Identity of a job: its flags plus the sorted shot IDs its range arguments
+    select ("all", or no range at all, select every shot).
+    """
+    flags = sorted(a for a in args if a.startswith("-"))
+    ranges = [a for a in args if not a.startswith("-")]
+    if not ranges or any(a.strip().lower() == "all" for a in ranges):
+        shots = ["all"]
+    else:
+        shots = sorted({sid for a in ranges for sid in parse_shot_range(a)})
+    return json.dumps([script, flags, shots])
+
+
+def worker_id() -> str:
+    """Lease owner name of the calling thread (host, process and thread)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    def __init__(self, db_path: str, max_attempts: int = 3, retry_delay: float = 30.0):
+        self.db = SQLiteDB(db_path, SCHEMA)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    @staticmethod
+    def _job(row) -> Dict[str, Any]:
+        job = dict(zip(row.keys(), row))
+        for field in JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def _conn(self):
+        conn = self.db.conn()
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, script: str, args: Optional[List[str]] = None, priority: int = 0,
+                max_attempts: Optional[int] = None) -> Tuple[int, bool]:
+        """
+        Adds a job, or returns the identical job that is already pending / running.
+        Returns (job id, True if a new job was created).
+        """
+        args = [str(a) for a in (args or [])]
+        key = dedupe_key(script, args)
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                f"SELECT id, priority FROM jobs WHERE dedupe_key = ? AND status IN {ACTIVE} ORDER BY id LIMIT 1",
+                (key,),
+            ).fetchone()
+            if row:
+                if priority > row[1]:
+                    conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, row[0]))
+                return row[0], False
+            cursor = conn.execute(
+                "INSERT INTO jobs (script, args, dedupe_key, priority, status, max_attempts, created_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+                (script, json.dumps(args), key, priority, max_attempts or self.max_attempts, time.time()),
+            )
+            return cursor.lastrowid, True
+
+    def _release_expired(self, conn, now: float) -> None:
+        # a lease that ran out means its scheduler died mid-job: that attempt failed
+        for job_id, attempts, max_attempts in conn.execute(
+            "SELECT id, attempts, max_attempts FROM jobs WHERE status = 'running' AND lease_until < ?", (now,)
+        ).fetchall():
+            self._finish_attempt(conn, job_id, attempts, max_attempts, "Lease expired (scheduler stopped)", now)
+
+    def _finish_attempt(self, conn, job_id: int, attempts: int, max_attempts: int, error: str, now: float) -> str:
+        if attempts >= max_attempts:
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', error = ?, lease_owner = NULL, lease_until = NULL, "
+                "finished_at = ? WHERE id = ?", (error, now, job_id))
+            return "dead"
+        conn.execute(
+            "UPDATE jobs SET status = 'pending', error = ?, lease_owner = NULL, lease_until = NULL, "
+            "not_before = ? WHERE id = ?", (error, now + self.retry_delay * 2 ** (attempts - 1), job_id))
+        return "pending"
+
+    def lease(self, owner: str, lease_seconds: float = 120.0,
+              scripts: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Takes the next ready job (highest priority, then oldest), or None when there is none."""
+        now = time.time()
+        where, params = "status = 'pending' AND not_before <= ?", [now]
+        if scripts:
+            where += f" AND script IN ({', '.join('?' for _ in scripts)})"
+            params += list(scripts)
+        with self.db.transaction() as conn:
+            self._release_expired(conn, now)
+            row = conn.execute(f"SELECT id FROM jobs WHERE {where} ORDER BY priority DESC, id LIMIT 1",
+                               params).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_until = ?, "
+                "started_at = ?, progress = NULL WHERE id = ?", (owner, now + lease_seconds, now, row[0]))
+        return self.get(row[0])
+
+    def heartbeat(self, job_id: int, owner: str, lease_seconds: float = 120.0,
+                  progress: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Extends the lease (and stores the job's latest progress). False when the
+        lease is no longer ours - it expired and the job was handed back.
+        """
+        sets, params = "lease_until = ?", [time.time() + lease_seconds]
+        if progress is not None:
+            sets += ", progress = ?"
+            params.append(json.dumps(progress, ensure_ascii=False))
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {sets} WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                params + [job_id, owner])
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, owner: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, lease_until = NULL, "
+                "finished_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, owner))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, owner: str, error: str, result: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        Ends a failed attempt: back to "pending" (after the backoff) while attempts
+        remain, else "dead". Returns the new status, or None if the lease was lost.
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (job_id, owner)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET result = ? WHERE id = ?", (json.dumps(result, ensure_ascii=False), job_id))
+            return self._finish_attempt(conn, job_id, row[0], row[1], error, now)
+
+    def cancel(self, job_id: int) -> bool:
+        """Ends a pending or running job; its scheduler's next heartbeat fails and the run is stopped."""
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = 'cancelled', lease_owner = NULL, lease_until = NULL, finished_at = ? "
+                f"WHERE id = ? AND status IN {ACTIVE}", (time.time(), job_id))
+            return cursor.rowcount == 1
+
+    def retry(self, job_id: int) -> bool:
+        """Puts a dead-lettered job back in the queue with a fresh set of attempts."""
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0, finished_at = NULL "
+                "WHERE id = ? AND status = 'dead'", (job_id,))
+            return cursor.rowcount == 1
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def jobs(self, status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """The latest jobs, newest first (optionally in one status)."""
+        where, params = ("WHERE status = ?", [status]) if status else ("", [])
+        rows = self._conn().execute(f"SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ?", params + [limit])
+        return [self._job(row) for row in rows.fetchall()]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.db.conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+_shared: Dict[str, JobQueue] = {}
+_shared_lock = threading.Lock()
+
+
+def open_job_queue(config: Optional[Dict[str, Any]] = None) -> JobQueue:
+    """Queue configured by `paths.job_queue` and `jobs` in config.yaml (one instance per db file)."""
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+        settings = get_config("jobs", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+        settings = config.get("jobs", {}) or {}
+    db_path = paths.get("job_queue", "production/job_queue.db")
+    with _shared_lock:
+        if db_path not in _shared:
+            _shared[db_path] = JobQueue(
+                db_path,
+                max_attempts=int(settings.get("max_attempts", 3)),
+                retry_delay=float(settings.get("retry_delay_seconds", 30)),
+            )
+        return _shared[db_path]
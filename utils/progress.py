@@ -0,0 +1,66 @@
+"""
+Machine-readable progress events from the stage scripts.
+
+A stage prints one marked JSON line per event next to its human output:
+
+    @@progress {"event": "queued", "shot_id": "SHOT_004", "position": 3}
+
+The wrapper (tools/wrapper.py) turns these lines into events while the script
+runs, for the Chainlit steps and the SSE endpoint. Events are only printed
+when the script runs under the wrapper (PIPELINE_PROGRESS=1), so a terminal
+run stays readable.
+
+Events: shot_started, submitted, queued, in_progress, downloaded, cached,
+failed (each with shot_id, plus path / position / request_id / error).
+
+Every stage also reports one `shot_result` record per shot it handled (see
+`result` below); the wrapper returns these parsed in result["results"], so
+callers read exact ids, statuses and paths instead of the log.
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+PREFIX = "@@progress "
+ENV_FLAG = "PIPELINE_PROGRESS"
+
+
+def enabled() -> bool:
+    return os.environ.get(ENV_FLAG) == "1"
+
+
+def emit(event: str, **fields: Any) -> None:
+    if enabled():
+        line = PREFIX + json.dumps({"event": event, **fields}, ensure_ascii=False)
+        # one write per event, so lines of threads printing at the same time do not interleave
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def parse(line: str) -> Optional[Dict[str, Any]]:
+    """The event of a marked line, or None for ordinary output."""
+    if not line.startswith(PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PREFIX):])
+    except ValueError:
+        return None
+
+
+def result(stage: str, shot_id: str, status: str, path: Optional[str] = None, error: Optional[str] = None,
+           timings: Optional[Dict[str, float]] = None, **fields: Any) -> None:
+    """
+    The outcome of one shot in a stage: its new status (IMAGE_READY, APPROVED, ERROR, ...),
+    the file it produced, how long it took (seconds, rounded) and the error if it failed.
+    """
+    emit("shot_result", stage=stage, shot_id=shot_id, status=status, path=path, error=error,
+         timings={k: round(v, 2) for k, v in (timings or {}).items()}, **fields)
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Shot count per status, e.g. {"IMAGE_READY": 4, "ERROR": 1}."""
+    counts: Dict[str, int] = {}
+    for record in results:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    return counts
@@ -0,0 +1,140 @@
+"""
+Cross-process token buckets for the provider quotas (requests and tokens per minute).
+
+The stage scripts, the Chainlit app and the FastAPI server can all run at
+once against the same account. Their calls draw from shared buckets in one
+SQLite file (`paths.rate_limits`), keyed by provider and model, so together
+they stay under the account's RPM / TPM:
+
+    reservation = open_rate_limiter().acquire("anthropic", MODEL_NAME, tokens=estimate)
+    response = client.messages.create(...)
+    reservation.settle(actual_tokens)
+
+`acquire` blocks until both buckets hold enough (one request, `tokens`
+tokens) and takes them in one transaction. Token counts are estimated before
+the call; `settle` corrects the TPM bucket with the real usage afterwards
+(overruns become debt that later calls wait out). Each bucket holds one
+minute of quota and refills continuously. Limits come from `rate_limits` in
+config.yaml, per provider with per-model overrides; a provider without
+limits is not throttled.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.sqlite_db import SQLiteDB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def estimate_tokens(*texts: Any) -> int:
+    """Rough token count of request text (~4 characters per token)."""
+    return sum(len(str(t)) for t in texts if t) // 4
+
+
+class Reservation:
+    def __init__(self, limiter: "RateLimiter", key: str, tpm: Optional[float], tokens: int, waited: float):
+        self.limiter = limiter
+        self.key = key
+        self.tpm = tpm
+        self.tokens = tokens
+        self.waited = waited
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        """Corrects the TPM bucket by the difference between the estimate and the real usage."""
+        if self.tpm and actual_tokens is not None and actual_tokens != self.tokens:
+            self.limiter._adjust(f"{self.key}:tpm", self.tpm, self.tokens - actual_tokens)
+
+
+class RateLimiter:
+    def __init__(self, db_path: str, limits: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.db = SQLiteDB(db_path, SCHEMA)
+        self.limits = limits or {}
+
+    def _limits(self, provider: str, model: str) -> Dict[str, Any]:
+        own = dict(self.limits.get(provider) or {})
+        models = own.pop("models", None) or {}
+        return {**own, **(models.get(model) or {})}
+
+    @staticmethod
+    def _level(conn, key: str, per_minute: float, now: float) -> float:
+        row = conn.execute("SELECT level, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return per_minute
+        level, updated_at = row
+        return min(per_minute, level + max(0.0, now - updated_at) * per_minute / 60.0)
+
+    def _try(self, key: str, rpm: Optional[float], tpm: Optional[float], tokens: int) -> float:
+        """Takes one request and `tokens` tokens if both buckets hold them; else returns the seconds to wait."""
+        now = time.time()
+        with self.db.transaction() as conn:
+            wanted = []
+            if rpm:
+                wanted.append((f"{key}:rpm", rpm, 1))
+            if tpm:
+                wanted.append((f"{key}:tpm", tpm, min(tokens, tpm)))  # a call larger than the bucket waits for a full one
+            levels = [self._level(conn, k, per_minute, now) for k, per_minute, _ in wanted]
+            wait = max([(need - level) * 60.0 / per_minute
+                        for (_, per_minute, need), level in zip(wanted, levels) if level < need] or [0.0])
+            if wait > 0:
+                return wait
+            for (k, _, need), level in zip(wanted, levels):
+                conn.execute("INSERT OR REPLACE INTO buckets (key, level, updated_at) VALUES (?, ?, ?)",
+                             (k, level - need, now))
+        return 0.0
+
+    def _adjust(self, key: str, per_minute: float, delta: float) -> None:
+        now = time.time()
+        with self.db.transaction() as conn:
+            level = self._level(conn, key, per_minute, now)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, level, updated_at) VALUES (?, ?, ?)",
+                         (key, min(per_minute, level + delta), now))
+
+    def acquire(self, provider: str, model: str, tokens: int = 0) -> Reservation:
+        limits = self._limits(provider, model)
+        key = f"{provider}/{model}"
+        waited = 0.0
+        while True:
+            wait = self._try(key, limits.get("rpm"), limits.get("tpm"), tokens)
+            if not wait:
+                return Reservation(self, key, limits.get("tpm"), tokens, waited)
+            time.sleep(min(wait, 5.0))  # re-check: settle() of other calls may return tokens
+            waited += min(wait, 5.0)
+
+    async def acquire_async(self, provider: str, model: str, tokens: int = 0) -> Reservation:
+        limits = self._limits(provider, model)
+        key = f"{provider}/{model}"
+        waited = 0.0
+        while True:
+            wait = await asyncio.to_thread(self._try, key, limits.get("rpm"), limits.get("tpm"), tokens)
+            if not wait:
+                return Reservation(self, key, limits.get("tpm"), tokens, waited)
+            await asyncio.sleep(min(wait, 5.0))
+            waited += min(wait, 5.0)
+
+
+_shared: Dict[str, RateLimiter] = {}
+_shared_lock = threading.Lock()
+
+
+def open_rate_limiter(config: Optional[Dict[str, Any]] = None) -> RateLimiter:
+    """Limiter configured by `paths.rate_limits` and `rate_limits` in config.yaml (one instance per db file)."""
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+        limits = get_config("rate_limits", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+        limits = config.get("rate_limits", {}) or {}
+    db_path = paths.get("rate_limits", "production/rate_limits.db")
+    with _shared_lock:
+        if db_path not in _shared:
+            _shared[db_path] = RateLimiter(db_path, limits)
+        return _shared[db_path]
@@ -0,0 +1,170 @@
+"""
+Disk-backed cache of LLM text responses (Claude and Gemini).
+
+The key is a hash of (provider, model, system prompt, user prompt,
+temperature, max_tokens), so rerunning a stage after a partial failure only
+pays for the shots whose inputs changed. Caching is opt-in per call site
+(`get_claude_response(..., cache=True)`, `cached_response(...)`).
+
+Eviction is per provider: each provider gets its own TTL and entry budget
+(`cache.responses` in config.yaml, with optional per-provider overrides),
+and within a provider the least recently used entries go first.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils.generation_cache import cache_key
+from utils.sqlite_db import SQLiteDB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_provider_last_used ON responses(provider, last_used);
+"""
+
+
+def response_key(provider: str, model: str, system_prompt: str, user_prompt: str,
+                 temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> str:
+    return cache_key({
+        "provider": provider,
+        "model": model,
+        "system": system_prompt,
+        "user": user_prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    })
+
+
+class ResponseCache:
+    def __init__(self, db_path: str, limits: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        `limits` maps provider -> {"ttl_days", "max_entries"}; the "default"
+        entry applies to providers without their own.
+        """
+        self.db = SQLiteDB(db_path, SCHEMA)
+        self.limits = limits or {}
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, provider: str, outcome: str) -> None:
+        with self._stats_lock:
+            counts = self.stats.setdefault(provider, {"hits": 0, "misses": 0})
+            counts[outcome] += 1
+
+    def _limit(self, provider: str, name: str) -> Optional[float]:
+        own = self.limits.get(provider) or {}
+        return own.get(name, (self.limits.get("default") or {}).get(name))
+
+    def get(self, key: str, provider: str) -> Optional[str]:
+        conn = self.db.conn()
+        row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        ttl_days = self._limit(provider, "ttl_days")
+        if row and ttl_days and row[1] < time.time() - ttl_days * 86400:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self._count(provider, "misses")
+            return None
+        conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._count(provider, "hits")
+        return row[0]
+
+    def put(self, key: str, provider: str, model: str, response: str) -> None:
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, now, now),
+            )
+
+    def evict(self) -> int:
+        """Applies each provider's TTL, then trims it to its max_entries (LRU). Returns removed rows."""
+        removed = 0
+        with self.db.transaction() as conn:
+            providers = [r[0] for r in conn.execute("SELECT DISTINCT provider FROM responses")]
+            for provider in providers:
+                ttl_days = self._limit(provider, "ttl_days")
+                if ttl_days:
+                    removed += conn.execute(
+                        "DELETE FROM responses WHERE provider = ? AND created_at < ?",
+                        (provider, time.time() - ttl_days * 86400),
+                    ).rowcount
+                max_entries = self._limit(provider, "max_entries")
+                if max_entries:
+                    removed += conn.execute(
+                        """DELETE FROM responses WHERE provider = ? AND key NOT IN (
+                               SELECT key FROM responses WHERE provider = ? ORDER BY last_used DESC LIMIT ?)""",
+                        (provider, provider, int(max_entries)),
+                    ).rowcount
+        return removed
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.stats = {}
+
+    def summary(self) -> str:
+        with self._stats_lock:
+            parts = [f"{p}: {c['hits']} hits / {c['misses']} misses" for p, c in sorted(self.stats.items())]
+        return ", ".join(parts) or "no cached calls"
+
+
+_shared: Dict[str, ResponseCache] = {}
+_shared_lock = threading.Lock()
+
+
+def reset_stats() -> None:
+    """Zeroes the hit / miss counts of every open cache (the start of a new run in a warm worker)."""
+    with _shared_lock:
+        caches = list(_shared.values())
+    for cache in caches:
+        cache.reset_stats()
+
+
+def open_response_cache(config: Optional[Dict[str, Any]] = None) -> ResponseCache:
+    """
+    Response cache configured by `paths.response_cache` and `cache.responses`
+    (one instance per db file). Expired / excess entries are evicted on first open.
+    """
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+        cache = get_config("cache", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+        cache = config.get("cache", {}) or {}
+
+    db_path = paths.get("response_cache", "production/response_cache.db")
+    settings = dict(cache.get("responses") or {})
+    providers = settings.pop("providers", None) or {}
+    with _shared_lock:
+        if db_path not in _shared:
+            _shared[db_path] = ResponseCache(db_path, limits={"default": settings, **providers})
+            _shared[db_path].evict()
+        return _shared[db_path]
+
+
+def cached_response(
+    provider: str,
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    call: Callable[[], str],
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    config: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Returns the cached text for these inputs, or runs `call()` and stores its result."""
+    cache = open_response_cache(config)
+    key = response_key(provider, model, system_prompt, user_prompt, temperature, max_tokens)
+    text = cache.get(key, provider)
+    if text is None:
+        text = call()
+        cache.put(key, provider, model, text)
+    return text
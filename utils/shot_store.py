@@ -0,0 +1,542 @@
+"""
+Shot board storage.
+
+The board used to live only in assets/shots_board.json, and every stage script
+re-serialized the whole file for a single status change. ShotStore keeps one
+row per shot in a WAL-mode SQLite database, so reading or updating a shot only
+touches that shot. The JSON file stays the import/export format (and can still
+be used directly with `pipeline.shot_store: json`).
+
+Every write is also appended to a change log (`changes_since`), so readers
+that keep derived state, like utils/dep_index.py, only re-read the shots
+that changed.
+
+Every shot carries a revision token. Writers that read a shot, do slow work
+and then write back pass `expected_rev` (or use `update_if`/`mutate`), so a
+concurrent change made by another process raises ConflictError instead of
+being silently overwritten.
+
+Usage:
+    store = open_shot_store(config)
+    store.ids_by_status("APPROVED")
+    store.update("SHOT_001", {"stills.status": "IMAGE_READY"})
+    store.update_if("SHOT_001", {"stills.status": "APPROVED"}, {"stills.status": "IMAGE_READY"})
+
+CLI:
+    python -m utils.shot_store stats|import|export [json_path]
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.file_lock import FileLock
+from utils.sqlite_db import SQLiteDB
+
+DEFAULT_BOARD_PATH = "assets/shots_board.json"
+STAGES = ("stills", "video")
+MUTATE_ATTEMPTS = 20
+CHANGE_LOG_SIZE = 10000
+
+
+class ConflictError(Exception):
+    """Raised when a shot changed since the revision the caller read."""
+
+    def __init__(self, shot_id: str, expected_rev: Any, actual_rev: Any):
+        super().__init__(f"Shot {shot_id} changed concurrently (expected rev {expected_rev}, found {actual_rev})")
+        self.shot_id = shot_id
+        self.expected_rev = expected_rev
+        self.actual_rev = actual_rev
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shots (
+    shot_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    scene_ref TEXT,
+    stills_status TEXT,
+    video_status TEXT,
+    data TEXT NOT NULL,
+    rev INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_shots_stills_status ON shots(stills_status);
+CREATE INDEX IF NOT EXISTS idx_shots_video_status ON shots(video_status);
+CREATE INDEX IF NOT EXISTS idx_shots_scene_ref ON shots(scene_ref);
+
+CREATE TABLE IF NOT EXISTS shot_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    shot_id TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS shots_log_insert AFTER INSERT ON shots
+BEGIN INSERT INTO shot_changes (shot_id) VALUES (NEW.shot_id); END;
+CREATE TRIGGER IF NOT EXISTS shots_log_update AFTER UPDATE ON shots
+BEGIN INSERT INTO shot_changes (shot_id) VALUES (NEW.shot_id); END;
+CREATE TRIGGER IF NOT EXISTS shots_log_delete AFTER DELETE ON shots
+BEGIN INSERT INTO shot_changes (shot_id) VALUES (OLD.shot_id); END;
+CREATE TRIGGER IF NOT EXISTS shot_changes_trim AFTER INSERT ON shot_changes
+BEGIN DELETE FROM shot_changes WHERE seq <= NEW.seq - """ + str(CHANGE_LOG_SIZE) + """; END;
+"""
+
+
+def get_path(shot: Dict[str, Any], key_path: str, default: Any = None) -> Any:
+    """Reads a value from a shot using dot notation (e.g. 'stills.status')."""
+    value: Any = shot
+    try:
+        for k in key_path.split("."):
+            value = value[k]
+        return value
+    except (KeyError, TypeError):
+        return default
+
+
+def set_path(shot: Dict[str, Any], key_path: str, value: Any) -> None:
+    """Sets a value on a shot using dot notation, creating missing levels."""
+    keys = key_path.split(".")
+    target = shot
+    for k in keys[:-1]:
+        if not isinstance(target.get(k), dict):
+            target[k] = {}
+        target = target[k]
+    target[keys[-1]] = value
+
+
+def apply_changes(shot: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns a copy of `shot` with the dotted-path `changes` applied."""
+    updated = copy.deepcopy(shot)
+    for key_path, value in changes.items():
+        set_path(updated, key_path, value)
+    return updated
+
+
+def _status_column(stage: str) -> str:
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage '{stage}' (expected one of {STAGES})")
+    return f"{stage}_status"
+
+
+class ShotStore:
+    """
+    Common interface of the shot board backends.
+    Shots are plain dicts with the same layout as shots_board.json.
+    """
+
+    def get(self, shot_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_with_rev(shot_id)[0]
+
+    def get_with_rev(self, shot_id: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """Returns (shot, rev). The rev is opaque; pass it back as `expected_rev`."""
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, shot_id: str, shot: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def update_many(
+        self,
+        updates: Dict[str, Dict[str, Any]],
+        expected_revs: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Applies {shot_id: {dotted_path: value}} in one transaction.
+        Raises ConflictError (and writes nothing) if any shot listed in
+        `expected_revs` is no longer at that revision.
+        """
+        raise NotImplementedError
+
+    def replace_all(self, shots: Dict[str, Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def update(self, shot_id: str, changes: Dict[str, Any], expected_rev: Any = None) -> Dict[str, Any]:
+        """Applies dotted-path changes to a single shot and returns the new shot."""
+        expected = {shot_id: expected_rev} if expected_rev is not None else None
+        return self.update_many({shot_id: changes}, expected)[shot_id]
+
+    def mutate(
+        self,
+        shot_id: str,
+        fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+        attempts: int = MUTATE_ATTEMPTS,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Compare-and-swap loop: `fn` gets the current shot and returns the
+        dotted-path changes to apply (or None to leave the shot alone). If the
+        shot changes between the read and the write, `fn` runs again on the
+        fresh copy.
+        """
+        for _ in range(attempts):
+            shot, rev = self.get_with_rev(shot_id)
+            if shot is None:
+                raise KeyError(f"Shot {shot_id} not found")
+            changes = fn(copy.deepcopy(shot))
+            if changes is None:
+                return None
+            try:
+                return self.update(shot_id, changes, expected_rev=rev)
+            except ConflictError:
+                continue
+        raise ConflictError(shot_id, rev, "a newer revision on every retry")
+
+    def update_if(self, shot_id: str, expected: Dict[str, Any], changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Applies `changes` only while every dotted-path field in `expected`
+        still has the given value. Returns None when the precondition fails.
+        """
+        def check(shot):
+            if all(get_path(shot, k) == v for k, v in expected.items()):
+                return changes
+            return None
+        return self.mutate(shot_id, check)
+
+    def ids(self) -> List[str]:
+        return list(self.all().keys())
+
+    def ids_by_status(self, status: str, stage: str = "stills") -> List[str]:
+        return list(self.by_status(status, stage).keys())
+
+    def by_status(self, status: str, stage: str = "stills") -> Dict[str, Dict[str, Any]]:
+        _status_column(stage)
+        return {sid: s for sid, s in self.all().items() if get_path(s, f"{stage}.status") == status}
+
+    def by_scene(self, scene_ref: str) -> Dict[str, Dict[str, Any]]:
+        return {sid: s for sid, s in self.all().items() if s.get("scene_ref") == scene_ref}
+
+    def status_counts(self, stage: str = "stills") -> Dict[str, int]:
+        _status_column(stage)
+        counts: Dict[str, int] = {}
+        for shot in self.all().values():
+            status = get_path(shot, f"{stage}.status", "UNKNOWN")
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def changes_since(self, cursor: Any = None) -> Tuple[Any, Optional[List[str]]]:
+        """
+        Returns (new_cursor, ids of shots written since `cursor`). The id list
+        is None when the backend cannot tell (first call, log trimmed, JSON
+        board rewritten): the caller re-reads everything.
+        """
+        return object(), None
+
+    def import_json(self, path: str) -> int:
+        """Replaces the store content with a shots_board.json file."""
+        with open(path, "r", encoding="utf-8") as f:
+            shots = json.load(f)
+        self.replace_all(shots)
+        return len(shots)
+
+    def export_json(self, path: str) -> int:
+        """Writes the store content as a shots_board.json file."""
+        shots = self.all()
+        _atomic_write_json(path, shots)
+        return len(shots)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteShotStore(ShotStore):
+    """
+    One row per shot; the full shot is kept as JSON in `data` and the fields we
+    query on (status per stage, scene) are mirrored into indexed columns.
+    Each thread gets its own connection, so ThreadPoolExecutor workers can read
+    while another thread writes (WAL mode).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.db = SQLiteDB(db_path, SCHEMA)
+        self._migrate(self.db.conn())
+
+    def _conn(self) -> sqlite3.Connection:
+        return self.db.conn()
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(shots)")}
+        if "rev" not in columns:
+            conn.execute("ALTER TABLE shots ADD COLUMN rev INTEGER NOT NULL DEFAULT 1")
+
+    @staticmethod
+    def _row_values(shot_id: str, shot: Dict[str, Any]):
+        return (
+            shot.get("scene_ref"),
+            get_path(shot, "stills.status"),
+            get_path(shot, "video.status"),
+            json.dumps(shot, ensure_ascii=False),
+            shot_id,
+        )
+
+    def is_empty(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM shots LIMIT 1").fetchone() is None
+
+    def get_with_rev(self, shot_id: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+        row = self._conn().execute("SELECT data, rev FROM shots WHERE shot_id = ?", (shot_id,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def _select(self, where: str = "", params: Iterable[Any] = ()) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute(f"SELECT shot_id, data FROM shots {where} ORDER BY position", tuple(params))
+        return {sid: json.loads(data) for sid, data in rows}
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return self._select()
+
+    def ids(self) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT shot_id FROM shots ORDER BY position")]
+
+    def ids_by_status(self, status: str, stage: str = "stills") -> List[str]:
+        col = _status_column(stage)
+        rows = self._conn().execute(f"SELECT shot_id FROM shots WHERE {col} = ? ORDER BY position", (status,))
+        return [r[0] for r in rows]
+
+    def by_status(self, status: str, stage: str = "stills") -> Dict[str, Dict[str, Any]]:
+        return self._select(f"WHERE {_status_column(stage)} = ?", (status,))
+
+    def by_scene(self, scene_ref: str) -> Dict[str, Dict[str, Any]]:
+        return self._select("WHERE scene_ref = ?", (scene_ref,))
+
+    def status_counts(self, stage: str = "stills") -> Dict[str, int]:
+        col = _status_column(stage)
+        rows = self._conn().execute(f"SELECT COALESCE({col}, 'UNKNOWN'), COUNT(*) FROM shots GROUP BY 1")
+        return {status: count for status, count in rows}
+
+    def changes_since(self, cursor: Any = None) -> Tuple[Any, Optional[List[str]]]:
+        conn = self._conn()
+        oldest, latest = conn.execute("SELECT MIN(seq), MAX(seq) FROM shot_changes").fetchone()
+        latest = latest or 0
+        if cursor is None or cursor > latest or (oldest is not None and cursor < oldest - 1):
+            return latest, None
+        rows = conn.execute("SELECT DISTINCT shot_id FROM shot_changes WHERE seq > ? AND seq <= ?", (cursor, latest))
+        return latest, [r[0] for r in rows]
+
+    def _write(self, conn: sqlite3.Connection, shot_id: str, shot: Dict[str, Any]) -> None:
+        cur = conn.execute(
+            "UPDATE shots SET scene_ref = ?, stills_status = ?, video_status = ?, data = ?, rev = rev + 1 WHERE shot_id = ?",
+            self._row_values(shot_id, shot),
+        )
+        if cur.rowcount == 0:
+            position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM shots").fetchone()[0]
+            conn.execute(
+                "INSERT INTO shots (scene_ref, stills_status, video_status, data, shot_id, position) VALUES (?, ?, ?, ?, ?, ?)",
+                self._row_values(shot_id, shot) + (position,),
+            )
+
+    def put(self, shot_id: str, shot: Dict[str, Any]) -> None:
+        with self.db.transaction() as conn:
+            self._write(conn, shot_id, shot)
+
+    def update_many(
+        self,
+        updates: Dict[str, Dict[str, Any]],
+        expected_revs: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        expected_revs = expected_revs or {}
+        results = {}
+        # The transaction takes the write lock up front (BEGIN IMMEDIATE), so
+        # the rev check and the write below cannot interleave with another writer.
+        with self.db.transaction() as conn:
+            for shot_id, changes in updates.items():
+                row = conn.execute("SELECT data, rev FROM shots WHERE shot_id = ?", (shot_id,)).fetchone()
+                if row is None:
+                    raise KeyError(f"Shot {shot_id} not found")
+                if shot_id in expected_revs and expected_revs[shot_id] != row[1]:
+                    raise ConflictError(shot_id, expected_revs[shot_id], row[1])
+                shot = apply_changes(json.loads(row[0]), changes)
+                self._write(conn, shot_id, shot)
+                results[shot_id] = shot
+        return results
+
+    def replace_all(self, shots: Dict[str, Dict[str, Any]]) -> None:
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM shots")
+            for position, (shot_id, shot) in enumerate(shots.items(), start=1):
+                conn.execute(
+                    "INSERT INTO shots (scene_ref, stills_status, video_status, data, shot_id, position) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._row_values(shot_id, shot) + (position,),
+                )
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class JsonShotStore(ShotStore):
+    """
+    The original shots_board.json layout. Every write rewrites the file, so this
+    backend is kept for compatibility and small boards only.
+
+    Writers hold a cross-process lock on `<board>.lock` for the whole
+    read-modify-write; readers rely on the atomic rename and take no lock.
+    The revision of a shot is a hash of its content (an ETag), so the file
+    format is unchanged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write_lock(self) -> FileLock:
+        return FileLock(f"{self.path}.lock")
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_with_rev(self, shot_id: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+        shot = self._load().get(shot_id)
+        return (shot, shot_etag(shot)) if shot is not None else (None, None)
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return self._load()
+
+    def put(self, shot_id: str, shot: Dict[str, Any]) -> None:
+        with self._lock, self._write_lock():
+            shots = self._load()
+            shots[shot_id] = shot
+            _atomic_write_json(self.path, shots)
+
+    def update_many(
+        self,
+        updates: Dict[str, Dict[str, Any]],
+        expected_revs: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        expected_revs = expected_revs or {}
+        with self._lock, self._write_lock():
+            shots = self._load()
+            results = {}
+            for shot_id, changes in updates.items():
+                if shot_id not in shots:
+                    raise KeyError(f"Shot {shot_id} not found")
+                if shot_id in expected_revs:
+                    actual = shot_etag(shots[shot_id])
+                    if expected_revs[shot_id] != actual:
+                        raise ConflictError(shot_id, expected_revs[shot_id], actual)
+                shots[shot_id] = apply_changes(shots[shot_id], changes)
+                results[shot_id] = shots[shot_id]
+            _atomic_write_json(self.path, shots)
+            return results
+
+    def replace_all(self, shots: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock, self._write_lock():
+            _atomic_write_json(self.path, shots)
+
+    def changes_since(self, cursor: Any = None) -> Tuple[Any, Optional[List[str]]]:
+        # the file is rewritten as a whole - any change means "re-read everything"
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        return signature, ([] if cursor is not None and cursor == signature else None)
+
+    def import_json(self, path: str) -> int:
+        if os.path.abspath(path) == os.path.abspath(self.path):
+            return len(self._load())
+        return super().import_json(path)
+
+
+def shot_etag(shot: Dict[str, Any]) -> str:
+    """Content hash of a shot, used as its revision by the JSON backend."""
+    canonical = json.dumps(shot, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _atomic_write_json(path: str, data: Any) -> None:
+    """Writes JSON to a temp file next to `path` and renames it into place."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def parse_shot_range(user_input: str) -> List[str]:
+    """
+    Shot IDs of a range as typed by a user or the chat: "1-5", "SHOT_003",
+    "7" -> ["SHOT_001", ...]. A malformed range gives [].
+    """
+    target_ids = []
+    user_input = user_input.strip().upper()
+    if "-" in user_input:
+        try:
+            start_str, end_str = user_input.split("-")
+            start_num = int(re.search(r'\d+', start_str).group())
+            end_num = int(re.search(r'\d+', end_str).group())
+            for i in range(start_num, end_num + 1):
+                target_ids.append(f"SHOT_{i:03d}")
+        except (ValueError, AttributeError):
+            return []
+    else:
+        try:
+            num = int(re.search(r'\d+', user_input).group())
+            target_ids.append(f"SHOT_{num:03d}")
+        except AttributeError:
+            target_ids.append(user_input)
+    return target_ids
+
+
+def _default_db_path(board_path: str) -> str:
+    return os.path.splitext(board_path)[0] + ".db"
+
+
+def open_shot_store(config: Optional[Dict[str, Any]] = None) -> ShotStore:
+    """
+    Opens the shot board configured in config.yaml.
+
+    `config` is the dict the scripts already load from config.yaml; when omitted
+    the shared config loader is used. A new SQLite store is seeded from
+    shots_board.json the first time it is opened.
+    """
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+        pipeline = get_config("pipeline", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+        pipeline = config.get("pipeline", {}) or {}
+
+    board_path = paths.get("shots_board", DEFAULT_BOARD_PATH)
+    backend = pipeline.get("shot_store", "sqlite")
+
+    if backend == "json":
+        return JsonShotStore(board_path)
+    if backend != "sqlite":
+        raise ValueError(f"Unknown shot store backend: {backend}")
+
+    store = SQLiteShotStore(paths.get("shots_db", _default_db_path(board_path)))
+    if store.is_empty() and os.path.exists(board_path):
+        store.import_json(board_path)
+    return store
+
+
+def main(argv: List[str]) -> int:
+    import yaml
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    command = argv[0] if argv else "stats"
+    json_path = argv[1] if len(argv) > 1 else config["paths"]["shots_board"]
+    store = open_shot_store(config)
+
+    if command == "export":
+        print(f"✅ Exported {store.export_json(json_path)} shots to {json_path}")
+    elif command == "import":
+        print(f"✅ Imported {store.import_json(json_path)} shots from {json_path}")
+    elif command == "stats":
+        for stage in STAGES:
+            print(f"{stage}: {store.status_counts(stage)}")
+    else:
+        print("Usage: python -m utils.shot_store [stats|import|export] [json_path]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
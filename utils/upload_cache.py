@@ -0,0 +1,171 @@
+"""
+Upload-dedupe cache for fal_client.upload_file.
+
+Files are keyed by the sha256 of their content, so the same bytes (a LoRA,
+the face reference, a shot image) are uploaded once and the returned URL is
+reused until it expires. Uploads are made with an explicit expiry
+(`cache.uploads.ttl_days`), so the stored `expires_at` is the real one, and a
+URL is only reused while it has `min_remaining_hours` left, enough for queued
+fal jobs to fetch it.
+
+Hashing a multi-hundred-MB LoRA on every run would cost more than it saves,
+so hashes are memoized per (path, size, mtime). Concurrent callers of the
+same content share one upload: threads wait on an in-process future, other
+processes on a per-hash file lock.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from utils.downloader import file_sha256
+from utils.file_lock import FileLock
+from utils.sqlite_db import SQLiteDB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256 TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+def _fal_upload(path: str, ttl_seconds: int) -> str:
+    import fal_client
+
+    return fal_client.upload_file(path, lifecycle=fal_client.StorageSettings(expires_in=ttl_seconds))
+
+
+class UploadCache:
+    def __init__(
+        self,
+        db_path: str,
+        ttl_seconds: int = 7 * 86400,
+        min_remaining_seconds: int = 6 * 3600,
+        upload_fn: Optional[Callable[[str, int], str]] = None,
+    ):
+        self.db = SQLiteDB(db_path, SCHEMA)
+        self.lock_dir = f"{db_path}.locks"
+        self.ttl_seconds = ttl_seconds
+        self.min_remaining_seconds = min_remaining_seconds
+        self.upload_fn = upload_fn or _fal_upload
+        self.hits = 0
+        self.uploads = 0
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    def content_hash(self, path: str) -> str:
+        """sha256 of the file, recomputed only when its size or mtime changed."""
+        abs_path = os.path.abspath(path)
+        st = os.stat(abs_path)
+        row = self.db.conn().execute(
+            "SELECT sha256 FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (abs_path, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            return row[0]
+        sha256 = file_sha256(abs_path)
+        self.db.conn().execute(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (abs_path, st.st_size, st.st_mtime_ns, sha256),
+        )
+        return sha256
+
+    def lookup(self, sha256: str) -> Optional[str]:
+        """A cached URL that is still valid for at least `min_remaining_seconds`, or None."""
+        row = self.db.conn().execute(
+            "SELECT url FROM uploads WHERE sha256 = ? AND expires_at > ?",
+            (sha256, time.time() + self.min_remaining_seconds),
+        ).fetchone()
+        return row[0] if row else None
+
+    def upload(self, path: str) -> str:
+        """Returns a fal URL for `path`, uploading only if no valid URL for its content exists."""
+        sha256 = self.content_hash(path)
+        url = self.lookup(sha256)
+        if url:
+            self.hits += 1
+            return url
+
+        with self._inflight_lock:
+            future = self._inflight.get(sha256)
+            owner = future is None
+            if owner:
+                future = self._inflight[sha256] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            url = self._upload_locked(path, sha256)
+            future.set_result(url)
+            return url
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[sha256]
+
+    def _upload_locked(self, path: str, sha256: str) -> str:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        # another process may be uploading the same bytes right now
+        with FileLock(os.path.join(self.lock_dir, f"{sha256}.lock"), timeout=3600):
+            url = self.lookup(sha256)
+            if url:
+                self.hits += 1
+                return url
+            url = self.upload_fn(path, self.ttl_seconds)
+            now = time.time()
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO uploads (sha256, url, size, uploaded_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (sha256, url, os.path.getsize(path), now, now + self.ttl_seconds),
+                )
+            self.uploads += 1
+            return url
+
+    def prune(self) -> int:
+        """Drops expired URLs. Returns the number of removed rows."""
+        with self.db.transaction() as conn:
+            return conn.execute("DELETE FROM uploads WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+_shared: Dict[str, UploadCache] = {}
+_shared_lock = threading.Lock()
+
+
+def open_upload_cache(config: Optional[Dict[str, Any]] = None) -> UploadCache:
+    """Upload cache configured by `paths.upload_cache` and `cache.uploads` (one instance per db file)."""
+    if config is None:
+        from utils.config_loader import get_config
+        paths = get_config("paths", {}) or {}
+        cache = get_config("cache", {}) or {}
+    else:
+        paths = config.get("paths", {}) or {}
+        cache = config.get("cache", {}) or {}
+
+    db_path = paths.get("upload_cache", "production/upload_cache.db")
+    settings = cache.get("uploads") or {}
+    with _shared_lock:
+        if db_path not in _shared:
+            _shared[db_path] = UploadCache(
+                db_path,
+                ttl_seconds=int(settings.get("ttl_days", 7) * 86400),
+                min_remaining_seconds=int(settings.get("min_remaining_hours", 6) * 3600),
+            )
+        return _shared[db_path]
+
+
+def cached_upload(path: str, config: Optional[Dict[str, Any]] = None) -> str:
+    """Drop-in replacement for fal_client.upload_file(path)."""
+    return open_upload_cache(config).upload(path)